@@ -0,0 +1,174 @@
+"""
+Async reads of file databases over aiosqlite.
+
+With `ASYNC_DB=1`, the hottest read endpoints are served by async handlers
+reading through `get_async_db` rather than by sync handlers on the thread
+pool, so requests waiting on the database do not hold a thread of the pool.
+Writes keep going through `get_db` and the thread pool, since they take the
+locks of `app.crud` and SQLite has a single writer anyway.
+
+SQLAlchemy 1.3 has no asyncio support, so queries are built as for the sync
+sessions, compiled with the SQLite dialect and run on aiosqlite
+connections, which each run on a thread of their own.
+"""
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+from .database import DB_CACHE_SIZE
+from .database import DB_MMAP_SIZE
+from .database import IN_MEMORY
+from .database import engines
+from .database import request_slots
+from .database import shard_of
+
+
+ASYNC_DB = os.environ.get('ASYNC_DB', '0') == '1'
+
+if ASYNC_DB and IN_MEMORY:
+    raise RuntimeError('ASYNC_DB needs a file DATABASE_URL.')
+
+# Idle connections of each shard. `request_slots` bounds the sessions open
+# at once, and each has at most one connection per shard. Their threads
+# would keep the process alive, so `close_idle` closes them at shutdown.
+_idle = [[] for _ in engines]
+
+
+async def _connect(shard: int):
+    # Only needed with `ASYNC_DB`.
+    import aiosqlite
+
+    conn = await aiosqlite.connect(
+        engines[shard].url.database, isolation_level=None)
+    await conn.execute(f'pragma mmap_size={DB_MMAP_SIZE}')
+    await conn.execute(f'pragma cache_size={DB_CACHE_SIZE}')
+    return conn
+
+
+@lru_cache(maxsize=None)
+def _row_type(keys):
+    return namedtuple('Row', keys)
+
+
+def _compile(statement):
+    dialect = engines[0].dialect
+    compiled = statement.compile(dialect=dialect)
+    processors = {
+        name: bind.type.dialect_impl(dialect).bind_processor(dialect)
+        for bind, name in compiled.bind_names.items()
+    }
+    params = compiled.construct_params()
+    values = [
+        processors[name](params[name]) if processors[name] else params[name]
+        for name in compiled.positiontup
+    ]
+    return str(compiled), values
+
+
+async def fetch_all(conn, query):
+    """
+    Runs a query and returns its rows, as the sync sessions would.
+
+    Args:
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        query (Query or Select): The query, without a session.
+
+    Returns:
+        list: Named tuples with the keys and python values of the columns.
+    """
+    statement = getattr(query, 'statement', query)
+    columns = list(statement.inner_columns)
+    Row = _row_type(tuple(column.key for column in columns))
+    dialect = engines[0].dialect
+    processors = [
+        column.type.dialect_impl(dialect).result_processor(dialect, None)
+        for column in columns
+    ]
+    sql, values = _compile(statement)
+    async with conn.execute(sql, values) as cursor:
+        rows = await cursor.fetchall()
+    return [
+        Row(*(
+            processor(value) if processor else value
+            for processor, value in zip(processors, row)
+        ))
+        for row in rows
+    ]
+
+
+async def fetch_scalar(conn, query):
+    """
+    Runs a query and returns the first column of its first row.
+
+    Args:
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        query (Query or Select): The query, without a session.
+
+    Returns:
+        The value, or None if there are no rows.
+    """
+    rows = await fetch_all(conn, query)
+    return rows[0][0] if rows else None
+
+
+class AsyncShardedSession:
+    """
+    The aiosqlite connections of a request, one per shard, each taken on
+    first use.
+
+    Like the sessions of a `ShardedSession`, each connection reads within
+    a transaction, so every query of a request sees the same data.
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    async def shard(self, index: int):
+        """ Returns the connection of a shard. """
+        conn = self._connections.get(index)
+        if conn is None:
+            conn = _idle[index].pop() if _idle[index] else (
+                await _connect(index))
+            self._connections[index] = conn
+            await conn.execute('BEGIN')
+        return conn
+
+    async def for_doctor(self, doctor_id: int):
+        """ Returns the connection of the shard holding a doctor. """
+        return await self.shard(shard_of(doctor_id))
+
+    async def for_appointment(self, appointment_id: int):
+        """ Returns the connection of the shard holding an appointment. """
+        return await self.shard(shard_of(appointment_id))
+
+    async def close(self):
+        while self._connections:
+            index, conn = self._connections.popitem()
+            try:
+                await conn.execute('ROLLBACK')
+            except Exception:
+                # The connection is broken, open another one next time.
+                await conn.close()
+            else:
+                _idle[index].append(conn)
+
+
+async def close_idle():
+    """ Closes the idle connections of every shard, at shutdown. """
+    for idle in _idle:
+        while idle:
+            await idle.pop().close()
+
+
+# Dependency of the async handlers. Takes one of `request_slots`, like
+# `get_db` in file mode.
+async def get_async_db():
+    db = AsyncShardedSession()
+    await request_slots.acquire_async()
+    try:
+        yield db
+    finally:
+        try:
+            await db.close()
+        finally:
+            request_slots.release()
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+DOCTOR_CACHE_SIZE = int(os.environ.get('DOCTOR_CACHE_SIZE', 1024))
+DOCTOR_CACHE_TTL = float(os.environ.get('DOCTOR_CACHE_TTL', 60))
+
+
+class TTLCache:
+    """
+    Thread safe, size bounded LRU cache whose entries expire after a TTL.
+
+    Callers put the version of what they read in the key (see
+    `app.versions`), so an entry is never hit once a write is committed, by
+    this worker or any other, and ages out. `discard` and `clear` remove
+    entries early. Every invalidation bumps a generation, and `get_or_load`
+    only stores a loaded value if no invalidation happened while it was
+    loading.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the cached value of key, loading and storing it on a miss.
+
+        Args:
+            key (hashable): The cache key.
+            loader (callable): Called without arguments to load the value.
+
+        Returns:
+            object: The cached or loaded value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+
+        value = loader()
+
+        with self._lock:
+            if generation == self._generation:
+                self._data[key] = (now + self.ttl, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def discard(self, key):
+        """ Removes key from the cache, if present. """
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        """ Removes every entry from the cache. """
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: The size, hits, misses and evictions of the cache.
+        """
+        with self._lock:
+            return {
+                'size': len(self._data),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+doctor_cache = TTLCache(DOCTOR_CACHE_SIZE, DOCTOR_CACHE_TTL)
+doctor_list_cache = TTLCache(DOCTOR_CACHE_SIZE, DOCTOR_CACHE_TTL)
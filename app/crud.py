@@ -1,14 +1,49 @@
+import csv
+import io
+import json
 import logging
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import date
 from datetime import datetime
+from datetime import timedelta
+from itertools import groupby
+from typing import List
 
 from fastapi import HTTPException
+import pytz
+from sqlalchemy import and_
 from sqlalchemy import exc
+from sqlalchemy import func
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
 from sqlalchemy.orm import Session
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
 
+from app import aio
+from app import events
 from app import models
 from app import schemas
-from .utils import utc_to_local
+from app import search
+from app import series
+from app import stats
+from app import versions
+from .cache import doctor_cache
+from .cache import doctor_list_cache
+from .database import IN_MEMORY
+from .locks import doctor_locks
+from .utils import APPOINTMENT_END_TIME
+from .utils import APPOINTMENT_START_TIME
+from .utils import MAX_APPOINTMENT_DURATION
+from .utils import NO_APPOINTMENT_WEEKDAY_CODE
+from .utils import clinic_window
+from .utils import decode_cursor
+from .utils import dumps_json
+from .utils import encode_cursor
+from .utils import to_utc_naive
+from .utils import utc_to_local_many
 
 
 logger = logging.getLogger(__name__)
@@ -34,18 +69,203 @@ def get_doctor(db: Session, doctor_id: int):
     return db_doctor
 
 
-def get_doctors(db: Session, skip: int = 0, limit: int = 100):
+async def get_doctor_json_async(conn, doctor_id: int):
     """
-    Return a list of `Doctor` objects.
+    Returns the same doctor as `get_cached_doctor`, read with an `aio`
+    connection and encoded as JSON.
+
+    Args:
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        doctor_id (int): PK of the doctor object.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found with
+            the given doctor_id.
+
+    Returns:
+        bytes: The JSON body.
+    """
+    rows = await aio.fetch_all(conn, Query([
+        models.Doctor.first_name,
+        models.Doctor.last_name,
+        models.Doctor.email,
+        models.Doctor.id,
+    ]).filter(models.Doctor.id == doctor_id))
+    if not rows:
+        raise HTTPException(status_code=404, detail='Doctor not found.')
+    return dumps_json(_doctor_to_dict(rows[0]))
+
+
+def _decode_cursor(cursor: str, *types):
+    try:
+        return decode_cursor(cursor, *types)
+    except ValueError:
+        raise HTTPException(status_code=422, detail='Invalid cursor.')
+
+
+def get_doctors(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: str = None
+):
+    """
+    Return a list of `Doctor` objects ordered by id.
 
     Args:
         skip (int, optional): Start of pagination. Defaults to 0.
         limit (int, optional): End of pagination. Defaults to 100.
+        after (str, optional): Cursor from `get_doctors_cursor`. When
+            given, the page starts right after the cursor instead of
+            skipping rows.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
 
     Returns:
         List[Doctor]: Returns a list of Doctor objects with the Doctor schema
     """
-    return db.query(models.Doctor).offset(skip).limit(limit).all()
+    db_doctors = db.query(models.Doctor).order_by(models.Doctor.id)
+
+    if after:
+        after_id, = _decode_cursor(after, int)
+        db_doctors = db_doctors.filter(models.Doctor.id > after_id)
+    else:
+        db_doctors = db_doctors.offset(skip)
+
+    return db_doctors.limit(limit).all()
+
+
+def get_doctors_by_ids(db: Session, ids):
+    """
+    Returns the doctors with the given ids, with one query.
+
+    Args:
+        ids (Collection[int]): PKs of the doctor objects.
+
+    Returns:
+        Dict[int, Doctor]: The doctors found, by id.
+    """
+    if not ids:
+        return {}
+    return {
+        db_doctor.id: db_doctor
+        for db_doctor in db.query(models.Doctor).filter(
+            models.Doctor.id.in_(ids))
+    }
+
+
+def get_cached_doctor(db: Session, doctor_id: int):
+    """
+    Return a `Doctor` schema, read through the doctor cache.
+
+    Entries are keyed by the version of the doctor, so a write committed by
+    any worker makes them miss.
+
+    Args:
+        doctor_id (int): PK of the doctor object.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found with
+            the given doctor_id.
+
+    Returns:
+        schemas.Doctor: The doctor.
+    """
+    version = versions.version(db, versions.doctor_scope(doctor_id))
+    return doctor_cache.get_or_load(
+        (doctor_id, version),
+        lambda: schemas.Doctor.from_orm(get_doctor(db, doctor_id))
+    )
+
+
+def get_cached_doctors(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    after: str = None
+):
+    """
+    Return a page of `Doctor` schemas, read through the doctor list cache.
+
+    Entries are keyed by the global version, so a write committed by any
+    worker makes them miss.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        after (str, optional): Cursor from `get_doctors_cursor`.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        List[schemas.Doctor]: The page of doctors.
+    """
+    version = versions.version(db, versions.GLOBAL_SCOPE)
+    return doctor_list_cache.get_or_load(
+        (version, skip, limit, after),
+        lambda: [
+            schemas.Doctor.from_orm(db_doctor)
+            for db_doctor in get_doctors(db, skip, limit, after)
+        ]
+    )
+
+
+def get_doctors_cursor(db_doctors, limit: int):
+    """
+    Returns the cursor of the page following the given doctors.
+
+    Args:
+        db_doctors (List[Doctor]): A page returned by `get_doctors`.
+        limit (int): The limit used to fetch the page.
+
+    Returns:
+        str: The cursor, or None if this is the last page.
+    """
+    if not db_doctors or len(db_doctors) < limit:
+        return None
+    return encode_cursor(db_doctors[-1].id)
+
+
+def _search(db: Session, model, fts_table: str, q: str, limit: int,
+            after: str = None, fetch=None):
+    # `fetch` returns the rows of some ids from a session, by default the
+    # instances of `model`.
+    query_words = search.words(q)
+    if not query_words:
+        raise HTTPException(status_code=422, detail='Search query is empty.')
+    position = _decode_cursor(after, int, int, int, int) if after else None
+
+    matches, next_position = search.search(
+        db, fts_table, query_words, limit, position)
+    ids = [id_ for id_, _ in matches]
+    fetch = fetch or (lambda session, ids: session.query(model).filter(
+        model.id.in_(ids)))
+    found = fetch(db, ids) if ids else []
+    by_id = {instance.id: instance for instance in found}
+    next_cursor = encode_cursor(*next_position) if next_position else None
+    return [by_id[id_] for id_ in ids if id_ in by_id], next_cursor
+
+
+def search_doctors(db: Session, q: str, limit: int = 20, after: str = None):
+    """
+    Returns the doctors whose names match a query, best match first.
+
+    Args:
+        q (str): Words matching the start of a first or last name.
+        limit (int, optional): Maximum number of doctors to return.
+        after (str, optional): Cursor of the page to get.
+
+    Raises:
+        HTTPException: Raises 422 if q has no words or the cursor is
+            invalid.
+
+    Returns:
+        tuple: The doctors and the cursor of the next page, or None if
+            this is the last page.
+    """
+    return _search(db, models.Doctor, 'doctors_fts', q, limit, after)
 
 
 def create_doctor(db: Session, doctor: schemas.DoctorCreate):
@@ -63,8 +283,10 @@ def create_doctor(db: Session, doctor: schemas.DoctorCreate):
     Returns:
         Doctor: A `Doctor` object following the Doctor schema.
     """
+    _begin_write(db)
     db_doctor = models.Doctor(**doctor.dict())
     db.add(db_doctor)
+    versions.bump(db)
 
     try:
         db.commit()
@@ -94,9 +316,11 @@ def update_doctor(db: Session, doctor: schemas.DoctorCreate, doctor_id: int):
     Returns:
         Doctor: A `Doctor` object following the Doctor schema.
     """
+    _begin_write(db)
     db_doctor = get_doctor(db, doctor_id)
     for key, value in doctor:
         setattr(db_doctor, key, value)
+    versions.bump(db, [doctor_id])
 
     try:
         db.commit()
@@ -110,6 +334,50 @@ def update_doctor(db: Session, doctor: schemas.DoctorCreate, doctor_id: int):
     return db_doctor
 
 
+def patch_doctor(db: Session, doctor: schemas.DoctorPatch, doctor_id: int):
+    """
+    Updates the fields of a `Doctor` object given in a DoctorPatch schema.
+
+    Only the given fields are written, with a single update statement. The
+    result is built from the cached doctor instead of being read back.
+
+    Args:
+        doctor (schemas.DoctorPatch): The fields to update.
+        doctor_id (int): PK of the object to update.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found with the
+            given doctor_id, or 422 when user will break the unique
+            constraint of the email.
+
+    Returns:
+        schemas.Doctor: The updated doctor.
+    """
+    changes = doctor.dict(exclude_unset=True)
+    db_doctor = get_cached_doctor(db, doctor_id)
+    if not changes:
+        return db_doctor
+
+    _begin_write(db)
+    try:
+        updated = db.query(models.Doctor).filter(
+            models.Doctor.id == doctor_id
+        ).update(changes, synchronize_session=False)
+        if not updated:
+            db.rollback()
+            raise HTTPException(status_code=404, detail='Doctor not found.')
+        versions.bump(db, [doctor_id])
+        db.commit()
+    except exc.IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=422,
+            detail='Doctor with this email is already registered.'
+        )
+
+    return db_doctor.copy(update=changes)
+
+
 def delete_doctor(db: Session, doctor_id: int):
     """
     Deletes a `Doctor` object.
@@ -117,170 +385,1852 @@ def delete_doctor(db: Session, doctor_id: int):
     Args:
         doctor_id (int): Pk of the Doctor object to be deleted.
     """
+    _begin_write(db)
     db_doctor = get_doctor(db, doctor_id)
+    # Its appointments go with it.
+    deleted = db.query(
+        models.Appointment.id, models.Appointment.doctor_id
+    ).filter(models.Appointment.doctor_id == doctor_id).all()
     db.delete(db_doctor)
+    versions.bump(db, [doctor_id])
     db.commit()
+    events.feed.publish(
+        events.appointment_change(events.DELETED, row) for row in deleted)
 
 
-def get_appointment(db: Session, appointment_id: int):
+def has_overlapping_appointment(
+    db: Session,
+    doctor_id: int,
+    start_dt: datetime,
+    end_dt: datetime,
+    exclude_id: int = None
+):
     """
-    Return an appointment instance
+    Checks if a doctor already has an appointment overlapping the range.
 
-    Args:
-        appointment_id (int): pk of the appointment
+    Stored datetimes are naive utc, so the range is normalized to utc and
+    compared in SQL. Since no appointment is longer than the clinic window,
+    the lower bound on `start_dt` keeps the index scan bounded regardless of
+    how many past appointments the doctor has.
 
-    Raises:
-        HTTPException: Raises 404 if no appointment object with the
-            given appointment_id is found.
+    Args:
+        doctor_id (int): PK of the doctor.
+        start_dt (datetime): Start of the range to check.
+        end_dt (datetime): End of the range to check.
+        exclude_id (int, optional): PK of an appointment to ignore.
 
     Returns:
-        Appointment: the appointment instance
+        bool: True if an overlapping appointment exists.
     """
-    db_appointment = db.query(models.Appointment).get(appointment_id)
-    if not db_appointment:
-        raise HTTPException(status_code=404, detail='Appointment not found.')
-    return db_appointment
+    start_dt = to_utc_naive(start_dt)
+    end_dt = to_utc_naive(end_dt)
 
+    query = db.query(models.Appointment.id).filter(
+        models.Appointment.doctor_id == doctor_id,
+        models.Appointment.start_dt > start_dt - MAX_APPOINTMENT_DURATION,
+        models.Appointment.start_dt < end_dt,
+        models.Appointment.end_dt > start_dt,
+    )
+    if exclude_id is not None:
+        query = query.filter(models.Appointment.id != exclude_id)
 
-def get_appointments(
+    return query.first() is not None
+
+
+def get_series_by_doctor(
     db: Session,
-    start_date: date = None,
-    end_date: date = None,
-    skip: int = 0,
-    limit: int = 100,
-    doctor_id: int = None
+    doctor_ids,
+    start_dt: datetime,
+    end_dt: datetime
 ):
     """
-    Returns a queryset of appointments.
+    Returns the series of doctors running during a range, with their
+    exceptions, in one indexed query plus one for the exceptions.
 
     Args:
-        skip (int, optional): Start of pagination. Defaults to 0.
-        limit (int, optional): End of pagination. Defaults to 100.
-        start_date (date, optional): Start date to filter appointments.
-        end_date (date, optional): End date to filter appointments.
-        doctor_id (int, optional): Filter appointments based on doctor_id.
+        doctor_ids (Iterable[int]): PKs of the doctors, or None for every
+            doctor.
+        start_dt (datetime): Start of the range, naive utc.
+        end_dt (datetime): End of the range, naive utc.
 
     Returns:
-        List[Appointment]: A list of Appointment objects
+        dict: Maps each doctor_id to its series. Doctors without series
+            in the range are left out.
     """
+    query = db.query(models.AppointmentSeries).options(
+        selectinload(models.AppointmentSeries.exceptions)
+    ).filter(
+        models.AppointmentSeries.start_dt < end_dt,
+        models.AppointmentSeries.last_end_dt > start_dt,
+    )
+    if doctor_ids is not None:
+        query = query.filter(
+            models.AppointmentSeries.doctor_id.in_(list(doctor_ids)))
+    groups = defaultdict(list)
+    for db_series in query:
+        groups[db_series.doctor_id].append(db_series)
+    return groups
 
-    db_appointments = db.query(models.Appointment)
 
-    if doctor_id:
-        db_appointments = db_appointments.filter(
-            models.Appointment.doctor_id == doctor_id)
+def has_overlapping_series(
+    db: Session,
+    doctor_id: int,
+    start_dt: datetime,
+    end_dt: datetime
+):
+    """
+    Checks if an occurrence of a series of a doctor overlaps the range.
 
-    if start_date:
-        start_dt = datetime(start_date.year, start_date.month, start_date.day)
-        db_appointments = db_appointments.filter(
-            models.Appointment.start_dt >= start_dt)
+    Occurrences are not stored, so the series running during the range are
+    fetched and only their occurrences within it are expanded. Exceptions
+    are only read for a series with an occurrence in the range, so the
+    usual booking that overlaps no occurrence costs one query.
 
-    if end_date:
-        end_dt = datetime(
-            end_date.year, end_date.month, end_date.day, 23, 59, 59)
-        db_appointments = db_appointments.filter(
-            models.Appointment.end_dt <= end_dt)
+    Args:
+        doctor_id (int): PK of the doctor.
+        start_dt (datetime): Start of the range to check.
+        end_dt (datetime): End of the range to check.
+
+    Returns:
+        bool: True if an overlapping occurrence exists.
+    """
+    start_dt = to_utc_naive(start_dt)
+    end_dt = to_utc_naive(end_dt)
+    rows = db.query(
+        models.AppointmentSeries.id,
+        models.AppointmentSeries.start_dt,
+        models.AppointmentSeries.end_dt,
+        models.AppointmentSeries.interval_weeks,
+        models.AppointmentSeries.count,
+    ).filter(
+        models.AppointmentSeries.doctor_id == doctor_id,
+        models.AppointmentSeries.start_dt < end_dt,
+        models.AppointmentSeries.last_end_dt > start_dt,
+    )
+    series_ids = [
+        row.id for row in rows if series.overlaps(row, start_dt, end_dt)]
+    if not series_ids:
+        return False
 
-    return db_appointments.offset(skip).limit(limit).all()
+    return series.any_overlaps(
+        db.query(models.AppointmentSeries).options(
+            selectinload(models.AppointmentSeries.exceptions)
+        ).filter(models.AppointmentSeries.id.in_(series_ids)),
+        start_dt,
+        end_dt
+    )
 
 
-def create_appointment(db: Session, appointment: schemas.Appointment):
+def get_availability(
+    db: Session,
+    day: date,
+    duration: int = 30,
+    doctor_id: int = None
+):
     """
-    Creates the object based on the given appointment schema.
+    Returns the free slots of doctors within the clinic hours of a day.
+
+    The appointments of every doctor are fetched with one query sorted by
+    doctor and start, merged with the occurrences of their series on that
+    day, then swept once to find the gaps.
 
     Args:
-        appointment (schemas.Appointment): Comes from the body of the
-            POST request.
+        day (date): The date in the clinic's timezone.
+        duration (int, optional): Minimum length of a slot in minutes.
+            Defaults to 30.
+        doctor_id (int, optional): Only compute the slots of this doctor.
 
     Raises:
-        HTTPException: Raises 422 if there are overlapping (overbooked)
-            appointment times.
+        HTTPException: Raises 404 if doctor_id is given and no doctor
+            object is found.
 
     Returns:
-        Appointment: An appointment instance.
+        List[schemas.DoctorAvailability]: The free slots of each doctor.
     """
-    db_doctor = get_doctor(db, appointment.doctor_id)
-    for app in db_doctor.appointments:
-        if (
-            utc_to_local(app.end_dt) > appointment.start_dt and
-            utc_to_local(app.start_dt) < appointment.end_dt
-        ):
-            raise HTTPException(
-                status_code=422,
-                detail='Overlapping appointment times.'
-            )
+    if doctor_id is not None:
+        doctor_ids = [get_doctor(db, doctor_id).id]
+    else:
+        doctor_ids = [
+            row.id for row in
+            db.query(models.Doctor.id).order_by(models.Doctor.id)
+        ]
 
-    db_appointment = models.Appointment(**appointment.dict())
-    db.add(db_appointment)
-    db.commit()
-    db.refresh(db_appointment)
-    logger.info(
-        f'Appointment with id #{db_appointment.id} successfully created'
+    window = clinic_window(day)
+    if window is None:
+        return [
+            schemas.DoctorAvailability(doctor_id=id_) for id_ in doctor_ids
+        ]
+    window_start, window_end = window
+    min_duration = timedelta(minutes=duration)
+
+    query = db.query(
+        models.Appointment.doctor_id,
+        models.Appointment.start_dt,
+        models.Appointment.end_dt
+    ).filter(
+        models.Appointment.start_dt > window_start - MAX_APPOINTMENT_DURATION,
+        models.Appointment.start_dt < window_end,
+        models.Appointment.end_dt > window_start,
     )
-    return db_appointment
+    if doctor_id is not None:
+        query = query.filter(models.Appointment.doctor_id == doctor_id)
+    booked = defaultdict(list)
+    for row in query.order_by(
+        models.Appointment.doctor_id, models.Appointment.start_dt
+    ):
+        booked[row.doctor_id].append((row.start_dt, row.end_dt))
+    # Occurrences of series count as booked too.
+    for id_, doctor_series in get_series_by_doctor(
+        db,
+        [doctor_id] if doctor_id is not None else None,
+        window_start,
+        window_end
+    ).items():
+        for db_series in doctor_series:
+            booked[id_].extend(
+                (start_dt, end_dt) for _, start_dt, end_dt in
+                series.occurrences(
+                    db_series,
+                    window_start,
+                    window_end,
+                    series.skipped_days(db_series)
+                )
+            )
+
+    def _slot(start_dt, end_dt):
+        return schemas.TimeSlot(
+            start_dt=start_dt.replace(tzinfo=pytz.utc),
+            end_dt=end_dt.replace(tzinfo=pytz.utc)
+        )
 
+    availability = []
+    for id_ in doctor_ids:
+        slots = []
+        free_from = window_start
+        for start_dt, end_dt in sorted(booked.get(id_, [])):
+            if start_dt - free_from >= min_duration:
+                slots.append(_slot(free_from, start_dt))
+            free_from = max(free_from, end_dt)
+        if window_end - free_from >= min_duration:
+            slots.append(_slot(free_from, window_end))
+        availability.append(
+            schemas.DoctorAvailability(doctor_id=id_, slots=slots))
+    return availability
 
-def update_appointment(
+
+def get_doctor_stats(
     db: Session,
-    appointment: schemas.Appointment,
-    appointment_id: int
+    start_date: date = None,
+    end_date: date = None,
+    doctor_id: int = None
 ):
     """
-    Updates the object based on the given appointment schema.
+    Returns the daily load and busiest hours of doctors.
+
+    Reads the hourly summary kept up to date by the appointment writes, so
+    the cost depends on the number of days and doctors, not appointments.
 
     Args:
-        appointment (schemas.Appointment): Comes from the body of the
-            POST request.
-        appointment_id (int): PK of the appointment object.
+        start_date (date, optional): First day, in the clinic's timezone.
+        end_date (date, optional): Last day, in the clinic's timezone.
+        doctor_id (int, optional): Only compute the stats of this doctor.
 
     Raises:
-        HTTPException: Raises 422 if there are overlapping (overbooked)
-            appointment times.
+        HTTPException: Raises 404 if doctor_id is given and no doctor
+            object is found.
 
     Returns:
-        Appointment: An appointment instance.
+        List[schemas.DoctorStats]: The stats of each doctor.
     """
-    db_appointment = get_appointment(db, appointment_id)
-    if db_appointment.doctor_id != appointment.doctor_id:
-        db_doctor = get_doctor(db, appointment.doctor_id)
-        logger.info(
-            f'The appointment doctor id will change from '
-            f'{db_appointment.doctor_id} to {db_doctor.id}.'
-        )
+    if doctor_id is not None:
+        doctor_ids = [get_cached_doctor(db, doctor_id).id]
     else:
-        db_doctor = get_doctor(db, db_appointment.doctor_id)
-        logger.info(f'The appointment doctor id is unchanged.')
+        doctor_ids = [
+            row.id for row in
+            db.query(models.Doctor.id).order_by(models.Doctor.id)
+        ]
 
-    for app in db_doctor.appointments:
-        if app.id == db_appointment.id:
-            continue
+    query = db.query(models.DoctorHourlyLoad)
+    if doctor_id is not None:
+        query = query.filter(models.DoctorHourlyLoad.doctor_id == doctor_id)
+    if start_date:
+        query = query.filter(models.DoctorHourlyLoad.day >= start_date)
+    if end_date:
+        query = query.filter(models.DoctorHourlyLoad.day <= end_date)
+    loads = {
+        key: list(rows) for key, rows in groupby(
+            query.order_by(
+                models.DoctorHourlyLoad.doctor_id,
+                models.DoctorHourlyLoad.day,
+                models.DoctorHourlyLoad.hour
+            ),
+            key=lambda row: row.doctor_id
+        )
+    }
 
-        if (
-            utc_to_local(app.end_dt) > appointment.start_dt and
-            utc_to_local(app.start_dt) < appointment.end_dt
-        ):
-            raise HTTPException(
-                status_code=422,
-                detail='Overlapping appointment times.'
-            )
+    doctor_stats = []
+    for id_ in doctor_ids:
+        days = []
+        hours = defaultdict(int)
+        for day, rows in groupby(loads.get(id_, []), key=lambda r: r.day):
+            seconds = appointments = 0
+            for row in rows:
+                seconds += row.booked_seconds
+                appointments += row.appointments
+                hours[row.hour] += row.booked_seconds
+            if seconds or appointments:
+                days.append(schemas.DailyLoad(
+                    day=day,
+                    booked_minutes=seconds / 60,
+                    appointments=appointments,
+                    utilization=seconds / stats.CLINIC_DAY_SECONDS
+                ))
+        doctor_stats.append(schemas.DoctorStats(
+            doctor_id=id_,
+            days=days,
+            hourly_booked_minutes={
+                hour: seconds / 60
+                for hour, seconds in sorted(hours.items()) if seconds
+            }
+        ))
+    return doctor_stats
 
-    for key, value in appointment:
-        setattr(db_appointment, key, value)
-    db.commit()
-    db.refresh(db_appointment)
-    logger.info(
-        f'Appointment object with id #{db_appointment.id} successfully updated'
-    )
+
+def get_appointment(db: Session, appointment_id: int):
+    """
+    Return an appointment instance
+
+    Args:
+        appointment_id (int): pk of the appointment
+
+    Raises:
+        HTTPException: Raises 404 if no appointment object with the
+            given appointment_id is found.
+
+    Returns:
+        Appointment: the appointment instance
+    """
+    db_appointment = db.query(models.Appointment).options(
+        joinedload(models.Appointment.doctor)).get(appointment_id)
+    if not db_appointment:
+        raise HTTPException(status_code=404, detail='Appointment not found.')
     return db_appointment
 
 
-def delete_appointment(db: Session, appointment_id: int):
+async def get_appointment_json_async(conn, appointment_id: int):
     """
-    Deletes an appointment object.
+    Returns the same appointment as `get_appointment`, read with an `aio`
+    connection and encoded as JSON.
 
     Args:
-        appointment_id (int): The PK of the appointment object.
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        appointment_id (int): pk of the appointment
+
+    Raises:
+        HTTPException: Raises 404 if no appointment object with the
+            given appointment_id is found.
+
+    Returns:
+        bytes: The JSON body.
     """
-    db_appointment = get_appointment(db, appointment_id)
-    db.delete(db_appointment)
+    rows = await aio.fetch_all(conn, _query_appointment_rows().filter(
+        models.Appointment.id == appointment_id))
+    if not rows:
+        raise HTTPException(status_code=404, detail='Appointment not found.')
+    return dumps_json(_appointment_row_to_dict(rows[0]))
+
+
+def get_appointments_by_ids(db: Session, ids):
+    """
+    Returns the appointments with the given ids and their doctors, with one
+    query.
+
+    Args:
+        ids (Collection[int]): PKs of the appointment objects.
+
+    Returns:
+        Dict[int, Appointment]: The appointments found, by id.
+    """
+    if not ids:
+        return {}
+    return {
+        db_appointment.id: db_appointment
+        for db_appointment in db.query(models.Appointment).options(
+            joinedload(models.Appointment.doctor)
+        ).filter(models.Appointment.id.in_(ids))
+    }
+
+
+def get_calendar_rows(db: Session, doctor_ids, start_dt, end_dt):
+    """
+    Returns the appointments of doctors starting within a range.
+
+    Runs one query served by the (doctor_id, start_dt, id) index, which
+    also gives the order.
+
+    Args:
+        doctor_ids (Collection[int]): PKs of the doctors.
+        start_dt (datetime): Start of the range, naive utc.
+        end_dt (datetime): End of the range, naive utc, excluded.
+
+    Returns:
+        list: Rows of the id, doctor_id, start_dt, end_dt and patient_name
+            of each appointment, ordered by doctor_id, start_dt and id.
+    """
+    if not doctor_ids:
+        return []
+    return db.query(
+        models.Appointment.id,
+        models.Appointment.doctor_id,
+        models.Appointment.start_dt,
+        models.Appointment.end_dt,
+        models.Appointment.patient_name,
+    ).filter(
+        models.Appointment.doctor_id.in_(doctor_ids),
+        models.Appointment.start_dt >= start_dt,
+        models.Appointment.start_dt < end_dt,
+    ).order_by(
+        models.Appointment.doctor_id,
+        models.Appointment.start_dt,
+        models.Appointment.id
+    ).all()
+
+
+def get_calendar_occurrences(db: Session, doctor_ids, start_dt, end_dt):
+    """
+    Returns the occurrences of the series of doctors starting within a
+    range.
+
+    Runs one query for the series running during the range, plus one for
+    their exceptions if there are any.
+
+    Args:
+        doctor_ids (Collection[int]): PKs of the doctors.
+        start_dt (datetime): Start of the range, naive utc.
+        end_dt (datetime): End of the range, naive utc, excluded.
+
+    Returns:
+        list: Tuples of the doctor_id, series_id, index, start_dt, end_dt
+            and patient_name of each occurrence, ordered by doctor_id and
+            start_dt.
+    """
+    if not doctor_ids:
+        return []
+    occurrences = []
+    for doctor_id, doctor_series in get_series_by_doctor(
+        db, doctor_ids, start_dt, end_dt
+    ).items():
+        for db_series in doctor_series:
+            occurrences.extend(
+                (
+                    doctor_id, db_series.id, index, occurrence_start,
+                    occurrence_end, db_series.patient_name
+                )
+                for index, occurrence_start, occurrence_end in
+                series.occurrences(
+                    db_series, start_dt, end_dt,
+                    series.skipped_days(db_series)
+                )
+                # Like appointments, by the start only.
+                if start_dt <= occurrence_start < end_dt
+            )
+    occurrences.sort(
+        key=lambda occurrence: (occurrence[0], occurrence[3]))
+    return occurrences
+
+
+def _date_conditions(start_date, end_date):
+    conditions = []
+    if start_date:
+        start_dt = datetime(start_date.year, start_date.month, start_date.day)
+        conditions.append(models.Appointment.start_dt >= start_dt)
+
+    if end_date:
+        end_dt = datetime(
+            end_date.year, end_date.month, end_date.day, 23, 59, 59)
+        conditions.append(models.Appointment.end_dt <= end_dt)
+
+    return conditions
+
+
+def _filter_appointments(query, start_date, end_date, doctor_id):
+    if doctor_id:
+        query = query.filter(models.Appointment.doctor_id == doctor_id)
+
+    return query.filter(*_date_conditions(start_date, end_date))
+
+
+def _paginate_appointments(query, skip, limit, after):
+    query = query.order_by(models.Appointment.start_dt, models.Appointment.id)
+
+    if after:
+        after_start_dt, after_id = _decode_cursor(after, datetime, int)
+        # A row value, which SQLite seeks in the (start_dt, id) index. With
+        # bound parameters, the equivalent OR of two conditions scans the
+        # index from its start instead.
+        query = query.filter(
+            tuple_(models.Appointment.start_dt, models.Appointment.id) >
+            tuple_(after_start_dt, after_id)
+        )
+    else:
+        query = query.offset(skip)
+
+    return query.limit(limit)
+
+
+def _query_appointment_rows(db: Session = None):
+    return Query([
+        models.Appointment.id,
+        models.Appointment.patient_name,
+        models.Appointment.comment,
+        models.Appointment.start_dt,
+        models.Appointment.end_dt,
+        models.Appointment.doctor_id,
+        models.Doctor.first_name,
+        models.Doctor.last_name,
+        models.Doctor.email,
+    ], session=db).join(models.Appointment.doctor)
+
+
+def get_appointment_rows_by_ids(db: Session, ids):
+    """
+    Returns the appointments with the given ids, as plain tuples.
+
+    Args:
+        ids (List[int]): The ids, in any order.
+
+    Returns:
+        list: Rows for `appointment_rows_json`, in no particular order.
+    """
+    return _query_appointment_rows(db).filter(
+        models.Appointment.id.in_(ids)).all()
+
+
+def _appointment_row_to_dict(row):
+    # Same keys, order and formats as `schemas.Appointment`.
+    return {
+        'patient_name': row.patient_name,
+        'comment': row.comment,
+        'start_dt': row.start_dt.isoformat(),
+        'end_dt': row.end_dt.isoformat(),
+        'id': row.id,
+        'doctor_id': row.doctor_id,
+        'doctor': {
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'email': row.email,
+            'id': row.doctor_id,
+        },
+    }
+
+
+def _doctor_to_dict(db_doctor):
+    # Same keys and order as `schemas.Doctor`.
+    return {
+        'first_name': db_doctor.first_name,
+        'last_name': db_doctor.last_name,
+        'email': db_doctor.email,
+        'id': db_doctor.id,
+    }
+
+
+def _appointment_values_to_dict(values: dict, doctor: dict):
+    # Same keys, order and formats as `schemas.Appointment`, with the dict
+    # of its doctor shared by the appointments of the same doctor.
+    return {
+        'patient_name': values['patient_name'],
+        'comment': values['comment'],
+        'start_dt': values['start_dt'].isoformat(),
+        'end_dt': values['end_dt'].isoformat(),
+        'id': values['id'],
+        'doctor_id': values['doctor_id'],
+        'doctor': doctor,
+    }
+
+
+def get_appointments(
+    db: Session,
+    start_date: date = None,
+    end_date: date = None,
+    skip: int = 0,
+    limit: int = 100,
+    doctor_id: int = None,
+    after: str = None
+):
+    """
+    Returns a queryset of appointments ordered by start_dt and id.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        after (str, optional): Cursor from `get_appointments_cursor`. When
+            given, the page starts right after the cursor instead of
+            skipping rows.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        List[Appointment]: A list of Appointment objects
+    """
+
+    # Load the doctors along with the rows so serializing the nested
+    # `doctor` does not issue a query per appointment.
+    db_appointments = db.query(models.Appointment).options(
+        joinedload(models.Appointment.doctor))
+
+    db_appointments = _filter_appointments(
+        db_appointments, start_date, end_date, doctor_id)
+
+    return _paginate_appointments(
+        db_appointments, skip, limit, after).all()
+
+
+def get_appointment_rows(
+    db: Session,
+    start_date: date = None,
+    end_date: date = None,
+    skip: int = 0,
+    limit: int = 100,
+    doctor_id: int = None,
+    after: str = None
+):
+    """
+    Returns the same page as `get_appointments`, as plain tuples.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        after (str, optional): Cursor from a previous page.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        list: Rows for `appointment_rows_json`.
+    """
+    query = _filter_appointments(
+        _query_appointment_rows(db), start_date, end_date, doctor_id)
+    return _paginate_appointments(query, skip, limit, after).all()
+
+
+async def get_appointments_json_async(
+    conn,
+    start_date: date = None,
+    end_date: date = None,
+    skip: int = 0,
+    limit: int = 100,
+    doctor_id: int = None,
+    after: str = None
+):
+    """
+    Returns the same page as `get_appointments_json`, read with an `aio`
+    connection.
+
+    Args:
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        after (str, optional): Cursor from a previous page.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        tuple: The JSON body as bytes and the cursor of the next page, or
+            None if this is the last page.
+    """
+    query = _filter_appointments(
+        _query_appointment_rows(), start_date, end_date, doctor_id)
+    rows = await aio.fetch_all(
+        conn, _paginate_appointments(query, skip, limit, after))
+    return appointment_rows_json(rows), get_appointments_cursor(rows, limit)
+
+
+def appointment_rows_json(rows):
+    """
+    Encodes rows from `get_appointment_rows` like a validated response.
+
+    Args:
+        rows (list): The rows to encode.
+
+    Returns:
+        bytes: The JSON body.
+    """
+    return dumps_json([_appointment_row_to_dict(row) for row in rows])
+
+
+def get_appointments_json(
+    db: Session,
+    start_date: date = None,
+    end_date: date = None,
+    skip: int = 0,
+    limit: int = 100,
+    doctor_id: int = None,
+    after: str = None
+):
+    """
+    Returns the same page as `get_appointments`, already encoded as JSON.
+
+    Rows are fetched as plain tuples and encoded directly, skipping the
+    ORM instances and the response model validation of trusted data. The
+    output is identical to the one of the validated response.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        after (str, optional): Cursor from a previous page.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        tuple: The JSON body as bytes and the cursor of the next page, or
+            None if this is the last page.
+    """
+    rows = get_appointment_rows(
+        db, start_date, end_date, skip, limit, doctor_id, after)
+    return appointment_rows_json(rows), get_appointments_cursor(rows, limit)
+
+
+def search_appointments_json(
+    db: Session,
+    q: str,
+    limit: int = 20,
+    after: str = None
+):
+    """
+    Returns the appointments whose patient names match a query, best match
+    first, already encoded as JSON.
+
+    Like `get_appointments_json`, the matches are fetched as plain tuples
+    and encoded directly, with the same output as the validated response.
+
+    Args:
+        q (str): Words matching the start of words of the patient name.
+        limit (int, optional): Maximum number of appointments to return.
+        after (str, optional): Cursor of the page to get.
+
+    Raises:
+        HTTPException: Raises 422 if q has no words or the cursor is
+            invalid.
+
+    Returns:
+        tuple: The JSON body and the cursor of the next page, or None if
+            this is the last page.
+    """
+    rows, next_cursor = _search(
+        db,
+        models.Appointment,
+        'appointments_fts',
+        q,
+        limit,
+        after,
+        fetch=get_appointment_rows_by_ids
+    )
+    return appointment_rows_json(rows), next_cursor
+
+
+def get_appointments_cursor(db_appointments, limit: int):
+    """
+    Returns the cursor of the page following the given appointments.
+
+    Args:
+        db_appointments (List[Appointment]): A page returned by
+            `get_appointments`.
+        limit (int): The limit used to fetch the page.
+
+    Returns:
+        str: The cursor, or None if this is the last page.
+    """
+    if not db_appointments or len(db_appointments) < limit:
+        return None
+    last = db_appointments[-1]
+    return encode_cursor(last.start_dt, last.id)
+
+
+EXPORT_COLUMNS = (
+    'id',
+    'patient_name',
+    'comment',
+    'start_dt',
+    'end_dt',
+    'doctor_id',
+    'doctor_first_name',
+    'doctor_last_name',
+    'doctor_email',
+)
+
+
+def query_export_rows(
+    db: Session,
+    start_date: date = None,
+    end_date: date = None,
+    doctor_id: int = None,
+    batch_size: int = 1000
+):
+    """
+    Returns the rows of an export, ordered by start_dt and id.
+
+    Rows are fetched as plain tuples `batch_size` at a time.
+
+    Args:
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        batch_size (int, optional): Rows per fetch.
+
+    Returns:
+        Query: The rows, to iterate over.
+    """
+    query = _query_appointment_rows(db)
+    query = _filter_appointments(query, start_date, end_date, doctor_id)
+    return query.order_by(
+        models.Appointment.start_dt, models.Appointment.id
+    ).yield_per(batch_size)
+
+
+def encode_export(rows, export_format: str = 'ndjson',
+                  batch_size: int = 1000):
+    """
+    Encodes rows from `query_export_rows` as NDJSON or CSV.
+
+    Each `batch_size` rows are yielded as one chunk, so memory does not
+    grow with the number of rows.
+
+    Args:
+        rows (Iterable): The rows to encode.
+        export_format (str, optional): Either `ndjson` or `csv`.
+            Defaults to `ndjson`.
+        batch_size (int, optional): Rows per chunk.
+
+    Yields:
+        str: Chunks of the export.
+    """
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+
+        def write(row):
+            writer.writerow(
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            )
+    else:
+        def write(row):
+            buffer.write(json.dumps(_appointment_row_to_dict(row)))
+            buffer.write('\n')
+
+    count = 0
+    for row in rows:
+        write(row)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    chunk = buffer.getvalue()
+    if chunk:
+        yield chunk
+
+
+def export_appointments(
+    db: Session,
+    export_format: str = 'ndjson',
+    start_date: date = None,
+    end_date: date = None,
+    doctor_id: int = None,
+    batch_size: int = 1000
+):
+    """
+    Streams appointments as NDJSON or CSV, ordered by start_dt and id.
+
+    Rows are fetched as plain tuples `batch_size` at a time and each batch
+    is yielded as one chunk, so memory does not grow with the range.
+
+    Args:
+        export_format (str, optional): Either `ndjson` or `csv`.
+            Defaults to `ndjson`.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        batch_size (int, optional): Rows per fetch and per chunk.
+
+    Returns:
+        Iterator[str]: Chunks of the export.
+    """
+    rows = query_export_rows(db, start_date, end_date, doctor_id, batch_size)
+    return encode_export(rows, export_format, batch_size)
+
+
+def _begin_write(db: Session):
+    # Take the write lock of a file database upfront. A transaction that
+    # reads first fails instead of waiting if another connection commits
+    # before it writes. Sessions in `write_locks` already hold it.
+    if not IN_MEMORY and not db.info.get('holds_write_lock'):
+        db.rollback()
+        db.connection(execution_options={'sqlite_immediate': True})
+
+
+@contextmanager
+def write_locks(sessions):
+    """
+    Holds the write locks of the sessions of several shards at once.
+
+    They are taken in the given order, which must be the order of the
+    shards, so writers holding the same shards cannot deadlock. The writes
+    of this module done in the block use them rather than taking them
+    again, and release them with their commit. The others are released
+    when their session ends its transaction.
+
+    Args:
+        sessions (List[Session]): The sessions to lock, in shard order.
+    """
+    try:
+        for db in sessions:
+            _begin_write(db)
+            db.info['holds_write_lock'] = True
+        yield
+    finally:
+        for db in sessions:
+            db.info.pop('holds_write_lock', None)
+
+
+@contextmanager
+def _booking(db: Session, doctor_ids):
+    """
+    Serializes the bookings of the given doctors, or of every doctor if
+    doctor_ids is None.
+
+    Bookings of the same doctors wait on in process lock stripes. With a
+    file database the transaction also takes the write lock upfront, so the
+    overlap check cannot be invalidated by another worker before the write.
+    The overlap trigger of `appointments` is the last line of defense and
+    is reported like an overlap found by the check.
+    """
+    with doctor_locks(doctor_ids):
+        _begin_write(db)
+        try:
+            yield
+        except exc.IntegrityError as e:
+            db.rollback()
+            if models.OVERLAP_ERROR not in str(e.orig):
+                raise
+            raise HTTPException(status_code=422, detail=models.OVERLAP_ERROR)
+        except Exception:
+            # Release the write lock now rather than when the session closes.
+            db.rollback()
+            raise
+
+
+def create_appointment(db: Session, appointment: schemas.Appointment):
+    """
+    Creates the object based on the given appointment schema.
+
+    Args:
+        appointment (schemas.Appointment): Comes from the body of the
+            POST request.
+
+    Raises:
+        HTTPException: Raises 422 if there are overlapping (overbooked)
+            appointment times.
+
+    Returns:
+        Appointment: An appointment instance.
+    """
+    with _booking(db, [appointment.doctor_id]):
+        get_cached_doctor(db, appointment.doctor_id)
+        if has_overlapping_appointment(
+            db,
+            appointment.doctor_id,
+            appointment.start_dt,
+            appointment.end_dt
+        ) or has_overlapping_series(
+            db,
+            appointment.doctor_id,
+            appointment.start_dt,
+            appointment.end_dt
+        ):
+            raise HTTPException(
+                status_code=422,
+                detail='Overlapping appointment times.'
+            )
+
+        db_appointment = models.Appointment(**appointment.dict())
+        db.add(db_appointment)
+        stats.apply_load(
+            db,
+            appointment.doctor_id,
+            appointment.start_dt,
+            appointment.end_dt
+        )
+        versions.bump(db, [appointment.doctor_id])
+        db.commit()
+    db.refresh(db_appointment)
+    events.feed.publish(
+        [events.appointment_change(events.CREATED, db_appointment)])
+    logger.info(
+        f'Appointment with id #{db_appointment.id} successfully created'
+    )
+    return db_appointment
+
+
+def _insert_appointments(db: Session, rows: List[dict]):
+    """
+    Inserts appointments with one statement and sets the PK of each row.
+
+    The PKs are read back with one range query over the doctors and times
+    of the rows. A doctor and start identify a stored appointment since the
+    appointments of a doctor never overlap.
+
+    Args:
+        rows (List[dict]): The column values of each appointment, without
+            the PK.
+    """
+    db.execute(models.Appointment.__table__.insert(), rows)
+    stored = db.query(
+        models.Appointment.id,
+        models.Appointment.doctor_id,
+        models.Appointment.start_dt
+    ).filter(
+        models.Appointment.doctor_id.in_({row['doctor_id'] for row in rows}),
+        models.Appointment.start_dt >= min(row['start_dt'] for row in rows),
+        models.Appointment.start_dt <= max(row['start_dt'] for row in rows),
+    )
+    ids = {
+        (doctor_id, start_dt): id_ for id_, doctor_id, start_dt in stored}
+    for row in rows:
+        row['id'] = ids[(row['doctor_id'], row['start_dt'])]
+
+
+def _bulk_result(index: int, status: str, detail: str = None,
+                 appointment: dict = None):
+    # Same keys and order as `schemas.AppointmentBulkResult`.
+    return {
+        'index': index,
+        'status': status,
+        'detail': detail,
+        'appointment': appointment,
+    }
+
+
+def bulk_create_appointments(
+    db: Session,
+    appointments: List[schemas.AppointmentCreate]
+):
+    """
+    Creates appointments in one transaction, skipping the conflicting ones.
+
+    Items are grouped by doctor and swept in start order. An item conflicts
+    if it overlaps a stored appointment, fetched with one range query over
+    the doctors and times of the batch, or an earlier item of the same
+    batch. The items created are inserted with one statement.
+
+    Args:
+        appointments (List[schemas.AppointmentCreate]): Comes from the body
+            of the POST request.
+
+    Returns:
+        List[dict]: One result per item, in the order of the request, with
+            the keys and formats of `schemas.AppointmentBulkResult`.
+    """
+    results = [None] * len(appointments)
+    doctor_ids = {appointment.doctor_id for appointment in appointments}
+
+    with _booking(db, doctor_ids):
+        db_doctors = db.query(models.Doctor).filter(
+            models.Doctor.id.in_(doctor_ids)).all() if doctor_ids else []
+        doctors = {
+            db_doctor.id: _doctor_to_dict(db_doctor)
+            for db_doctor in db_doctors
+        }
+
+        groups = defaultdict(list)
+        for index, appointment in enumerate(appointments):
+            if appointment.doctor_id not in doctors:
+                results[index] = _bulk_result(
+                    index, 'not_found', detail='Doctor not found.')
+                continue
+            groups[appointment.doctor_id].append(
+                (appointment.start_dt, appointment.end_dt, index))
+
+        all_items = [item for items in groups.values() for item in items]
+        series_by_doctor = {}
+        stored_by_doctor = {}
+        if all_items:
+            start_dt = min(item[0] for item in all_items)
+            end_dt = max(item[1] for item in all_items)
+            series_by_doctor = get_series_by_doctor(
+                db, groups, start_dt, end_dt)
+            stored = db.query(
+                models.Appointment.doctor_id,
+                models.Appointment.start_dt,
+                models.Appointment.end_dt
+            ).filter(
+                models.Appointment.doctor_id.in_(groups),
+                models.Appointment.start_dt >
+                start_dt - MAX_APPOINTMENT_DURATION,
+                models.Appointment.start_dt < end_dt,
+            ).order_by(
+                models.Appointment.doctor_id, models.Appointment.start_dt)
+            stored_by_doctor = {
+                doctor_id: list(rows) for doctor_id, rows in groupby(
+                    stored, key=lambda row: row.doctor_id)
+            }
+
+        created = []
+        loads = defaultdict(lambda: [0, 0])
+        for doctor_id, items in groups.items():
+            items.sort()
+            doctor_series = series_by_doctor.get(doctor_id, [])
+            stored = stored_by_doctor.get(doctor_id, [])
+            # Stored appointments never overlap, so their ends are sorted too.
+            stored_starts = [row.start_dt for row in stored]
+            stored_ends = [row.end_dt for row in stored]
+
+            last_end = None
+            for start_dt, end_dt, index in items:
+                position = bisect_left(stored_starts, end_dt) - 1
+                if (
+                    (position >= 0 and stored_ends[position] > start_dt) or
+                    (last_end is not None and start_dt < last_end) or
+                    series.any_overlaps(doctor_series, start_dt, end_dt)
+                ):
+                    results[index] = _bulk_result(
+                        index, 'conflict',
+                        detail='Overlapping appointment times.')
+                    continue
+
+                last_end = end_dt
+                stats.add_load(loads, doctor_id, start_dt, end_dt)
+                created.append((index, appointments[index].dict()))
+
+        changes = []
+        if created:
+            _insert_appointments(db, [values for _, values in created])
+            stats.apply_loads(db, loads)
+            versions.bump(db, [values['doctor_id'] for _, values in created])
+            for index, values in created:
+                appointment = _appointment_values_to_dict(
+                    values, doctors[values['doctor_id']])
+                results[index] = _bulk_result(
+                    index, 'created', appointment=appointment)
+                changes.append(
+                    events.appointment_change(events.CREATED, appointment))
+        db.commit()
+    events.feed.publish(changes)
+    logger.info(
+        f'{len(created)} of {len(appointments)} appointments successfully '
+        f'created in bulk'
+    )
+    return results
+
+
+def update_appointment(
+    db: Session,
+    appointment: schemas.Appointment,
+    appointment_id: int
+):
+    """
+    Updates the object based on the given appointment schema.
+
+    Args:
+        appointment (schemas.Appointment): Comes from the body of the
+            POST request.
+        appointment_id (int): PK of the appointment object.
+
+    Raises:
+        HTTPException: Raises 422 if there are overlapping (overbooked)
+            appointment times.
+
+    Returns:
+        Appointment: An appointment instance.
+    """
+    # Lock the stored doctor too, since moving an appointment off it
+    # changes its load.
+    doctor_id = get_appointment(db, appointment_id).doctor_id
+    with _booking(db, [doctor_id, appointment.doctor_id]):
+        db_appointment = get_appointment(db, appointment_id)
+        if db_appointment.doctor_id != appointment.doctor_id:
+            db_doctor = get_cached_doctor(db, appointment.doctor_id)
+            logger.info(
+                f'The appointment doctor id will change from '
+                f'{db_appointment.doctor_id} to {db_doctor.id}.'
+            )
+        else:
+            db_doctor = get_cached_doctor(db, db_appointment.doctor_id)
+            logger.info(f'The appointment doctor id is unchanged.')
+
+        if has_overlapping_appointment(
+            db,
+            db_doctor.id,
+            appointment.start_dt,
+            appointment.end_dt,
+            exclude_id=db_appointment.id
+        ) or has_overlapping_series(
+            db,
+            db_doctor.id,
+            appointment.start_dt,
+            appointment.end_dt
+        ):
+            raise HTTPException(
+                status_code=422,
+                detail='Overlapping appointment times.'
+            )
+
+        stats.apply_load(
+            db,
+            db_appointment.doctor_id,
+            db_appointment.start_dt,
+            db_appointment.end_dt,
+            sign=-1
+        )
+        versions.bump(db, [db_appointment.doctor_id, appointment.doctor_id])
+        previous_doctor_id = db_appointment.doctor_id
+        for key, value in appointment:
+            setattr(db_appointment, key, value)
+        stats.apply_load(
+            db,
+            appointment.doctor_id,
+            appointment.start_dt,
+            appointment.end_dt
+        )
+        db.commit()
+    db.refresh(db_appointment)
+    events.feed.publish([events.appointment_change(
+        events.UPDATED, db_appointment, previous_doctor_id)])
+    logger.info(
+        f'Appointment object with id #{db_appointment.id} successfully updated'
+    )
+    return db_appointment
+
+
+def _get_appointment_row(db: Session, appointment_id: int):
+    row = _query_appointment_rows(db).filter(
+        models.Appointment.id == appointment_id).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail='Appointment not found.')
+    return row
+
+
+APPOINTMENT_FIELDS = (
+    'id', 'patient_name', 'comment', 'start_dt', 'end_dt', 'doctor_id')
+SCHEDULE_FIELDS = ('start_dt', 'end_dt', 'doctor_id')
+
+
+def _patched(row, changes):
+    result = {key: getattr(row, key) for key in APPOINTMENT_FIELDS}
+    result.update(changes)
+    return result
+
+
+def patch_appointment(
+    db: Session,
+    appointment: schemas.AppointmentPatch,
+    appointment_id: int
+):
+    """
+    Updates the fields of an appointment given in an AppointmentPatch schema.
+
+    The appointment is read once, with its doctor, and only the given
+    fields are written with a single update statement. The clinic hours
+    and overlap checks only run if the times or the doctor change. The
+    result is built from what was read and written instead of being read
+    back.
+
+    Args:
+        appointment (schemas.AppointmentPatch): The fields to update.
+        appointment_id (int): PK of the appointment object.
+
+    Raises:
+        HTTPException: Raises 404 if the appointment or the new doctor is
+            not found, or 422 if the new times are not permissible or
+            overlap another appointment.
+
+    Returns:
+        dict: The updated appointment, following the Appointment schema.
+    """
+    changes = appointment.dict(exclude_unset=True)
+    if changes:
+        # Whether the times change is only known once the row is read, so
+        # every write takes the write lock before it.
+        _begin_write(db)
+    row = _get_appointment_row(db, appointment_id)
+    reschedule = any(
+        key in changes and changes[key] != getattr(row, key)
+        for key in SCHEDULE_FIELDS
+    )
+
+    if not reschedule:
+        if changes:
+            updated = db.query(models.Appointment).filter(
+                models.Appointment.id == appointment_id
+            ).update(changes, synchronize_session=False)
+            if not updated:
+                db.rollback()
+                raise HTTPException(
+                    status_code=404, detail='Appointment not found.')
+            versions.bump(db, [row.doctor_id])
+            db.commit()
+        result = _patched(row, changes)
+        if changes:
+            events.feed.publish(
+                [events.appointment_change(events.UPDATED, result)])
+        result['doctor'] = {
+            'id': row.doctor_id,
+            'first_name': row.first_name,
+            'last_name': row.last_name,
+            'email': row.email,
+        }
+        return result
+
+    doctor_id = changes.get('doctor_id', row.doctor_id)
+    # The booking locks are taken before the write lock.
+    db.rollback()
+    with _booking(db, [row.doctor_id, doctor_id]):
+        # Read again under the booking locks.
+        row = _get_appointment_row(db, appointment_id)
+        result = _patched(row, changes)
+        # Runs the clinic hours validation of a full update.
+        schemas.AppointmentCreate(**result)
+        db_doctor = get_cached_doctor(db, result['doctor_id'])
+        if has_overlapping_appointment(
+            db,
+            result['doctor_id'],
+            result['start_dt'],
+            result['end_dt'],
+            exclude_id=appointment_id
+        ) or has_overlapping_series(
+            db,
+            result['doctor_id'],
+            result['start_dt'],
+            result['end_dt']
+        ):
+            raise HTTPException(
+                status_code=422,
+                detail='Overlapping appointment times.'
+            )
+
+        stats.apply_load(
+            db, row.doctor_id, row.start_dt, row.end_dt, sign=-1)
+        stats.apply_load(
+            db, result['doctor_id'], result['start_dt'], result['end_dt'])
+        versions.bump(db, [row.doctor_id, result['doctor_id']])
+        db.query(models.Appointment).filter(
+            models.Appointment.id == appointment_id
+        ).update(changes, synchronize_session=False)
+        db.commit()
+
+    events.feed.publish([events.appointment_change(
+        events.UPDATED, result, row.doctor_id)])
+    result['doctor'] = db_doctor.dict()
+    logger.info(
+        f'Appointment object with id #{appointment_id} successfully patched'
+    )
+    return result
+
+
+def delete_appointment(db: Session, appointment_id: int):
+    """
+    Deletes an appointment object.
+
+    Args:
+        appointment_id (int): The PK of the appointment object.
+    """
+    _begin_write(db)
+    db_appointment = get_appointment(db, appointment_id)
+    stats.apply_load(
+        db,
+        db_appointment.doctor_id,
+        db_appointment.start_dt,
+        db_appointment.end_dt,
+        sign=-1
+    )
+    versions.bump(db, [db_appointment.doctor_id])
+    change = events.appointment_change(events.DELETED, db_appointment)
+    db.delete(db_appointment)
+    db.commit()
+    events.feed.publish([change])
+
+
+def delete_appointments(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    doctor_id: int = None
+):
+    """
+    Deletes every appointment matching the filters in one transaction.
+
+    The appointments are deleted with a single statement. Their load is
+    removed from the summary with a fixed number of statements too.
+
+    Args:
+        start_date (date): Start date to filter appointments.
+        end_date (date): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+
+    Returns:
+        int: Number of deleted appointments.
+    """
+    with _booking(db, [doctor_id] if doctor_id else None):
+        rows = _filter_appointments(
+            db.query(
+                models.Appointment.id,
+                models.Appointment.doctor_id,
+                models.Appointment.start_dt,
+                models.Appointment.end_dt,
+            ),
+            start_date,
+            end_date,
+            doctor_id
+        ).all()
+
+        if rows:
+            loads = defaultdict(lambda: [0, 0])
+            for row in rows:
+                stats.add_load(
+                    loads, row.doctor_id, row.start_dt, row.end_dt, sign=-1)
+            stats.apply_loads(db, loads)
+            versions.bump(db, [row.doctor_id for row in rows])
+            _filter_appointments(
+                db.query(models.Appointment), start_date, end_date, doctor_id
+            ).delete(synchronize_session=False)
+        db.commit()
+
+    events.feed.publish(
+        events.appointment_change(events.DELETED, row) for row in rows)
+    logger.info(f'{len(rows)} appointments successfully deleted in bulk')
+    return len(rows)
+
+
+def _within_clinic_hours(local_start, local_end):
+    # Same rules as the validator of `schemas.AppointmentBase`.
+    start_of_day = local_end.replace(
+        hour=APPOINTMENT_START_TIME, minute=0, second=0, microsecond=0)
+    end_of_day = start_of_day.replace(hour=APPOINTMENT_END_TIME)
+    return (
+        local_start.date() == local_end.date() and
+        local_end.weekday() != NO_APPOINTMENT_WEEKDAY_CODE and
+        start_of_day <= local_start <= local_end <= end_of_day
+    )
+
+
+# Days the appointments being shifted are moved back by, out of the way of
+# every other appointment, in the middle of the shift.
+SHIFT_PARKING_DAYS = 365000
+
+
+def _shifted(column, *modifiers):
+    # SQLite's datetime() drops the fraction of the stored
+    # `YYYY-MM-DD HH:MM:SS.ffffff` strings, which whole days and minutes
+    # leave unchanged, so it is appended back.
+    return func.datetime(column, *modifiers).concat(func.substr(column, 20))
+
+
+def shift_appointments(
+    db: Session,
+    start_date: date,
+    end_date: date,
+    minutes: int,
+    doctor_id: int = None,
+    dry_run: bool = False
+):
+    """
+    Moves every appointment matching the filters by the same amount of time.
+
+    Either every appointment moves or none does. The moved appointments are
+    checked against the clinic hours and, with one range query, against the
+    appointments of the same doctors that stay. They are then moved by two
+    set based update statements.
+
+    Args:
+        start_date (date): Start date to filter appointments.
+        end_date (date): End date to filter appointments.
+        minutes (int): Minutes to move the appointments by, negative to
+            move them earlier.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        dry_run (bool, optional): Only run the checks.
+
+    Raises:
+        HTTPException: Raises 422 if a moved appointment would fall outside
+            the clinic hours or overlap an appointment that stays.
+
+    Returns:
+        int: Number of moved appointments.
+    """
+    delta = timedelta(minutes=minutes)
+
+    with _booking(db, [doctor_id] if doctor_id else None):
+        rows = _filter_appointments(
+            db.query(
+                models.Appointment.id,
+                models.Appointment.patient_name,
+                models.Appointment.comment,
+                models.Appointment.doctor_id,
+                models.Appointment.start_dt,
+                models.Appointment.end_dt,
+            ),
+            start_date,
+            end_date,
+            doctor_id
+        ).all()
+        if not rows or not minutes:
+            db.commit()
+            return 0
+
+        moved = [
+            (row.doctor_id, row.start_dt + delta, row.end_dt + delta)
+            for row in rows
+        ]
+        local_starts = utc_to_local_many([start for _, start, _ in moved])
+        local_ends = utc_to_local_many([end for _, _, end in moved])
+        for row, local_start, local_end in zip(rows, local_starts, local_ends):
+            if not _within_clinic_hours(local_start, local_end):
+                raise HTTPException(
+                    status_code=422,
+                    detail=f'Appointment #{row.id} would be moved outside '
+                    f'the permissible hours.'
+                )
+
+        # The moved appointments keep their spacing, so they can only
+        # overlap appointments that stay.
+        groups = defaultdict(list)
+        for doctor_id_, start_dt, end_dt in moved:
+            groups[doctor_id_].append((start_dt, end_dt))
+        staying = db.query(
+            models.Appointment.doctor_id,
+            models.Appointment.start_dt,
+            models.Appointment.end_dt,
+        ).filter(
+            models.Appointment.doctor_id.in_(groups),
+            models.Appointment.start_dt >
+            min(start for _, start, _ in moved) - MAX_APPOINTMENT_DURATION,
+            models.Appointment.start_dt < max(end for _, _, end in moved),
+            ~and_(*_date_conditions(start_date, end_date)),
+        ).order_by(
+            models.Appointment.doctor_id, models.Appointment.start_dt
+        ).all()
+        series_by_doctor = get_series_by_doctor(
+            db,
+            groups,
+            min(start for _, start, _ in moved),
+            max(end for _, _, end in moved)
+        )
+        for doctor_id_, doctor_series in series_by_doctor.items():
+            for start_dt, end_dt in groups[doctor_id_]:
+                if series.any_overlaps(doctor_series, start_dt, end_dt):
+                    raise HTTPException(
+                        status_code=422,
+                        detail='Overlapping appointment times.'
+                    )
+        for doctor_id_, stored in groupby(staying, lambda row: row.doctor_id):
+            stored = list(stored)
+            # Stored appointments never overlap, so their ends are sorted too.
+            stored_starts = [row.start_dt for row in stored]
+            stored_ends = [row.end_dt for row in stored]
+            for start_dt, end_dt in groups[doctor_id_]:
+                position = bisect_left(stored_starts, end_dt) - 1
+                if position >= 0 and stored_ends[position] > start_dt:
+                    raise HTTPException(
+                        status_code=422,
+                        detail='Overlapping appointment times.'
+                    )
+        if dry_run:
+            db.rollback()
+            return len(rows)
+
+        loads = defaultdict(lambda: [0, 0])
+        for row, (_, start_dt, end_dt) in zip(rows, moved):
+            stats.add_load(
+                loads, row.doctor_id, row.start_dt, row.end_dt, sign=-1)
+            stats.add_load(loads, row.doctor_id, start_dt, end_dt)
+        stats.apply_loads(db, loads)
+        versions.bump(db, groups)
+
+        # The overlap trigger checks each row as it is updated, in no given
+        # order. So the appointments are first parked far in the past, where
+        # they keep their spacing and nothing else is, then moved from there
+        # to their new times, where each is checked against the ones that
+        # stay. Two statements whatever the number of appointments.
+        table = models.Appointment.__table__
+        conditions = _date_conditions(start_date, end_date)
+        if doctor_id:
+            conditions.append(table.c.doctor_id == doctor_id)
+        parked = timedelta(days=-SHIFT_PARKING_DAYS)
+        db.execute(table.update().where(and_(*conditions)).values(
+            start_dt=_shifted(table.c.start_dt, f'{parked.days} days'),
+            end_dt=_shifted(table.c.end_dt, f'{parked.days} days')
+        ))
+        modifiers = (f'+{SHIFT_PARKING_DAYS} days', f'{minutes:+d} minutes')
+        db.execute(table.update().where(and_(
+            table.c.doctor_id.in_(groups),
+            table.c.start_dt.between(
+                min(row.start_dt for row in rows) + parked,
+                max(row.start_dt for row in rows) + parked
+            )
+        )).values(
+            start_dt=_shifted(table.c.start_dt, *modifiers),
+            end_dt=_shifted(table.c.end_dt, *modifiers)
+        ))
+        db.commit()
+
+    events.feed.publish(
+        events.appointment_change(events.UPDATED, dict(
+            row._asdict(), start_dt=start_dt, end_dt=end_dt))
+        for row, (_, start_dt, end_dt) in zip(rows, moved)
+    )
+    logger.info(f'{len(rows)} appointments successfully shifted by {delta}')
+    return len(rows)
+
+
+def get_series(db: Session, series_id: int):
+    """
+    Gets a series with its exceptions.
+
+    Args:
+        series_id (int): PK of the series object.
+
+    Raises:
+        HTTPException: Raises 404 if no series object is found.
+
+    Returns:
+        AppointmentSeries: A series instance.
+    """
+    db_series = db.query(models.AppointmentSeries).options(
+        selectinload(models.AppointmentSeries.exceptions)
+    ).filter(models.AppointmentSeries.id == series_id).first()
+    if not db_series:
+        raise HTTPException(status_code=404, detail='Series not found.')
+    return db_series
+
+
+def _expand_occurrences(db_series_list, start_date, end_date):
+    # Like appointment lists, the range is matched against the utc start
+    # and end of each occurrence.
+    start_dt = end_dt = None
+    if start_date:
+        start_dt = datetime(start_date.year, start_date.month, start_date.day)
+    if end_date:
+        end_dt = datetime(
+            end_date.year, end_date.month, end_date.day, 23, 59, 59)
+
+    occurrences = []
+    for db_series in db_series_list:
+        for index, occurrence_start, occurrence_end in series.occurrences(
+            db_series, start_dt, end_dt, series.skipped_days(db_series)
+        ):
+            if (
+                (start_dt is None or occurrence_start >= start_dt) and
+                (end_dt is None or occurrence_end <= end_dt)
+            ):
+                occurrences.append(schemas.Occurrence(
+                    series_id=db_series.id,
+                    index=index,
+                    patient_name=db_series.patient_name,
+                    comment=db_series.comment,
+                    start_dt=occurrence_start.replace(tzinfo=pytz.utc),
+                    end_dt=occurrence_end.replace(tzinfo=pytz.utc),
+                    doctor_id=db_series.doctor_id
+                ))
+    occurrences.sort(key=lambda occurrence: occurrence.start_dt)
+    return occurrences
+
+
+def get_occurrences(
+    db: Session,
+    series_id: int,
+    start_date: date = None,
+    end_date: date = None
+):
+    """
+    Expands the occurrences of a series within a range of dates.
+
+    Args:
+        series_id (int): PK of the series object.
+        start_date (date, optional): Only occurrences starting on or after.
+        end_date (date, optional): Only occurrences ending on or before.
+
+    Raises:
+        HTTPException: Raises 404 if no series object is found.
+
+    Returns:
+        List[schemas.Occurrence]: The occurrences, in order.
+    """
+    return _expand_occurrences(
+        [get_series(db, series_id)], start_date, end_date)
+
+
+def get_doctor_occurrences(
+    db: Session,
+    doctor_id: int,
+    start_date: date = None,
+    end_date: date = None
+):
+    """
+    Expands the occurrences of every series of a doctor within a range of
+    dates.
+
+    Only the series running during the range are read.
+
+    Args:
+        doctor_id (int): PK of the doctor object.
+        start_date (date, optional): Only occurrences starting on or after.
+        end_date (date, optional): Only occurrences ending on or before.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found.
+
+    Returns:
+        List[schemas.Occurrence]: The occurrences, in order.
+    """
+    get_cached_doctor(db, doctor_id)
+    doctor_series = get_series_by_doctor(
+        db,
+        [doctor_id],
+        datetime.combine(start_date or date.min, datetime.min.time()),
+        datetime.combine(end_date or date.max, datetime.max.time())
+    )[doctor_id]
+    return _expand_occurrences(doctor_series, start_date, end_date)
+
+
+def create_series(db: Session, appointment_series: schemas.SeriesCreate):
+    """
+    Creates a series from the given schema, after checking every occurrence
+    against the clinic hours and the bookings of the doctor.
+
+    Every occurrence has the weekday and local time of the first, which the
+    schema checks against the clinic hours. The appointments of the doctor
+    during the series are fetched with one range query and each is checked
+    against the occurrence around it. Other series of the doctor are
+    checked occurrence by occurrence.
+
+    Args:
+        appointment_series (schemas.SeriesCreate): Comes from the body of
+            the POST request.
+
+    Raises:
+        HTTPException: Raises 404 if the doctor is not found, or 422 if the
+            series is too long, an exception is not a date of the series or
+            an occurrence overlaps another booking.
+
+    Returns:
+        AppointmentSeries: A series instance.
+    """
+    start_dt = appointment_series.start_dt
+    end_dt = appointment_series.end_dt
+    db_series = models.AppointmentSeries(
+        patient_name=appointment_series.patient_name,
+        comment=appointment_series.comment,
+        start_dt=start_dt,
+        end_dt=end_dt,
+        interval_weeks=appointment_series.interval_weeks,
+        count=appointment_series.count,
+        until=appointment_series.until,
+        doctor_id=appointment_series.doctor_id,
+        exceptions=[
+            models.SeriesException(day=day)
+            for day in sorted(set(appointment_series.exceptions))
+        ]
+    )
+    if db_series.count is None:
+        db_series.count = series.occurrence_count(
+            series.first_day(db_series),
+            db_series.interval_weeks,
+            db_series.until
+        )
+    if not 0 < db_series.count <= series.MAX_OCCURRENCES:
+        raise HTTPException(
+            status_code=422,
+            detail=f'A series has from 1 to {series.MAX_OCCURRENCES} '
+            f'occurrences.'
+        )
+    for exception in db_series.exceptions:
+        if series.occurrence_index(db_series, exception.day) is None:
+            raise HTTPException(
+                status_code=422,
+                detail=f'{exception.day} is not a date of the series.'
+            )
+    step = timedelta(weeks=db_series.interval_weeks)
+    db_series.last_end_dt = end_dt + (db_series.count - 1) * step
+
+    doctor_id = db_series.doctor_id
+    with _booking(db, [doctor_id]):
+        get_cached_doctor(db, doctor_id)
+        stored = db.query(
+            models.Appointment.start_dt, models.Appointment.end_dt
+        ).filter(
+            models.Appointment.doctor_id == doctor_id,
+            models.Appointment.start_dt > start_dt - MAX_APPOINTMENT_DURATION,
+            models.Appointment.start_dt < db_series.last_end_dt,
+        )
+        other_series = get_series_by_doctor(
+            db, [doctor_id], start_dt, db_series.last_end_dt)[doctor_id]
+        skipped = series.skipped_days(db_series)
+        if any(
+            series.overlaps(db_series, row.start_dt, row.end_dt, skipped)
+            for row in stored
+        ) or any(
+            series.series_overlap(db_series, other) for other in other_series
+        ):
+            raise HTTPException(
+                status_code=422,
+                detail='Overlapping appointment times.'
+            )
+
+        db.add(db_series)
+        versions.bump(db, [doctor_id])
+        db.commit()
+    db.refresh(db_series)
+    logger.info(f'Series with id #{db_series.id} successfully created')
+    return db_series
+
+
+def skip_occurrence(db: Session, series_id: int, day: date):
+    """
+    Skips the occurrence of a series on a date, freeing its slot.
+
+    Args:
+        series_id (int): PK of the series object.
+        day (date): Date of the occurrence, in the clinic's timezone.
+
+    Raises:
+        HTTPException: Raises 404 if the series is not found or has no
+            occurrence on that date.
+    """
+    _begin_write(db)
+    db_series = get_series(db, series_id)
+    if series.occurrence_index(db_series, day) is None:
+        raise HTTPException(status_code=404, detail='Occurrence not found.')
+    if day not in {exception.day for exception in db_series.exceptions}:
+        db_series.exceptions.append(models.SeriesException(day=day))
+        versions.bump(db, [db_series.doctor_id])
+    db.commit()
+
+
+def delete_series(db: Session, series_id: int):
+    """
+    Deletes a series object and so all of its occurrences.
+
+    Args:
+        series_id (int): The PK of the series object.
+    """
+    _begin_write(db)
+    db_series = get_series(db, series_id)
+    versions.bump(db, [db_series.doctor_id])
+    db.delete(db_series)
     db.commit()
@@ -1,18 +1,139 @@
+import asyncio
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from functools import partial
+from itertools import count
+
+from sqlalchemy import and_
 from sqlalchemy import create_engine
 from sqlalchemy import event
+from sqlalchemy import func
+from sqlalchemy import select
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.pool import StaticPool
 
+from . import metrics
+
+
+# Defaults to an in memory database. Set to e.g. `sqlite:///./app.db` to
+# persist data in a file shared by every worker.
+SQLALCHEMY_DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite://')
+IN_MEMORY = SQLALCHEMY_DATABASE_URL in ('sqlite://', 'sqlite:///:memory:')
+
+# Doctors and their appointments are spread over this many databases, each
+# with its own engine. A file database URL must then contain `{shard}`,
+# e.g. `sqlite:///./app-{shard}.db`, replaced by the index of each shard.
+DB_SHARDS = int(os.environ.get('DB_SHARDS', 1))
+# The rows of shard k have PKs in (k * SHARD_ID_SPAN, (k + 1) *
+# SHARD_ID_SPAN], so the shard of a doctor or an appointment is known from
+# its PK alone.
+SHARD_ID_SPAN = 2 ** 40
+
+if DB_SHARDS > 1 and not IN_MEMORY and (
+    '{shard}' not in SQLALCHEMY_DATABASE_URL
+):
+    raise RuntimeError('DATABASE_URL must contain {shard} with DB_SHARDS.')
+
+# Threads serving requests, see `app.main`. By default as many as the
+# executor of the event loop has, since more only add contention for the
+# CPU and the database, see `benchmarks.threadpool`.
+THREADPOOL_SIZE = int(os.environ.get(
+    'THREADPOOL_SIZE', min(32, (os.cpu_count() or 1) + 4)))
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+# By default the pool can grow to one connection per thread, so a request
+# never waits for a connection held by another.
+DB_MAX_OVERFLOW = int(os.environ.get(
+    'DB_MAX_OVERFLOW', max(THREADPOOL_SIZE - DB_POOL_SIZE, 0)))
+DB_MMAP_SIZE = int(os.environ.get('DB_MMAP_SIZE', 256 * 1024 * 1024))
+# Negative values are in KiB.
+DB_CACHE_SIZE = int(os.environ.get('DB_CACHE_SIZE', -64 * 1024))
+# NORMAL only syncs the WAL at checkpoints, so the last commits can be lost
+# on power failure. FULL syncs it at every commit.
+DB_SYNCHRONOUS = os.environ.get('DB_SYNCHRONOUS', 'NORMAL')
+
+
+class ConnectionLock:
+    """
+    Lock handing out a fixed number of connections, by default one.
+
+    Threads wait for it blocking. Coroutines wait for it without blocking
+    the event loop or holding a thread, so a holder always finds a thread
+    to finish its work on. Waiters get it in turn, and it may be released
+    from any thread.
+    """
+
+    def __init__(self, slots: int = 1):
+        self._guard = threading.Lock()
+        self._free = slots
+        # Callables handing the lock over to each waiter, oldest first.
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._guard:
+            if self._free:
+                self._free -= 1
+                return
+            handed_over = threading.Event()
+            self._waiters.append(handed_over.set)
+        handed_over.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_event_loop()
+        with self._guard:
+            if self._free:
+                self._free -= 1
+                return
+            waiter = loop.create_future()
+            self._waiters.append(
+                partial(loop.call_soon_threadsafe, self._hand_over, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def _hand_over(self, waiter):
+        # A waiter cancelled in the meantime passes the lock on.
+        if waiter.done():
+            self.release()
+        else:
+            waiter.set_result(None)
+
+    def release(self):
+        with self._guard:
+            if not self._waiters:
+                self._free += 1
+                return
+            hand_over = self._waiters.popleft()
+        hand_over()
+
 
-SQLALCHEMY_DATABASE_URL = 'sqlite://'
+# Held by a `ShardedSession` from its first query on any shard until it is
+# closed, so every session of a request sees its own transaction. A single
+# lock for every shard keeps requests spanning shards from deadlocking.
+memory_lock = ConnectionLock()
+# Taken by the session of each request in file mode, so no more of them are
+# open than the pool of a shard has connections. Sessions are closed on the
+# loop once the response is sent, after their thread is freed, so there can
+# be more of them than threads.
+request_slots = ConnectionLock(DB_POOL_SIZE + DB_MAX_OVERFLOW)
 
-# IN MEMORY sqlite engine
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={'check_same_thread': False},
-    poolclass=StaticPool
-)
+
+class TimedQueuePool(QueuePool):
+    """ QueuePool recording how long each checkout waited. """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.record_pool_wait(time.perf_counter() - started)
 
 
 # Enforce foreign keys
@@ -20,16 +141,231 @@ def _fk_pragma_on_connect(dbapi_con, con_record):
     dbapi_con.execute('pragma foreign_keys=ON')
 
 
-event.listen(engine, 'connect', _fk_pragma_on_connect)
+# Tune file databases for concurrent reads
+def _wal_pragma_on_connect(dbapi_con, con_record):
+    # Let `_begin` emit BEGIN instead of the driver, which only begins a
+    # transaction before the first write.
+    dbapi_con.isolation_level = None
+    dbapi_con.execute('pragma journal_mode=WAL')
+    dbapi_con.execute(f'pragma synchronous={DB_SYNCHRONOUS}')
+    dbapi_con.execute(f'pragma mmap_size={DB_MMAP_SIZE}')
+    dbapi_con.execute(f'pragma cache_size={DB_CACHE_SIZE}')
+
+
+# SQLite has a single writer per database, and connections waiting for it
+# poll with sleeps of up to 100ms, so under load some writers starve until
+# they time out. Writers of this process queue on the lock of the engine
+# instead, leaving only one of them to wait on writers of other processes.
+_write_locks = {}
+
+
+# Transactions of connections with the `sqlite_immediate` execution option
+# take the write lock upfront. Reads done before their writes then cannot
+# be invalidated by another process committing in between.
+def _begin(conn):
+    if not conn.get_execution_options().get('sqlite_immediate'):
+        conn.execute('BEGIN')
+        return
+
+    write_lock = _write_locks[conn.engine]
+    write_lock.acquire()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+    except Exception:
+        write_lock.release()
+        raise
+    conn.info['holds_write_lock'] = True
+
+
+def _end(conn):
+    if conn.info.pop('holds_write_lock', False):
+        _write_locks[conn.engine].release()
+
+
+# PKs handed out by `next_id` in the current transaction, keyed by table.
+def _reset_ids(conn):
+    conn.info.pop('next_ids', None)
+
+
+def _create_engine(url: str):
+    if IN_MEMORY:
+        # IN MEMORY sqlite engine
+        shard_engine = create_engine(
+            url,
+            connect_args={'check_same_thread': False},
+            poolclass=StaticPool
+        )
+    else:
+        # File sqlite engine. Each pooled connection reads in parallel under
+        # WAL.
+        shard_engine = create_engine(
+            url,
+            connect_args={'check_same_thread': False},
+            poolclass=TimedQueuePool if metrics.METRICS_ENABLED else QueuePool,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW
+        )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=True, bind=engine)
+    event.listen(shard_engine, 'connect', _fk_pragma_on_connect)
+    if DB_SHARDS > 1:
+        event.listen(shard_engine, 'begin', _reset_ids)
+    if not IN_MEMORY:
+        _write_locks[shard_engine] = threading.Lock()
+        event.listen(shard_engine, 'connect', _wal_pragma_on_connect)
+        event.listen(shard_engine, 'begin', _begin)
+        event.listen(shard_engine, 'commit', _end)
+        event.listen(shard_engine, 'rollback', _end)
+    if metrics.METRICS_ENABLED:
+        event.listen(
+            shard_engine,
+            'before_cursor_execute',
+            metrics.before_cursor_execute
+        )
+        event.listen(
+            shard_engine,
+            'after_cursor_execute',
+            metrics.after_cursor_execute
+        )
+    return shard_engine
+
+
+engines = [
+    _create_engine(SQLALCHEMY_DATABASE_URL.replace('{shard}', str(shard)))
+    for shard in range(DB_SHARDS)
+]
+_shards = {engine: shard for shard, engine in enumerate(engines)}
+
+SessionLocals = [
+    sessionmaker(autocommit=False, autoflush=True, bind=engine)
+    for engine in engines
+]
+
+# The first shard, which holds every row unless `DB_SHARDS` is set.
+engine = engines[0]
+SessionLocal = SessionLocals[0]
 
 Base = declarative_base()
 
 
-# Dependency
-def get_db():
-    db = SessionLocal()
+def shard_of(pk: int):
+    """
+    Returns the index of the shard holding a doctor, an appointment or a
+    series.
+
+    Args:
+        pk (int): PK of the doctor, appointment or series.
+
+    Returns:
+        int: The shard index. PKs of no shard map to the nearest one, where
+            they are not found either.
+    """
+    return min(max((pk - 1) // SHARD_ID_SPAN, 0), DB_SHARDS - 1)
+
+
+def shard_of_email(email: str):
+    """
+    Returns the index of the home shard of an email, the one new doctors
+    with it go to.
+
+    Args:
+        email (str): The email of a doctor.
+
+    Returns:
+        int: The shard index.
+    """
+    return zlib.crc32(email.encode()) % DB_SHARDS
+
+
+def next_id(context):
+    """
+    Column default handing out the PKs of the shard being inserted into.
+
+    The first PK of each table is read within the transaction, which holds
+    the write lock of file databases, and the next ones are counted from it.
+    """
+    conn = context.connection
+    table = context.current_column.table
+    ids = conn.info.setdefault('next_ids', {})
+    if table.name not in ids:
+        lower = _shards[conn.engine] * SHARD_ID_SPAN
+        last_id = conn.execute(
+            select([func.max(table.c.id)]).where(and_(
+                table.c.id > lower, table.c.id <= lower + SHARD_ID_SPAN))
+        ).scalar()
+        ids[table.name] = count((last_id or lower) + 1)
+    return next(ids[table.name])
+
+
+class ShardedSession:
+    """
+    The sessions of a request, one per shard, each opened on first use.
+
+    A request about one doctor or appointment only opens the session of its
+    shard. Requests spanning doctors go through `app.shards`.
+
+    In memory, the first session opened takes `memory_lock` until `close`,
+    so concurrent code must use this rather than `SessionLocal`.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._held_lock = None
+
+    async def lock(self):
+        """
+        Takes `memory_lock` in memory, or one of `request_slots` in file
+        mode, without blocking the loop.
+        """
+        if self._held_lock is None:
+            lock = memory_lock if IN_MEMORY else request_slots
+            await lock.acquire_async()
+            self._held_lock = lock
+
+    def shard(self, index: int):
+        """ Returns the session of a shard. """
+        session = self._sessions.get(index)
+        if session is None:
+            if IN_MEMORY and self._held_lock is None:
+                memory_lock.acquire()
+                self._held_lock = memory_lock
+            session = self._sessions[index] = SessionLocals[index]()
+        return session
+
+    def for_doctor(self, doctor_id: int):
+        """ Returns the session of the shard holding a doctor. """
+        return self.shard(shard_of(doctor_id))
+
+    def for_appointment(self, appointment_id: int):
+        """ Returns the session of the shard holding an appointment. """
+        return self.shard(shard_of(appointment_id))
+
+    def for_series(self, series_id: int):
+        """ Returns the session of the shard holding a series. """
+        return self.shard(shard_of(series_id))
+
+    def for_email(self, email: str):
+        """ Returns the session of the shard new doctors with email go to. """
+        return self.shard(shard_of_email(email))
+
+    def all(self):
+        """ Returns the session of every shard, in shard order. """
+        return [self.shard(index) for index in range(DB_SHARDS)]
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+        if self._held_lock is not None:
+            lock, self._held_lock = self._held_lock, None
+            lock.release()
+
+
+# Dependency. Being async, the sessions are closed on the event loop rather
+# than on a thread of the pool, which may all be waiting for a connection
+# or for the lock held by this request.
+async def get_db():
+    db = ShardedSession()
+    await db.lock()
     try:
         yield db
     finally:
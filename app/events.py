@@ -0,0 +1,332 @@
+"""
+In process feed of appointment changes, served as server-sent events.
+
+The write functions of `app.crud` publish their changes after committing.
+Publishing encodes the events once, keeps them in a bounded history and
+hands them to the event loop, which adds them to the buffer of every
+matching subscriber. A buffer holds up to `EVENTS_BUFFER_SIZE` writes.
+Subscribers are coroutines rather than threads, and share one heartbeat
+timer, so an idle connection only costs its buffer.
+
+A subscriber whose buffer fills up is disconnected after its buffer is
+sent. Like any client reconnecting with `Last-Event-ID`, it then gets the
+events it missed from the history, or a `reset` event telling it to fetch
+its lists again if the history no longer goes back that far. Event ids are
+only valid within a process: behind several worker processes, a subscriber
+only sees the writes of its own.
+"""
+import asyncio
+import os
+import threading
+import uuid
+from collections import defaultdict
+from collections import deque
+from datetime import datetime
+from functools import partial
+
+from fastapi.responses import StreamingResponse
+
+from .utils import dumps_json
+
+
+EVENTS_BUFFER_SIZE = int(os.environ.get('EVENTS_BUFFER_SIZE', 256))
+EVENTS_HISTORY_SIZE = int(os.environ.get('EVENTS_HISTORY_SIZE', 4096))
+EVENTS_HEARTBEAT_SECONDS = float(
+    os.environ.get('EVENTS_HEARTBEAT_SECONDS', 15))
+
+CREATED = 'created'
+UPDATED = 'updated'
+DELETED = 'deleted'
+# Sent instead of the missed events when they are not in the history.
+RESET = 'reset'
+
+FIELDS = ('id', 'patient_name', 'comment', 'start_dt', 'end_dt', 'doctor_id')
+DELETED_FIELDS = ('id', 'doctor_id')
+
+# Event ids restart with the process, so tell them apart from the ones
+# handed out before.
+_EPOCH = uuid.uuid4().hex[:8]
+# Sent first, so clients wait a second before reconnecting.
+_RETRY_FRAME = b'retry: 1000\n\n'
+_HEARTBEAT_FRAME = b': heartbeat\n\n'
+
+
+def _frame(seq: int, event_type: str, data: bytes):
+    return (
+        f'id: {_EPOCH}-{seq}\nevent: {event_type}\ndata: '.encode() +
+        data + b'\n\n'
+    )
+
+
+def _parse_event_id(event_id: str):
+    """ Returns the sequence number of an event id of this process. """
+    epoch, _, seq = event_id.partition('-')
+    if epoch != _EPOCH or not seq.isdigit():
+        return None
+    return int(seq)
+
+
+def appointment_change(event_type: str, appointment,
+                       previous_doctor_id: int = None):
+    """
+    Returns the change of an appointment, for `ChangeFeed.publish`.
+
+    Args:
+        event_type (str): `CREATED`, `UPDATED` or `DELETED`.
+        appointment (object): The appointment as committed, an `Appointment`,
+            a row or a dict of its columns. Only the id and doctor_id of a
+            deleted appointment are sent.
+        previous_doctor_id (int, optional): Doctor the appointment was moved
+            from, whose subscribers get the update too.
+
+    Returns:
+        tuple: The event type, data and ids of the doctors concerned.
+    """
+    get = appointment.get if isinstance(appointment, dict) else partial(
+        getattr, appointment)
+    data = {}
+    for key in DELETED_FIELDS if event_type == DELETED else FIELDS:
+        value = get(key)
+        data[key] = value.isoformat() if isinstance(value, datetime) else value
+    doctor_ids = {data['doctor_id'], previous_doctor_id} - {None}
+    return event_type, data, doctor_ids
+
+
+class Subscriber:
+    """ A stream of the feed, with its bounded buffer of writes. """
+
+    __slots__ = ('doctor_id', 'queue', 'last_seq', 'overflowed')
+
+    def __init__(self, doctor_id: int, last_seq: int):
+        self.doctor_id = doctor_id
+        self.queue = asyncio.Queue(EVENTS_BUFFER_SIZE)
+        self.last_seq = last_seq
+        self.overflowed = False
+
+
+class ChangeFeed:
+    """
+    Fans the published changes out to subscribers on the event loop.
+
+    `publish` may be called from any thread. Subscribers are only added,
+    removed and fed on the event loop, so only the sequence, history,
+    subscriber count and hand over to the loop are guarded by a lock.
+    """
+
+    def __init__(self, history_size: int):
+        self.overflows = 0
+        self._seq = 0
+        self._history = deque(maxlen=history_size)
+        self._subscribers = 0
+        self._lock = threading.Lock()
+        self._loop = None
+        self._heartbeat = None
+        # Subscribers to every change, and subscribers per doctor.
+        self._everything = set()
+        self._by_doctor = defaultdict(set)
+
+    def publish(self, changes):
+        """
+        Publishes committed changes. Must be called after the commit.
+
+        Args:
+            changes (Iterable[tuple]): Changes from `appointment_change`.
+        """
+        encoded = [
+            (event_type, dumps_json(data), doctor_ids)
+            for event_type, data, doctor_ids in changes
+        ]
+        if not encoded:
+            return
+
+        events = []
+        with self._lock:
+            for event_type, data, doctor_ids in encoded:
+                self._seq += 1
+                event = (
+                    self._seq, doctor_ids, _frame(self._seq, event_type, data))
+                self._history.append(event)
+                events.append(event)
+            # Handed over under the lock, so the loop dispatches the writes
+            # in the order of their events. A subscriber whose last event
+            # is past a write skips it, and would drop it if it came later.
+            # A subscriber added after the lock is released gets the events
+            # from the history instead.
+            loop = self._loop if self._subscribers else None
+            if loop is not None and not loop.is_closed():
+                loop.call_soon_threadsafe(self._dispatch, events)
+
+    def _dispatch(self, events):
+        # The events of a write take one slot of a buffer however many they
+        # are, and are joined once for all the subscribers getting them.
+        overflowed = []
+        frames = b''.join(frame for _, _, frame in events)
+        for subscriber in self._everything:
+            self._push(subscriber, events, frames, overflowed)
+        for doctor_id in set().union(*(ids for _, ids, _ in events)):
+            subscribers = self._by_doctor.get(doctor_id)
+            if subscribers:
+                frames = b''.join(
+                    frame for _, doctor_ids, frame in events
+                    if doctor_id in doctor_ids
+                )
+                for subscriber in subscribers:
+                    self._push(subscriber, events, frames, overflowed)
+        for subscriber in overflowed:
+            self.unsubscribe(subscriber)
+
+    def _push(self, subscriber, events, frames, overflowed):
+        last_seq = events[-1][0]
+        if subscriber.overflowed or subscriber.last_seq >= last_seq:
+            return
+        if subscriber.last_seq >= events[0][0]:
+            # Some of the events were already sent from the history.
+            frames = b''.join(
+                frame for seq, doctor_ids, frame in events
+                if seq > subscriber.last_seq and (
+                    subscriber.doctor_id is None or
+                    subscriber.doctor_id in doctor_ids)
+            )
+        if frames:
+            try:
+                subscriber.queue.put_nowait(frames)
+            except asyncio.QueueFull:
+                subscriber.overflowed = True
+                overflowed.append(subscriber)
+                return
+        subscriber.last_seq = last_seq
+
+    def _send_heartbeats(self):
+        for subscribers in [self._everything, *self._by_doctor.values()]:
+            for subscriber in subscribers:
+                if not subscriber.queue.full():
+                    subscriber.queue.put_nowait(_HEARTBEAT_FRAME)
+        self._heartbeat = self._loop.call_later(
+            EVENTS_HEARTBEAT_SECONDS, self._send_heartbeats)
+
+    def subscribe(self, doctor_id: int = None, last_event_id: str = None):
+        """
+        Adds a subscriber. Must be called on the event loop.
+
+        Args:
+            doctor_id (int, optional): Only get the changes of this doctor.
+            last_event_id (str, optional): Id of the last event received,
+                to get the ones published since from the history.
+
+        Returns:
+            tuple: The `Subscriber` and the frames to send before the ones
+                of its queue.
+        """
+        loop = asyncio.get_event_loop()
+        with self._lock:
+            subscriber = Subscriber(doctor_id, self._seq)
+            backlog = []
+            if last_event_id is not None:
+                seq = _parse_event_id(last_event_id)
+                oldest = self._history[0][0] if self._history else 1
+                if seq is None or not oldest - 1 <= seq <= self._seq:
+                    backlog.append(_frame(self._seq, RESET, b'{}'))
+                else:
+                    backlog.extend(
+                        frame for seq_, doctor_ids, frame in self._history
+                        if seq_ > seq and (
+                            doctor_id is None or doctor_id in doctor_ids)
+                    )
+            self._subscribers += 1
+            self._loop = loop
+
+        if doctor_id is None:
+            self._everything.add(subscriber)
+        else:
+            self._by_doctor[doctor_id].add(subscriber)
+        if self._heartbeat is None:
+            self._heartbeat = loop.call_later(
+                EVENTS_HEARTBEAT_SECONDS, self._send_heartbeats)
+        return subscriber, backlog
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """ Removes a subscriber, if not removed yet. """
+        if subscriber.doctor_id is None:
+            subscribers = self._everything
+        else:
+            subscribers = self._by_doctor.get(subscriber.doctor_id, set())
+        if subscriber not in subscribers:
+            return
+        subscribers.remove(subscriber)
+        if subscriber.doctor_id is not None and not subscribers:
+            del self._by_doctor[subscriber.doctor_id]
+        if subscriber.overflowed:
+            self.overflows += 1
+
+        with self._lock:
+            self._subscribers -= 1
+            idle = not self._subscribers
+        if idle and self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+    def stats(self):
+        """
+        Returns the counters of the feed.
+
+        Returns:
+            dict: The number of subscribers, id of the last event, events
+                in the history and subscribers disconnected for being too
+                slow.
+        """
+        with self._lock:
+            return {
+                'subscribers': self._subscribers,
+                'last_event_id': f'{_EPOCH}-{self._seq}',
+                'history': len(self._history),
+                'overflows': self.overflows,
+            }
+
+
+feed = ChangeFeed(EVENTS_HISTORY_SIZE)
+
+
+class EventStreamResponse(StreamingResponse):
+    """
+    Streams the changes of every appointment, or of one doctor's, as
+    server-sent events until the client disconnects.
+    """
+
+    media_type = 'text/event-stream'
+
+    def __init__(self, doctor_id: int = None, last_event_id: str = None):
+        self.doctor_id = doctor_id
+        self.last_event_id = last_event_id
+        super().__init__(
+            self._stream(),
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    async def _stream(self):
+        subscriber, backlog = feed.subscribe(
+            self.doctor_id, self.last_event_id)
+        try:
+            yield _RETRY_FRAME + b''.join(backlog)
+            queue = subscriber.queue
+            while not (subscriber.overflowed and queue.empty()):
+                frames = [await queue.get()]
+                while not queue.empty():
+                    frames.append(queue.get_nowait())
+                yield b''.join(frames)
+        finally:
+            feed.unsubscribe(subscriber)
+
+    async def __call__(self, scope, receive, send):
+        # Stop streaming as soon as the client disconnects, so its
+        # subscriber goes away right then rather than at the next event.
+        tasks = [
+            asyncio.ensure_future(self.stream_response(send)),
+            asyncio.ensure_future(self.listen_for_disconnect(receive)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.body_iterator.aclose()
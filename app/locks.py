@@ -0,0 +1,42 @@
+import os
+import threading
+from contextlib import contextmanager
+
+# Bookings of doctors sharing a stripe are serialized in this process, the
+# others run in parallel in file databases. Set to 1 for a single global
+# booking lock. In memory, requests are serialized anyway by
+# `app.database.memory_lock`.
+BOOKING_LOCK_STRIPES = int(os.environ.get('BOOKING_LOCK_STRIPES', 64))
+
+_stripes = [threading.Lock() for _ in range(BOOKING_LOCK_STRIPES)]
+
+
+def _stripe(doctor_id: int):
+    return doctor_id % BOOKING_LOCK_STRIPES
+
+
+@contextmanager
+def doctor_locks(doctor_ids):
+    """
+    Holds the booking locks of the given doctors.
+
+    Stripes are always acquired in the same order so two bookings touching
+    the same doctors cannot deadlock.
+
+    Args:
+        doctor_ids (Iterable[int]): PKs of the doctors to lock, or None to
+            lock every doctor.
+    """
+    if doctor_ids is None:
+        indexes = range(BOOKING_LOCK_STRIPES)
+    else:
+        indexes = sorted({_stripe(doctor_id) for doctor_id in doctor_ids})
+    acquired = []
+    try:
+        for index in indexes:
+            _stripes[index].acquire()
+            acquired.append(index)
+        yield
+    finally:
+        for index in reversed(acquired):
+            _stripes[index].release()
@@ -1,3 +1,7 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from fastapi import FastAPI
 from fastapi import Request
 from fastapi import status
@@ -5,25 +9,92 @@ from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from fastapi.responses import PlainTextResponse
 
-from .database import engine
+from .aio import close_idle
+from .database import THREADPOOL_SIZE
+from .database import engines
+from .metrics import METRICS_ENABLED
+from .metrics import METRICS_PATH
+from .metrics import MetricsMiddleware
+from .metrics import record_startup
+from .metrics import render as render_metrics
 from .models import Base
 from .routers.appointments import router as appointment_router
+from .routers.calendar import router as calendar_router
 from .routers.doctors import router as doctor_router
+from .routers.series import router as series_router
+from .snapshot import SNAPSHOT_INTERVAL
+from .snapshot import SNAPSHOTS_ENABLED
+from .snapshot import dump_app_database
+from .snapshot import dump_periodically
+from .snapshot import restore_app_database
+from .utils import NEXT_CURSOR_HEADER
+
+_import_started = time.perf_counter()
+
+restore_app_database()
 
-Base.metadata.create_all(bind=engine)
+_create_all_started = time.perf_counter()
+for shard_engine in engines:
+    Base.metadata.create_all(bind=shard_engine)
+record_startup('create_all', time.perf_counter() - _create_all_started)
 
 app = FastAPI()
 
+
+# Sync handlers and the `get_db` dependency run on the default executor of
+# the event loop, so its size caps how many requests are served at once.
+@app.on_event('startup')
+async def configure_threadpool():
+    loop = asyncio.get_event_loop()
+    loop.set_default_executor(
+        ThreadPoolExecutor(max_workers=THREADPOOL_SIZE))
+
+
+_snapshot_task = None
+
+
+@app.on_event('startup')
+async def start_snapshots():
+    global _snapshot_task
+    if SNAPSHOTS_ENABLED and SNAPSHOT_INTERVAL > 0:
+        _snapshot_task = asyncio.ensure_future(dump_periodically())
+    # From the snapshot restore to the end of the startup handlers.
+    record_startup('ready', time.perf_counter() - _import_started)
+
+
+@app.on_event('shutdown')
+async def stop_snapshots():
+    if _snapshot_task is not None:
+        _snapshot_task.cancel()
+    if SNAPSHOTS_ENABLED:
+        await asyncio.get_event_loop().run_in_executor(
+            None, dump_app_database)
+
+
+@app.on_event('shutdown')
+async def close_async_db():
+    await close_idle()
+
 origins = ['http://localhost', 'http://localhost:3000']
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=['*'],
-    allow_headers=['*']
+    allow_headers=['*'],
+    expose_headers=[NEXT_CURSOR_HEADER, 'ETag']
 )
 
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get(METRICS_PATH, include_in_schema=False)
+    async def get_metrics():
+        return PlainTextResponse(
+            render_metrics(), media_type='text/plain; version=0.0.4')
+
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(
@@ -49,3 +120,16 @@ app.include_router(
     tags=['doctors'],
     responses={404: {'description': 'Not Found'}}
 )
+
+app.include_router(
+    series_router,
+    prefix='/series',
+    tags=['series'],
+    responses={404: {'description': 'Not Found'}}
+)
+
+app.include_router(
+    calendar_router,
+    prefix='/calendar',
+    tags=['calendar']
+)
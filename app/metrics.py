@@ -0,0 +1,302 @@
+import asyncio
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from fastapi.routing import APIRoute
+
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+# Requests slower than this many seconds are logged with their statements.
+# Unset by default since keeping the statements costs memory per request.
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', 0))
+METRICS_PATH = '/metrics'
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_stats = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """ Measurements of the request being served. """
+
+    __slots__ = (
+        'route',
+        'statements',
+        'sql_seconds',
+        'pool_wait_seconds',
+        'serialization_seconds',
+        'endpoint_done',
+        'statement_log',
+        '_statement_started',
+    )
+
+    def __init__(self, log_statements: bool):
+        self.route = None
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.endpoint_done = None
+        self.statement_log = [] if log_statements else None
+        self._statement_started = None
+
+
+class RouteMetrics:
+    """ Aggregated measurements of every request to a route. """
+
+    __slots__ = (
+        'buckets',
+        'count',
+        'duration_seconds',
+        'statements',
+        'sql_seconds',
+        'pool_wait_seconds',
+        'serialization_seconds',
+    )
+
+    def __init__(self):
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.count = 0
+        self.duration_seconds = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+    def observe(self, duration: float, stats: RequestStats):
+        self.buckets[bisect_left(DURATION_BUCKETS, duration)] += 1
+        self.count += 1
+        self.duration_seconds += duration
+        self.statements += stats.statements
+        self.sql_seconds += stats.sql_seconds
+        self.pool_wait_seconds += stats.pool_wait_seconds
+        self.serialization_seconds += stats.serialization_seconds
+
+
+# Keyed by (method, route). Only touched from the event loop thread.
+_routes = {}
+# Seconds taken by each startup phase, keyed by phase.
+_startup = {}
+# Seconds taken, size in bytes and unix time of the last snapshot.
+_snapshot = {}
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats._statement_started = time.perf_counter()
+        if stats.statement_log is not None:
+            stats.statement_log.append(statement)
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+                         executemany):
+    stats = _request_stats.get()
+    if stats is not None and stats._statement_started is not None:
+        stats.statements += 1
+        stats.sql_seconds += time.perf_counter() - stats._statement_started
+        stats._statement_started = None
+
+
+def record_pool_wait(seconds: float):
+    """
+    Adds time spent waiting for a pooled connection to the current request.
+
+    Args:
+        seconds (float): Time spent in the pool checkout.
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+
+def record_startup(phase: str, seconds: float):
+    """
+    Records the time taken by a startup phase.
+
+    Args:
+        phase (str): Name of the phase, e.g. `create_all`.
+        seconds (float): Time taken.
+    """
+    _startup[phase] = seconds
+
+
+def record_snapshot(seconds: float, size: int):
+    """
+    Records the last snapshot of the in memory database.
+
+    Args:
+        seconds (float): Time taken to write it.
+        size (int): Size of the snapshot file in bytes.
+    """
+    _snapshot.update(seconds=seconds, bytes=size, timestamp=time.time())
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware measuring the duration of each request and aggregating
+    the measurements made while serving it per method and route.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(log_statements=SLOW_REQUEST_SECONDS > 0)
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = time.perf_counter() - started
+            _request_stats.reset(token)
+
+            key = (scope['method'], stats.route or 'unmatched')
+            route_metrics = _routes.get(key)
+            if route_metrics is None:
+                route_metrics = _routes[key] = RouteMetrics()
+            route_metrics.observe(duration, stats)
+
+            if SLOW_REQUEST_SECONDS and duration >= SLOW_REQUEST_SECONDS:
+                logger.warning(
+                    f'Slow request {scope["method"]} {scope["path"]} took '
+                    f'{duration:.3f}s with {stats.statements} statements:\n'
+                    + '\n'.join(stats.statement_log)
+                )
+
+
+class MetricsRoute(APIRoute):
+    """
+    Route recording its path template and the time spent serializing the
+    response of its endpoint into the current request's measurements.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+
+        if asyncio.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def timed_call(**values):
+                try:
+                    return await call(**values)
+                finally:
+                    _mark_endpoint_done()
+        else:
+            @functools.wraps(call)
+            def timed_call(**values):
+                try:
+                    return call(**values)
+                finally:
+                    _mark_endpoint_done()
+
+        self.dependant.call = timed_call
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            stats = _request_stats.get()
+            if stats is None:
+                return await handler(request)
+
+            stats.route = path
+            response = await handler(request)
+            if stats.endpoint_done is not None:
+                stats.serialization_seconds += (
+                    time.perf_counter() - stats.endpoint_done)
+            return response
+
+        return timed_handler
+
+
+def _mark_endpoint_done():
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.endpoint_done = time.perf_counter()
+
+
+def render():
+    """
+    Renders the aggregated measurements in the Prometheus text format.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = [
+        '# HELP http_request_duration_seconds Duration of HTTP requests.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (method, route), metrics in sorted(_routes.items()):
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS, metrics.buckets):
+            cumulative += count
+            lines.append(
+                f'http_request_duration_seconds_bucket'
+                f'{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines.append(
+            f'http_request_duration_seconds_bucket'
+            f'{{{labels},le="+Inf"}} {metrics.count}'
+        )
+        lines.append(
+            f'http_request_duration_seconds_sum{{{labels}}} '
+            f'{metrics.duration_seconds}'
+        )
+        lines.append(
+            f'http_request_duration_seconds_count{{{labels}}} '
+            f'{metrics.count}'
+        )
+
+    counters = (
+        ('sql_statements_total', 'statements',
+         'SQL statements executed.'),
+        ('sql_duration_seconds_total', 'sql_seconds',
+         'Time spent executing SQL statements.'),
+        ('db_pool_wait_seconds_total', 'pool_wait_seconds',
+         'Time spent waiting for a pooled connection.'),
+        ('serialization_seconds_total', 'serialization_seconds',
+         'Time spent validating and encoding responses.'),
+    )
+    for name, attribute, description in counters:
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} counter')
+        for (method, route), metrics in sorted(_routes.items()):
+            lines.append(
+                f'{name}{{method="{method}",route="{route}"}} '
+                f'{getattr(metrics, attribute)}'
+            )
+
+    if _startup:
+        lines.append(
+            '# HELP app_startup_seconds Time taken by each startup phase.')
+        lines.append('# TYPE app_startup_seconds gauge')
+        for phase, seconds in sorted(_startup.items()):
+            lines.append(f'app_startup_seconds{{phase="{phase}"}} {seconds}')
+
+    gauges = (
+        ('snapshot_last_duration_seconds', 'seconds',
+         'Time taken to write the last snapshot.'),
+        ('snapshot_last_size_bytes', 'bytes',
+         'Size of the last snapshot.'),
+        ('snapshot_last_timestamp_seconds', 'timestamp',
+         'Unix time the last snapshot was written.'),
+    )
+    for name, key, description in gauges:
+        if key in _snapshot:
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_snapshot[key]}')
+
+    return '\n'.join(lines) + '\n'
@@ -1,14 +1,27 @@
 from datetime import datetime
 
 from sqlalchemy import Column
+from sqlalchemy import DDL
+from sqlalchemy import Date
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import Text
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 
+from .database import DB_SHARDS
 from .database import Base
+from .database import next_id
+from .utils import MAX_APPOINTMENT_DURATION
+
+
+OVERLAP_ERROR = 'Overlapping appointment times.'
+
+# With several shards, PKs are handed out from the range of the shard.
+_ID_DEFAULT = next_id if DB_SHARDS > 1 else None
 
 
 class Doctor(Base):
@@ -16,7 +29,7 @@ class Doctor(Base):
 
     __tablename__ = 'doctors'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=_ID_DEFAULT)
     first_name = Column(String, index=True)
     last_name = Column(String, index=True)
     email = Column(String, unique=True, index=True)
@@ -33,7 +46,7 @@ class Appointment(Base):
 
     __tablename__ = 'appointments'
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, default=_ID_DEFAULT)
     patient_name = Column(String, index=True)
     comment = Column(Text, nullable=True)
     start_dt = Column(DateTime, default=datetime.utcnow)
@@ -41,3 +54,156 @@ class Appointment(Base):
     doctor_id = Column(Integer, ForeignKey('doctors.id', ondelete='CASCADE'))
 
     doctor = relationship('Doctor', back_populates='appointments')
+
+    __table_args__ = (
+        # Serves the overlap range query done on every booking.
+        Index(
+            'ix_appointments_doctor_id_start_dt_end_dt',
+            'doctor_id',
+            'start_dt',
+            'end_dt'
+        ),
+        # Serve the (start_dt, id) keyset pagination of appointment lists.
+        Index('ix_appointments_start_dt_id', 'start_dt', 'id'),
+        Index(
+            'ix_appointments_doctor_id_start_dt_id',
+            'doctor_id',
+            'start_dt',
+            'id'
+        ),
+    )
+
+
+# Rejects overlapping appointments even when two writers pass the overlap
+# check of `crud` at the same time. The range is bounded like the check so
+# it is served by the (doctor_id, start_dt, end_dt) index.
+_OVERLAP_CONDITION = f"""
+    EXISTS (
+        SELECT 1 FROM appointments
+        WHERE doctor_id = NEW.doctor_id
+            AND start_dt > datetime(
+                NEW.start_dt,
+                '-{int(MAX_APPOINTMENT_DURATION.total_seconds())} seconds'
+            )
+            AND start_dt < NEW.end_dt
+            AND end_dt > NEW.start_dt
+            {{extra}}
+    )
+"""
+
+event.listen(Appointment.__table__, 'after_create', DDL(f"""
+    CREATE TRIGGER IF NOT EXISTS appointments_no_overlap_insert
+    BEFORE INSERT ON appointments
+    WHEN {_OVERLAP_CONDITION.format(extra='')}
+    BEGIN
+        SELECT RAISE(ABORT, '{OVERLAP_ERROR}');
+    END
+"""))
+event.listen(Appointment.__table__, 'after_create', DDL(f"""
+    CREATE TRIGGER IF NOT EXISTS appointments_no_overlap_update
+    BEFORE UPDATE OF doctor_id, start_dt, end_dt ON appointments
+    WHEN {_OVERLAP_CONDITION.format(extra='AND id != NEW.id')}
+    BEGIN
+        SELECT RAISE(ABORT, '{OVERLAP_ERROR}');
+    END
+"""))
+
+
+class AppointmentSeries(Base):
+    """
+    SQLAlchemy model for an appointment repeated every `interval_weeks`
+    weeks.
+
+    Only the first occurrence is stored. The others are expanded from it by
+    `app.series` within the range a read or check asks about.
+    """
+
+    __tablename__ = 'appointment_series'
+
+    id = Column(Integer, primary_key=True, index=True, default=_ID_DEFAULT)
+    patient_name = Column(String)
+    comment = Column(Text, nullable=True)
+    # Bounds of the first occurrence, naive utc.
+    start_dt = Column(DateTime)
+    end_dt = Column(DateTime)
+    interval_weeks = Column(Integer, nullable=False, default=1)
+    # Number of occurrences, skipped ones included. Computed from `until`
+    # when the series was created with an end date.
+    count = Column(Integer, nullable=False)
+    until = Column(Date, nullable=True)
+    # End of the last occurrence, to bound range queries.
+    last_end_dt = Column(DateTime)
+    doctor_id = Column(Integer, ForeignKey('doctors.id', ondelete='CASCADE'))
+
+    doctor = relationship('Doctor')
+    exceptions = relationship(
+        'SeriesException',
+        order_by='SeriesException.day',
+        cascade='all, delete-orphan',
+        passive_deletes=True
+    )
+
+    __table_args__ = (
+        # Serves the range query done on every booking.
+        Index(
+            'ix_appointment_series_doctor_id_start_dt_last_end_dt',
+            'doctor_id',
+            'start_dt',
+            'last_end_dt'
+        ),
+    )
+
+
+class SeriesException(Base):
+    """ SQLAlchemy model for a skipped occurrence of a series. """
+
+    __tablename__ = 'appointment_series_exceptions'
+
+    series_id = Column(
+        Integer,
+        ForeignKey('appointment_series.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    # Date of the skipped occurrence, in the clinic's timezone.
+    day = Column(Date, primary_key=True)
+
+
+class DoctorHourlyLoad(Base):
+    """
+    SQLAlchemy model for the booked time of a doctor in one clinic hour.
+
+    Kept up to date by the appointment writes in `crud` so load statistics
+    do not have to scan appointments. `day` and `hour` are in the clinic's
+    timezone.
+    """
+
+    __tablename__ = 'doctor_hourly_loads'
+
+    doctor_id = Column(
+        Integer,
+        ForeignKey('doctors.id', ondelete='CASCADE'),
+        primary_key=True
+    )
+    day = Column(Date, primary_key=True)
+    hour = Column(Integer, primary_key=True)
+    booked_seconds = Column(Integer, nullable=False, default=0)
+    # Appointments starting within this hour.
+    appointments = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_doctor_hourly_loads_day', 'day'),
+    )
+
+
+class ChangeVersion(Base):
+    """
+    SQLAlchemy model for a counter bumped by every write within a scope.
+
+    Scopes are `global` and `doctor:<id>`. Read endpoints derive their ETags
+    from these so conditional requests skip the appointment table.
+    """
+
+    __tablename__ = 'change_versions'
+
+    scope = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
@@ -4,54 +4,328 @@ from typing import Optional
 
 from fastapi import APIRouter
 from fastapi import Depends
-from sqlalchemy.orm import Session
+from fastapi import Header
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
+from fastapi.responses import StreamingResponse
 
 from app import crud
+from app import events
 from app import schemas
+from app import shards
+from app import versions
+from app.aio import ASYNC_DB
+from app.aio import AsyncShardedSession
+from app.aio import get_async_db
+from app.database import ShardedSession
 from app.database import get_db
+from app.metrics import MetricsRoute
+from app.utils import FAST_JSON_RESPONSES
+from app.utils import NEXT_CURSOR_HEADER
+from app.utils import dumps_json
+from app.utils import etag_matches
+from app.utils import id_list
+from app.utils import not_modified
 
 
-router = APIRouter()
+router = APIRouter(route_class=MetricsRoute)
 
 
 @router.get('/', response_model=List[schemas.Appointment])
 def get_appointments(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    db: Session = Depends(get_db)
+    after: Optional[str] = None,
+    db: ShardedSession = Depends(get_db)
 ):
     """
     Router to get a list of `Appointment` objects.
 
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header. Returns 304 if `If-None-Match` matches the current `ETag`.
+
     Args:
     - **skip** (int, optional): Hints where to start during pagination.
         Defaults to 0.
     - **limit** (int, optional): Hints where to end during pagination.
         Defaults to 100.
+    - **after** (str, optional): Cursor of the page to get. Takes
+        precedence over skip.
     """
-    db_appointments = crud.get_appointments(
-        db, skip=skip, limit=limit, start_date=start_date, end_date=end_date)
+    etag = versions.global_etag(db.all(), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if FAST_JSON_RESPONSES:
+        content, next_cursor = shards.get_appointments_json(
+            db,
+            skip=skip,
+            limit=limit,
+            start_date=start_date,
+            end_date=end_date,
+            after=after
+        )
+        response = Response(
+            content, media_type='application/json', headers={'ETag': etag})
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+
+    db_appointments = shards.get_appointments(
+        db,
+        skip=skip,
+        limit=limit,
+        start_date=start_date,
+        end_date=end_date,
+        after=after
+    )
+    next_cursor = crud.get_appointments_cursor(db_appointments, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    response.headers['ETag'] = etag
     return db_appointments
 
 
-@router.get('/{appointment_id}/', response_model=schemas.Appointment)
-def get_appointment(appointment_id: int, db: Session = Depends(get_db)):
+@router.get('/search/', response_model=List[schemas.Appointment])
+def search_appointments(
+    q: str,
+    limit: int = Query(20, gt=0, le=100),
+    after: Optional[str] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Searches `Appointment` objects by patient name, best match first.
+
+    Matches are ranked `SEARCH_WINDOW` at a time from the newest, so an
+    older match can come after newer, worse ones. The matches are encoded
+    directly from their rows rather than through the response model.
+
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header.
+
+    Args:
+    - **q** (str): Words matching the start of words of the patient name,
+        e.g. `jo sm` matches `John Smith`.
+    - **limit** (int, optional): Maximum number of results. Defaults to 20.
+    - **after** (str, optional): Cursor of the page to get.
+    """
+    content, next_cursor = shards.search_appointments_json(
+        db, q=q, limit=limit, after=after)
+    response = Response(content, media_type='application/json')
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+@router.get('/export/')
+def export_appointments(
+    export_format: str = Query(
+        'ndjson', alias='format', regex='^(ndjson|csv)$'),
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    doctor_id: Optional[int] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Streams all the `Appointment` objects matching the filters.
+
+    Args:
+    - **format** (str, optional): `ndjson` or `csv`. Defaults to `ndjson`.
+    - **start_date** (date, optional): Start date to filter appointments.
+    - **end_date** (date, optional): End date to filter appointments.
+    - **doctor_id** (int, optional): Filter appointments based on doctor_id.
+    """
+    return StreamingResponse(
+        shards.export_appointments(
+            db,
+            export_format=export_format,
+            start_date=start_date,
+            end_date=end_date,
+            doctor_id=doctor_id
+        ),
+        media_type=EXPORT_MEDIA_TYPES[export_format]
+    )
+
+
+@router.delete('/', response_model=schemas.AffectedAppointments)
+def delete_appointments(
+    start_date: date,
+    end_date: date,
+    doctor_id: Optional[int] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Deletes every `Appointment` object matching the filters at once.
+
+    Args:
+    - **start_date** (date): Start date to filter appointments.
+    - **end_date** (date): End date to filter appointments.
+    - **doctor_id** (int, optional): Filter appointments based on doctor_id.
+    """
+    affected = shards.delete_appointments(
+        db,
+        start_date=start_date,
+        end_date=end_date,
+        doctor_id=doctor_id
+    )
+    return schemas.AffectedAppointments(affected=affected)
+
+
+@router.post('/shift/', response_model=schemas.AffectedAppointments)
+def shift_appointments(
+    shift: schemas.AppointmentShift,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Moves every `Appointment` object matching the filters by the same
+    number of minutes.
+
+    Nothing is moved if any appointment would fall outside the clinic hours
+    or overlap an appointment that is not moved.
+
+    Args:
+    - **start_date** (date): Start date to filter appointments.
+    - **end_date** (date): End date to filter appointments.
+    - **doctor_id** (int, optional): Filter appointments based on doctor_id.
+    - **minutes** (int): Minutes to move the appointments by, negative to
+        move them earlier.
+    """
+    affected = shards.shift_appointments(
+        db,
+        start_date=shift.start_date,
+        end_date=shift.end_date,
+        minutes=shift.minutes,
+        doctor_id=shift.doctor_id
+    )
+    return schemas.AffectedAppointments(affected=affected)
+
+
+@router.get('/stream/')
+async def stream_appointments(last_event_id: Optional[str] = Header(None)):
+    """
+    Streams the changes of every appointment as server-sent events.
+
+    Events are `created` and `updated`, with the fields of the appointment
+    without its doctor, and `deleted`, with its id and doctor_id. A client
+    reconnecting with `Last-Event-ID` gets the events it missed, or a
+    `reset` event if it should fetch its lists again.
+
+    Args:
+    - **Last-Event-ID** (str, optional): Header with the id of the last
+        event received.
+    """
+    return events.EventStreamResponse(last_event_id=last_event_id)
+
+
+@router.get('/stream/stats/')
+def get_stream_stats():
+    """
+    Gets the subscriber and event counters of the change feed.
+    """
+    return events.feed.stats()
+
+
+@router.get('/batch/', response_model=schemas.AppointmentBatch)
+def get_appointment_batch(
+    ids: List[int] = Depends(id_list),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the `Appointment` objects with the given ids, in the given order,
+    and the ids not found.
+
+    Args:
+    - **ids** (str): Comma separated PKs, e.g. `3,1,2`.
+    """
+    db_appointments, missing = shards.get_appointments_by_ids(db, ids)
+    return {'appointments': db_appointments, 'missing': missing}
+
+
+@router.post('/batch/', response_model=schemas.AppointmentBatch)
+def post_appointment_batch(
+    batch: schemas.IdList,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the `Appointment` objects with the given ids, like
+    `GET /appointments/batch/`, for lists too long for a query string.
+
+    Args:
+    - **ids** (list): PKs of the appointments.
+    """
+    db_appointments, missing = shards.get_appointments_by_ids(
+        db, batch.ids)
+    return {'appointments': db_appointments, 'missing': missing}
+
+
+def get_appointment(
+    request: Request,
+    response: Response,
+    appointment_id: int,
+    db: ShardedSession = Depends(get_db)
+):
     """
     Gets the `Appointment` object based with the designated appointment_id
 
+    Returns 304 if `If-None-Match` matches the current `ETag`.
+
     Args:
     - **appointment_id (int)**: PK of the object.
     """
-    db_appointment = crud.get_appointment(db, appointment_id=appointment_id)
+    session = db.for_appointment(appointment_id)
+    etag = versions.etag(session, versions.GLOBAL_SCOPE, str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+
+    db_appointment = crud.get_appointment(
+        session, appointment_id=appointment_id)
     return db_appointment
 
 
+async def get_appointment_async(
+    request: Request,
+    appointment_id: int,
+    db: AsyncShardedSession = Depends(get_async_db)
+):
+    """
+    Gets the `Appointment` object based with the designated appointment_id
+
+    Returns 304 if `If-None-Match` matches the current `ETag`.
+
+    Args:
+    - **appointment_id (int)**: PK of the object.
+    """
+    conn = await db.for_appointment(appointment_id)
+    etag = await versions.etag_async(
+        conn, versions.GLOBAL_SCOPE, str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    content = await crud.get_appointment_json_async(conn, appointment_id)
+    return Response(
+        content, media_type='application/json', headers={'ETag': etag})
+
+
+router.get('/{appointment_id}/', response_model=schemas.Appointment)(
+    get_appointment_async if ASYNC_DB else get_appointment)
+
+
 @router.post('/', response_model=schemas.Appointment)
 def create_appointment(
     appointment: schemas.AppointmentCreate,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
 ):
     """
     Create an `Appointment` with all the information in the request body.
@@ -64,15 +338,44 @@ def create_appointment(
     - **doctor_id (int)**: The pk of the `Doctor` related to this specific
         appointment.
     """
-    db_appointment = crud.create_appointment(db, appointment)
+    db_appointment = crud.create_appointment(
+        db.for_doctor(appointment.doctor_id), appointment)
     return db_appointment
 
 
+@router.post(
+    '/bulk/',
+    response_model=List[schemas.AppointmentBulkResult]
+)
+def create_appointments(
+    appointments: List[schemas.AppointmentCreate],
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Create many `Appointment` objects in a single transaction.
+
+    Items overlapping a stored appointment or an earlier item of the same
+    request are not created. Each item gets a result with a `status` of
+    `created`, `conflict` or `not_found`.
+
+    The results are encoded directly rather than through the response
+    model, which would validate every appointment and its doctor again.
+
+    Args:
+    - **appointments (list)**: Items with the same fields as the body of
+        a single create.
+    """
+    return Response(
+        dumps_json(shards.bulk_create_appointments(db, appointments)),
+        media_type='application/json'
+    )
+
+
 @router.put('/{appointment_id}/', response_model=schemas.Appointment)
 def change_appointment(
     appointment: schemas.AppointmentCreate,
     appointment_id: int,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
 ):
     """
     Update the `Appointment` object with all the information in the
@@ -87,16 +390,50 @@ def change_appointment(
     - **doctor_id (int)**: The pk of the `Doctor` related to this specific
         appointment.
     """
-    db_appointment = crud.update_appointment(db, appointment, appointment_id)
+    shards.check_same_shard(appointment_id, appointment.doctor_id)
+    db_appointment = crud.update_appointment(
+        db.for_appointment(appointment_id), appointment, appointment_id)
     return db_appointment
 
 
+@router.patch('/{appointment_id}/', response_model=schemas.Appointment)
+def patch_appointment(
+    appointment: schemas.AppointmentPatch,
+    appointment_id: int,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Update only the fields of an `Appointment` given in the request body.
+
+    The clinic hours and overlaps are only checked again if the times or
+    the doctor change.
+
+    Args:
+    - **appointment_id (int)**: The pk of the appointment object.
+    - **patient_name (str, optional)**: Name of the patient.
+    - **comment (str, optional)**: Other comments for this appointment.
+    - **start_dt (datetime, optional)**: The start date and time of
+        appointment.
+    - **end_dt (datetime, optional)**: The end date and time of appointment.
+    - **doctor_id (int, optional)**: The pk of the `Doctor` related to this
+        specific appointment.
+    """
+    if appointment.doctor_id is not None:
+        shards.check_same_shard(appointment_id, appointment.doctor_id)
+    return crud.patch_appointment(
+        db.for_appointment(appointment_id), appointment, appointment_id)
+
+
 @router.delete('/{appointment_id}/', status_code=204)
-def delete_appointment(appointment_id: int, db: Session = Depends(get_db)):
+def delete_appointment(
+    appointment_id: int,
+    db: ShardedSession = Depends(get_db)
+):
     """
     Deletes the `Appointment` object.
 
     Args:
     - **appointment_id (str)**: PK of the appointment object.
     """
-    crud.delete_appointment(db, appointment_id)
+    crud.delete_appointment(
+        db.for_appointment(appointment_id), appointment_id)
@@ -0,0 +1,41 @@
+from datetime import date
+
+from fastapi import APIRouter
+from fastapi import Depends
+from fastapi import Query
+from fastapi import Response
+
+from app import schemas
+from app import shards
+from app.database import ShardedSession
+from app.database import get_db
+from app.metrics import MetricsRoute
+from app.utils import ID_LIST_PATTERN
+from app.utils import id_list
+
+
+router = APIRouter(route_class=MetricsRoute)
+
+
+@router.get('/', response_model=schemas.Calendar)
+def get_calendar(
+    week: date,
+    doctor_ids: str = Query(..., regex=ID_LIST_PATTERN),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets a week of the appointments of several doctors as columns.
+
+    The doctors are listed once. Each appointment has its id, the index of
+    its doctor in that list, its start and end in seconds from `start_dt`
+    and its patient_name, each in a list of its own. Occurrences of series
+    are merged in by start with a null id. The id of their series and their
+    index in it are in two more lists, one entry per occurrence, in the
+    same order. Details such as comments are at `/appointments/batch/`.
+
+    Args:
+    - **week (date)**: Any date of the week, which starts on Monday.
+    - **doctor_ids (str)**: Comma separated PKs of the doctors, e.g. `3,1,2`.
+    """
+    content = shards.get_calendar_json(db, id_list(doctor_ids), week)
+    return Response(content, media_type='application/json')
@@ -4,75 +4,456 @@ from typing import Optional
 
 from fastapi import APIRouter
 from fastapi import Depends
-from sqlalchemy.orm import Session
+from fastapi import Header
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 
 from app import crud
+from app import events
 from app import schemas
+from app import shards
+from app import versions
+from app.aio import ASYNC_DB
+from app.aio import AsyncShardedSession
+from app.aio import get_async_db
+from app.cache import doctor_cache
+from app.cache import doctor_list_cache
+from app.database import ShardedSession
 from app.database import get_db
+from app.metrics import MetricsRoute
+from app.utils import FAST_JSON_RESPONSES
+from app.utils import NEXT_CURSOR_HEADER
+from app.utils import etag_matches
+from app.utils import id_list
+from app.utils import not_modified
 
 
-router = APIRouter()
+router = APIRouter(route_class=MetricsRoute)
 
 
 @router.get('/', response_model=List[schemas.Doctor])
 def get_doctors(
-        skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    db: ShardedSession = Depends(get_db)
+):
     """
     Router to get a list of `Doctor` objects.
 
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header. Returns 304 if `If-None-Match` matches the current `ETag`.
+
     Args:
     - **skip** (int, optional): Hints where to start during pagination.
         Defaults to 0.
     - **limit** (int, optional): Hints where to end during pagination.
         Defaults to 100.
+    - **after** (str, optional): Cursor of the page to get. Takes
+        precedence over skip.
     """
-    db_doctors = crud.get_doctors(db, skip=skip, limit=limit)
+    etag = versions.global_etag(db.all(), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+
+    db_doctors = shards.get_doctors(
+        db, skip=skip, limit=limit, after=after)
+    next_cursor = crud.get_doctors_cursor(db_doctors, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return db_doctors
 
 
-@router.get('/{doctor_id}/', response_model=schemas.Doctor)
-def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
+@router.get('/search/', response_model=List[schemas.Doctor])
+def search_doctors(
+    response: Response,
+    q: str,
+    limit: int = Query(20, gt=0, le=100),
+    after: Optional[str] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Searches `Doctor` objects by first and last name, best match first.
+
+    Matches are ranked `SEARCH_WINDOW` at a time from the newest, so an
+    older match can come after newer, worse ones.
+
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header.
+
+    Args:
+    - **q** (str): Words matching the start of the names, e.g. `jo sm`
+        matches `John Smith`.
+    - **limit** (int, optional): Maximum number of results. Defaults to 20.
+    - **after** (str, optional): Cursor of the page to get.
+    """
+    db_doctors, next_cursor = shards.search_doctors(
+        db, q=q, limit=limit, after=after)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return db_doctors
+
+
+@router.get('/batch/', response_model=schemas.DoctorBatch)
+def get_doctor_batch(
+    ids: List[int] = Depends(id_list),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the `Doctor` objects with the given ids, in the given order, and
+    the ids not found.
+
+    Args:
+    - **ids** (str): Comma separated PKs, e.g. `3,1,2`.
+    """
+    db_doctors, missing = shards.get_doctors_by_ids(db, ids)
+    return {'doctors': db_doctors, 'missing': missing}
+
+
+@router.post('/batch/', response_model=schemas.DoctorBatch)
+def post_doctor_batch(
+    batch: schemas.IdList,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the `Doctor` objects with the given ids, like
+    `GET /doctors/batch/`, for lists too long for a query string.
+
+    Args:
+    - **ids** (list): PKs of the doctors.
+    """
+    db_doctors, missing = shards.get_doctors_by_ids(db, batch.ids)
+    return {'doctors': db_doctors, 'missing': missing}
+
+
+@router.get(
+    '/availability/',
+    response_model=List[schemas.DoctorAvailability]
+)
+def get_availability(
+    date: date,
+    duration: int = Query(30, gt=0),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the free slots of every doctor within the clinic hours of a date.
+
+    Args:
+    - **date (date)**: The date in the clinic's timezone.
+    - **duration (int, optional)**: Minimum length of a slot in minutes.
+        Defaults to 30.
+    """
+    return shards.get_availability(db, day=date, duration=duration)
+
+
+@router.get('/cache/')
+def get_cache_stats():
+    """
+    Gets the hit, miss and eviction counters of the doctor caches.
+    """
+    return {
+        'doctors': doctor_cache.stats(),
+        'doctor_lists': doctor_list_cache.stats(),
+    }
+
+
+@router.get('/stats/', response_model=List[schemas.DoctorStats])
+def get_stats(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the booked minutes and utilization per day and the booked minutes
+    per clinic hour of every doctor.
+
+    Args:
+    - **start_date** (date, optional): First day, in the clinic's timezone.
+    - **end_date** (date, optional): Last day, in the clinic's timezone.
+    """
+    return shards.get_doctor_stats(
+        db, start_date=start_date, end_date=end_date)
+
+
+def get_doctor(
+    request: Request,
+    response: Response,
+    doctor_id: int,
+    db: ShardedSession = Depends(get_db)
+):
     """
     Gets the `Doctor` object based with the designated appointment_id
 
+    Returns 304 if `If-None-Match` matches the current `ETag`.
+
     Args:
     - **doctor_id (int)**: PK of the doctor object.
     """
-    db_doctor = crud.get_doctor(db, doctor_id)
+    session = db.for_doctor(doctor_id)
+    etag = versions.etag(
+        session, versions.doctor_scope(doctor_id), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers['ETag'] = etag
+
+    db_doctor = crud.get_cached_doctor(session, doctor_id)
     return db_doctor
 
 
-@router.get(
-    '/{doctor_id}/appointments/',
-    response_model=List[schemas.Appointment]
-)
+async def get_doctor_async(
+    request: Request,
+    doctor_id: int,
+    db: AsyncShardedSession = Depends(get_async_db)
+):
+    """
+    Gets the `Doctor` object based with the designated appointment_id
+
+    Returns 304 if `If-None-Match` matches the current `ETag`.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    """
+    conn = await db.for_doctor(doctor_id)
+    etag = await versions.etag_async(
+        conn, versions.doctor_scope(doctor_id), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    content = await crud.get_doctor_json_async(conn, doctor_id)
+    return Response(
+        content, media_type='application/json', headers={'ETag': etag})
+
+
+router.get('/{doctor_id}/', response_model=schemas.Doctor)(
+    get_doctor_async if ASYNC_DB else get_doctor)
+
+
 def get_doctor_appointments(
+    request: Request,
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
+    after: Optional[str] = None,
     doctor_id: int = None,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
 ):
     """
     Gets all the `Appointment` objects related to this specific doctor.
 
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header. Returns 304 if `If-None-Match` matches the current `ETag`,
+    without querying the appointments.
+
     Args:
     - **doctor_id (int)**: PK of the doctor object.
+    - **after** (str, optional): Cursor of the page to get. Takes
+        precedence over skip.
     """
+    session = db.for_doctor(doctor_id)
+    etag = versions.etag(
+        session, versions.doctor_scope(doctor_id), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    if FAST_JSON_RESPONSES:
+        content, next_cursor = crud.get_appointments_json(
+            db=session,
+            doctor_id=doctor_id,
+            start_date=start_date,
+            end_date=end_date,
+            skip=skip,
+            limit=limit,
+            after=after
+        )
+        response = Response(
+            content, media_type='application/json', headers={'ETag': etag})
+        if next_cursor:
+            response.headers[NEXT_CURSOR_HEADER] = next_cursor
+        return response
+
     db_appointments = crud.get_appointments(
-        db=db,
+        db=session,
         doctor_id=doctor_id,
         start_date=start_date,
         end_date=end_date,
         skip=skip,
-        limit=limit
+        limit=limit,
+        after=after
     )
+    next_cursor = crud.get_appointments_cursor(db_appointments, limit)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    response.headers['ETag'] = etag
     return db_appointments
 
 
+async def get_doctor_appointments_async(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    after: Optional[str] = None,
+    doctor_id: int = None,
+    db: AsyncShardedSession = Depends(get_async_db)
+):
+    """
+    Gets all the `Appointment` objects related to this specific doctor.
+
+    The cursor of the next page, if any, is returned in the `X-Next-Cursor`
+    header. Returns 304 if `If-None-Match` matches the current `ETag`,
+    without querying the appointments.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    - **after** (str, optional): Cursor of the page to get. Takes
+        precedence over skip.
+    """
+    conn = await db.for_doctor(doctor_id)
+    etag = await versions.etag_async(
+        conn, versions.doctor_scope(doctor_id), str(request.url))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    content, next_cursor = await crud.get_appointments_json_async(
+        conn,
+        doctor_id=doctor_id,
+        start_date=start_date,
+        end_date=end_date,
+        skip=skip,
+        limit=limit,
+        after=after
+    )
+    response = Response(
+        content, media_type='application/json', headers={'ETag': etag})
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response
+
+
+router.get(
+    '/{doctor_id}/appointments/',
+    response_model=List[schemas.Appointment]
+)(get_doctor_appointments_async if ASYNC_DB else get_doctor_appointments)
+
+
+@router.get('/{doctor_id}/appointments/stream/')
+def stream_doctor_appointments(
+    doctor_id: int,
+    last_event_id: Optional[str] = Header(None),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Streams the changes of this doctor's appointments as server-sent events,
+    like `/appointments/stream/`.
+
+    An appointment moved to another doctor is sent to the subscribers of
+    both.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    - **Last-Event-ID** (str, optional): Header with the id of the last
+        event received.
+    """
+    crud.get_cached_doctor(db.for_doctor(doctor_id), doctor_id)
+    # The stream outlives the dependencies of the request, so give the
+    # connection back now.
+    db.close()
+    return events.EventStreamResponse(
+        doctor_id=doctor_id, last_event_id=last_event_id)
+
+
+@router.get(
+    '/{doctor_id}/availability/',
+    response_model=schemas.DoctorAvailability
+)
+def get_doctor_availability(
+    doctor_id: int,
+    date: date,
+    duration: int = Query(30, gt=0),
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the free slots of this doctor within the clinic hours of a date.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    - **date (date)**: The date in the clinic's timezone.
+    - **duration (int, optional)**: Minimum length of a slot in minutes.
+        Defaults to 30.
+    """
+    availability = crud.get_availability(
+        db.for_doctor(doctor_id),
+        day=date,
+        duration=duration,
+        doctor_id=doctor_id
+    )
+    return availability[0]
+
+
+@router.get(
+    '/{doctor_id}/occurrences/',
+    response_model=List[schemas.Occurrence]
+)
+def get_doctor_occurrences(
+    doctor_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the occurrences of every series of this doctor, computed for the
+    requested dates only.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    - **start_date** (date, optional): Start date to filter occurrences.
+    - **end_date** (date, optional): End date to filter occurrences.
+    """
+    return crud.get_doctor_occurrences(
+        db.for_doctor(doctor_id),
+        doctor_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+@router.get('/{doctor_id}/stats/', response_model=schemas.DoctorStats)
+def get_doctor_stats(
+    doctor_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the booked minutes and utilization per day and the booked minutes
+    per clinic hour of this doctor.
+
+    Args:
+    - **doctor_id (int)**: PK of the doctor object.
+    - **start_date** (date, optional): First day, in the clinic's timezone.
+    - **end_date** (date, optional): Last day, in the clinic's timezone.
+    """
+    doctor_stats = crud.get_doctor_stats(
+        db.for_doctor(doctor_id),
+        start_date=start_date,
+        end_date=end_date,
+        doctor_id=doctor_id
+    )
+    return doctor_stats[0]
+
+
 @router.post('/', response_model=schemas.Doctor)
-def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(get_db)):
+def create_doctor(
+    doctor: schemas.DoctorCreate,
+    db: ShardedSession = Depends(get_db)
+):
     """
     Create a `Doctor` with all the information in the request body.
 
@@ -81,7 +462,7 @@ def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(get_db)):
     - **last_name (str)**: Last name of the doctor.
     - **email (pydantic.EmailStr)**: Email address of the doctor.
     """
-    db_doctor = crud.create_doctor(db, doctor)
+    db_doctor = shards.create_doctor(db, doctor)
     return db_doctor
 
 
@@ -89,7 +470,7 @@ def create_doctor(doctor: schemas.DoctorCreate, db: Session = Depends(get_db)):
 def change_doctor(
     doctor_id: int,
     doctor: schemas.DoctorCreate,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
 ):
     """
     Update a `Doctor` with all the information in the request body.
@@ -100,16 +481,35 @@ def change_doctor(
     - **last_name (str)**: Last name of the doctor.
     - **email (pydantic.EmailStr)**: Email address of the doctor.
     """
-    db_doctor = crud.update_doctor(db=db, doctor=doctor, doctor_id=doctor_id)
+    db_doctor = shards.update_doctor(
+        db=db, doctor=doctor, doctor_id=doctor_id)
     return db_doctor
 
 
+@router.patch('/{doctor_id}/', response_model=schemas.Doctor)
+def patch_doctor(
+    doctor_id: int,
+    doctor: schemas.DoctorPatch,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Update only the fields of a `Doctor` given in the request body.
+
+    Args:
+    - **doctor_id (str)**: PK of the doctor object.
+    - **first_name (str, optional)**: First name of the doctor.
+    - **last_name (str, optional)**: Last name of the doctor.
+    - **email (pydantic.EmailStr, optional)**: Email address of the doctor.
+    """
+    return shards.patch_doctor(db=db, doctor=doctor, doctor_id=doctor_id)
+
+
 @router.delete('/{doctor_id}/', status_code=204)
-def delete_doctor(doctor_id: int, db: Session = Depends(get_db)):
+def delete_doctor(doctor_id: int, db: ShardedSession = Depends(get_db)):
     """
     Deletes the `Doctor` object.
 
     Args:
     - **doctor_id (str)**: PK of the doctor object.
     """
-    crud.delete_doctor(db=db, doctor_id=doctor_id)
+    crud.delete_doctor(db=db.for_doctor(doctor_id), doctor_id=doctor_id)
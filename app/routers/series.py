@@ -0,0 +1,107 @@
+from datetime import date
+from typing import List
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi import Depends
+
+from app import crud
+from app import schemas
+from app.database import ShardedSession
+from app.database import get_db
+from app.metrics import MetricsRoute
+
+
+router = APIRouter(route_class=MetricsRoute)
+
+
+@router.post('/', response_model=schemas.Series)
+def create_series(
+    appointment_series: schemas.SeriesCreate,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Create a series of appointments repeated every few weeks.
+
+    Every occurrence is checked against the clinic hours and the other
+    bookings of the doctor, but only the series is stored.
+
+    Args:
+    - **patient_name (str)**: Name of the patient.
+    - **comment (str, optional)**: Other comments for the appointments.
+    - **start_dt (datetime)**: The start date and time of the first
+        occurrence.
+    - **end_dt (datetime)**: The end date and time of the first occurrence.
+    - **interval_weeks (int, optional)**: Weeks between occurrences.
+        Defaults to 1.
+    - **count (int)**: Number of occurrences. Either this or until.
+    - **until (date)**: Date of the last possible occurrence.
+    - **exceptions (list, optional)**: Dates of the occurrences to skip.
+    - **doctor_id (int)**: The pk of the `Doctor` of the appointments.
+    """
+    return crud.create_series(
+        db.for_doctor(appointment_series.doctor_id), appointment_series)
+
+
+@router.get('/{series_id}/', response_model=schemas.Series)
+def get_series(series_id: int, db: ShardedSession = Depends(get_db)):
+    """
+    Gets the series with the designated series_id.
+
+    Args:
+    - **series_id (int)**: PK of the series object.
+    """
+    return crud.get_series(db.for_series(series_id), series_id)
+
+
+@router.get(
+    '/{series_id}/occurrences/',
+    response_model=List[schemas.Occurrence]
+)
+def get_occurrences(
+    series_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Gets the occurrences of a series, computed for the requested dates only.
+
+    Args:
+    - **series_id (int)**: PK of the series object.
+    - **start_date** (date, optional): Start date to filter occurrences.
+    - **end_date** (date, optional): End date to filter occurrences.
+    """
+    return crud.get_occurrences(
+        db.for_series(series_id),
+        series_id,
+        start_date=start_date,
+        end_date=end_date
+    )
+
+
+@router.delete('/{series_id}/occurrences/{day}/', status_code=204)
+def skip_occurrence(
+    series_id: int,
+    day: date,
+    db: ShardedSession = Depends(get_db)
+):
+    """
+    Skips the occurrence of a series on a date.
+
+    Args:
+    - **series_id (int)**: PK of the series object.
+    - **day (date)**: Date of the occurrence, in the clinic's timezone.
+    """
+    crud.skip_occurrence(db.for_series(series_id), series_id, day)
+
+
+@router.delete('/{series_id}/', status_code=204)
+def delete_series(series_id: int, db: ShardedSession = Depends(get_db)):
+    """
+    Deletes the series and all of its occurrences.
+
+    Args:
+    - **series_id (int)**: PK of the series object.
+    """
+    crud.delete_series(db.for_series(series_id), series_id)
@@ -1,12 +1,19 @@
+from datetime import date
 from datetime import datetime
+from typing import Dict
+from typing import List
 from typing import Optional
 
 from fastapi import HTTPException
 from pydantic import BaseModel
 from pydantic import EmailStr
+from pydantic import Field
+from pydantic import root_validator
 from pydantic import validator
 
+from .utils import BATCH_MAX_IDS
 from .utils import NO_APPOINTMENT_WEEKDAY_CODE
+from .utils import to_utc_naive
 from .utils import utc_to_local
 
 
@@ -34,6 +41,37 @@ class DoctorCreate(DoctorBase):
     pass
 
 
+class DoctorPatch(BaseModel):
+    """
+    Schema used for `Doctor` PATCH requests. Omitted fields are left as
+    they are.
+    """
+
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    email: Optional[EmailStr] = None
+
+    @validator('first_name', 'last_name', 'email', pre=True)
+    def validate_not_null(cls, value):
+        if value is None:
+            raise ValueError('may be omitted but not null')
+        return value
+
+
+class DoctorBatch(BaseModel):
+    """ Schema for `Doctor` objects fetched by id. """
+
+    doctors: List[Doctor]
+    # Requested ids without a doctor.
+    missing: List[int]
+
+
+class IdList(BaseModel):
+    """ Schema used for batch POST requests fetching objects by id. """
+
+    ids: List[int] = Field(..., max_items=BATCH_MAX_IDS)
+
+
 class AppointmentBase(BaseModel):
     """ Base schema for `Appointment` objects. """
 
@@ -43,6 +81,12 @@ class AppointmentBase(BaseModel):
     end_dt: datetime
     # doctor_id: int
 
+    @validator('start_dt', 'end_dt')
+    def validate_utc(cls, dt):
+        # Stored datetimes are naive utc, so convert aware ones rather than
+        # dropping their offset.
+        return to_utc_naive(dt)
+
     @validator('end_dt')
     def validate_datetimes(cls, dt, values):
 
@@ -54,8 +98,6 @@ class AppointmentBase(BaseModel):
         aware_start_dt = utc_to_local(values['start_dt'])
         aware_end_dt = utc_to_local(dt)
 
-        print(aware_start_dt)
-
         if aware_start_dt.weekday() != aware_end_dt.weekday():
             raise HTTPException(
                 status_code=422,
@@ -116,6 +158,29 @@ class AppointmentCreate(AppointmentBase):
     doctor_id: int
 
 
+class AppointmentPatch(BaseModel):
+    """
+    Schema used for `Appointment` PATCH requests. Omitted fields are left
+    as they are.
+    """
+
+    patient_name: Optional[str] = None
+    comment: Optional[str] = None
+    start_dt: Optional[datetime] = None
+    end_dt: Optional[datetime] = None
+    doctor_id: Optional[int] = None
+
+    @validator('patient_name', 'start_dt', 'end_dt', 'doctor_id', pre=True)
+    def validate_not_null(cls, value):
+        if value is None:
+            raise ValueError('may be omitted but not null')
+        return value
+
+    @validator('start_dt', 'end_dt')
+    def validate_utc(cls, dt):
+        return to_utc_naive(dt)
+
+
 class AppointmentWithoutDoctorCreate(AppointmentBase):
     """
     Schema used for `Appointment` POST requests without the need
@@ -124,3 +189,162 @@ class AppointmentWithoutDoctorCreate(AppointmentBase):
 
     pass
 
+
+class AppointmentBulkResult(BaseModel):
+    """ Schema for the outcome of one item of a bulk `Appointment` POST. """
+
+    index: int
+    status: str
+    detail: Optional[str] = None
+    appointment: Optional[Appointment] = None
+
+
+class AppointmentBatch(BaseModel):
+    """ Schema for `Appointment` objects fetched by id. """
+
+    appointments: List[Appointment]
+    # Requested ids without an appointment.
+    missing: List[int]
+
+
+class AppointmentShift(BaseModel):
+    """ Schema used for `Appointment` shift POST requests. """
+
+    start_date: date
+    end_date: date
+    doctor_id: Optional[int] = None
+    # Negative to move the appointments earlier.
+    minutes: int
+
+
+class AffectedAppointments(BaseModel):
+    """ Schema for the outcome of a set based `Appointment` write. """
+
+    affected: int
+
+
+class SeriesBase(AppointmentBase):
+    """
+    Base schema for `AppointmentSeries` objects. `start_dt` and `end_dt`
+    are the bounds of the first occurrence.
+    """
+
+    interval_weeks: int = Field(1, gt=0)
+    count: Optional[int] = Field(None, gt=0)
+    until: Optional[date] = None
+    # Dates of the skipped occurrences, in the clinic's timezone.
+    exceptions: List[date] = []
+
+
+class Series(SeriesBase):
+    """ Schema used for `AppointmentSeries` GET requests. """
+
+    id: int
+    doctor_id: int
+    count: int
+
+    @validator('exceptions', pre=True)
+    def validate_exceptions(cls, exceptions):
+        return [getattr(day, 'day', day) for day in exceptions]
+
+    class Config:
+        orm_mode = True
+
+
+class SeriesCreate(SeriesBase):
+    """ Schema used for `AppointmentSeries` POST requests. """
+
+    doctor_id: int
+
+    @root_validator(skip_on_failure=True)
+    def validate_end(cls, values):
+        if (values['count'] is None) == (values['until'] is None):
+            raise ValueError('exactly one of count and until is required')
+        return values
+
+
+class Occurrence(BaseModel):
+    """ Schema for one occurrence of an `AppointmentSeries`. """
+
+    series_id: int
+    # Position of the occurrence in the series, from 0.
+    index: int
+    patient_name: str
+    comment: Optional[str] = None
+    start_dt: datetime
+    end_dt: datetime
+    doctor_id: int
+
+
+class CalendarDoctors(BaseModel):
+    """ Schema for the doctors of a `Calendar`, one list per field. """
+
+    id: List[int]
+    first_name: List[str]
+    last_name: List[str]
+    email: List[str]
+
+
+class CalendarAppointments(BaseModel):
+    """
+    Schema for the appointments of a `Calendar`, occurrences of series
+    included, one list per field, ordered by doctor then start.
+    """
+
+    # None for occurrences of series.
+    id: List[Optional[int]]
+    # Series and index in it of each occurrence, in the order of the None
+    # ids.
+    series_id: List[int]
+    index: List[int]
+    # Index of the doctor in `CalendarDoctors`.
+    doctor: List[int]
+    # Whole seconds from `Calendar.start_dt`.
+    start: List[int]
+    end: List[int]
+    patient_name: List[str]
+
+
+class Calendar(BaseModel):
+    """ Schema for a week of the appointments of several doctors. """
+
+    # Monday of the week.
+    week: date
+    # Start of the week, naive utc.
+    start_dt: datetime
+    doctors: CalendarDoctors
+    # Requested ids without a doctor.
+    missing: List[int]
+    appointments: CalendarAppointments
+
+
+class TimeSlot(BaseModel):
+    """ Schema for a free interval in a doctor's schedule. """
+
+    start_dt: datetime
+    end_dt: datetime
+
+
+class DoctorAvailability(BaseModel):
+    """ Schema used for `Doctor` availability GET requests. """
+
+    doctor_id: int
+    slots: List[TimeSlot] = []
+
+
+class DailyLoad(BaseModel):
+    """ Schema for the booked time of a doctor in one day. """
+
+    day: date
+    booked_minutes: float
+    appointments: int
+    utilization: float
+
+
+class DoctorStats(BaseModel):
+    """ Schema used for `Doctor` stats GET requests. """
+
+    doctor_id: int
+    days: List[DailyLoad] = []
+    # Booked minutes per clinic hour over the whole range.
+    hourly_booked_minutes: Dict[int, float] = {}
@@ -0,0 +1,203 @@
+"""
+Full text and prefix search over patient and doctor names.
+
+`appointments_fts` and `doctors_fts` are FTS5 indexes over the name columns
+of `appointments` and `doctors`. Triggers keep them in sync with every write
+to those tables, set based ones included. They are created along with new
+tables; run ``python -m app.search rebuild`` to create or recreate them
+for an existing database, or one indexed with other prefix lengths.
+"""
+import argparse
+import os
+import re
+import unicodedata
+
+from sqlalchemy import DDL
+from sqlalchemy import event
+from sqlalchemy import text
+
+from . import models
+
+
+# Prefix queries of 1 to 8 characters are served by dedicated indexes.
+# Longer query words are rare, but without an index of their own a query
+# reads the whole doclist of each such word, which over millions of rows
+# takes tens of milliseconds. The indexes of 5 to 8 characters make the
+# index of 5M names about 460 MB instead of 270 MB.
+_TOKENIZE = (
+    "tokenize = 'unicode61 remove_diacritics 2', "
+    "prefix = '1 2 3 4 5 6 7 8'"
+)
+
+# Maps an FTS5 table to its content table and the indexed columns.
+INDEXES = {
+    'appointments_fts': ('appointments', ('patient_name',)),
+    'doctors_fts': ('doctors', ('first_name', 'last_name')),
+}
+
+# Matches are ranked this many at a time, newest first, so a better match
+# older than the first window comes after the worse matches of that window.
+# Ranking every match of a short prefix would read millions of rows; 0 ranks
+# them all anyway.
+SEARCH_WINDOW = int(os.environ.get('SEARCH_WINDOW', 250))
+_MAX_ROWID = 2 ** 63 - 1
+# Position of the first window, before any match of it.
+_WINDOW_START = (-1, 0, 0)
+# Positions before and after every match.
+START = (_MAX_ROWID, *_WINDOW_START)
+END = (0, *_WINDOW_START)
+
+
+def _statements(fts_table: str):
+    table, columns = INDEXES[fts_table]
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = (
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {names}) "
+        f"VALUES ('delete', old.id, {old});"
+    )
+    insert = f'INSERT INTO {fts_table}(rowid, {names}) VALUES (new.id, {new});'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5("
+        f"{names}, content = '{table}', content_rowid = 'id', {_TOKENIZE})",
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_insert '
+        f'AFTER INSERT ON {table} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_delete '
+        f'AFTER DELETE ON {table} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {fts_table}_update '
+        f'AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END',
+    ]
+
+
+for _fts_table, (_table, _) in INDEXES.items():
+    for _statement in _statements(_fts_table):
+        event.listen(
+            models.Base.metadata.tables[_table],
+            'after_create',
+            DDL(_statement)
+        )
+
+
+def words(text: str):
+    """
+    Splits text into lowercase words without diacritics, like the indexes.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The words.
+    """
+    text = text.lower()
+    if text.isascii():
+        # Nothing to decompose, as for most names.
+        return re.findall(r'\w+', text)
+    decomposed = unicodedata.normalize('NFKD', text)
+    return re.findall(r'\w+', ''.join(
+        char for char in decomposed if not unicodedata.combining(char)))
+
+
+def _rank_key(query_words, names, rowid):
+    # Names with more exact word matches first, then shorter names, then
+    # newer rows. A query word that is not a word of the name matched a
+    # prefix of one.
+    name_words = set(words(' '.join(name or '' for name in names)))
+    inexact = sum(1 for word in query_words if word not in name_words)
+    return (inexact, sum(len(name or '') for name in names), -rowid)
+
+
+def search(db, fts_table: str, query_words, limit: int, after=None):
+    """
+    Returns the rows with a word starting with each query word, best first.
+
+    Matches are taken `SEARCH_WINDOW` at a time from the newest, and ranked
+    within each window by `_rank_key`, so the cost of a page does not
+    depend on how many rows match. Every match of a window comes before
+    those of the next, older one, however well they rank. With a
+    `SEARCH_WINDOW` of 0, every match is read and ranked at once.
+
+    Args:
+        fts_table (str): One of `INDEXES`.
+        query_words (List[str]): Words returned by `words`.
+        limit (int): Maximum number of matches to return.
+        after (tuple, optional): Position after the last match of the
+            previous page, as returned with it.
+
+    Returns:
+        tuple: The PK of each match with the position right after it, and
+            the position of the next page or None if this is the last page.
+    """
+    _, columns = INDEXES[fts_table]
+    statement = text(
+        f'SELECT rowid, {", ".join(columns)} FROM {fts_table} '
+        f'WHERE {fts_table} MATCH :q AND rowid <= :upper '
+        f'ORDER BY rowid DESC LIMIT :window'
+    )
+    match = ' '.join(f'"{word}"*' for word in query_words)
+    upper, *last = after or START
+    last = tuple(last)
+
+    # SQLite has no limit on a negative LIMIT.
+    window = SEARCH_WINDOW if SEARCH_WINDOW > 0 else -1
+    matches = []
+    while True:
+        rows = db.execute(statement, {
+            'q': match, 'upper': upper, 'window': window}).fetchall()
+        ranked = sorted(
+            key for key in (
+                _rank_key(query_words, row[1:], row[0]) for row in rows)
+            if key > last
+        )
+        room = limit - len(matches)
+        matches.extend((-key[2], (upper, *key)) for key in ranked[:room])
+        if len(ranked) > room:
+            return matches, (upper, *ranked[room - 1])
+        if window < 0 or len(rows) < window:
+            return matches, None
+
+        upper = min(row[0] for row in rows) - 1
+        last = _WINDOW_START
+        if len(matches) == limit:
+            return matches, (upper, *_WINDOW_START)
+
+
+def rebuild(db):
+    """
+    Recreates every index, so it has the current prefix indexes, and
+    populates it.
+
+    Each index is then optimized into a single b-tree, which FTS5 queries
+    read faster than the segments left by incremental writes.
+    """
+    for fts_table in INDEXES:
+        db.execute(f'DROP TABLE IF EXISTS {fts_table}')
+        for statement in _statements(fts_table):
+            db.execute(statement)
+        db.execute(
+            f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+        db.execute(
+            f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')")
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('command', choices=['rebuild'])
+    parser.parse_args()
+
+    from .database import SessionLocals
+    from .database import engines
+
+    for index, SessionLocal in enumerate(SessionLocals):
+        models.Base.metadata.create_all(bind=engines[index])
+        db = SessionLocal()
+        try:
+            rebuild(db)
+        finally:
+            db.close()
+    print('Rebuilt the search indexes.')
+
+
+if __name__ == '__main__':
+    main()
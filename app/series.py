@@ -0,0 +1,156 @@
+"""
+Expansion of recurring appointment series.
+
+Only the first occurrence of an `AppointmentSeries` is stored. The others
+are computed from it, and only within the range a read or an overlap check
+asks about, so a series costs one row however long it runs and checking it
+against a booking costs O(1).
+
+The clinic's timezone has no daylight saving time, so occurrences are the
+same number of days apart in utc and all keep the local time of the first.
+"""
+import os
+from datetime import timedelta
+
+from .utils import utc_to_local
+
+
+# Longest series accepted, about ten years of weekly occurrences.
+MAX_OCCURRENCES = int(os.environ.get('SERIES_MAX_OCCURRENCES', 520))
+
+
+def first_day(series):
+    """ Returns the date of the first occurrence, in the clinic's timezone. """
+    return utc_to_local(series.start_dt).date()
+
+
+def occurrence_count(day, interval_weeks: int, until):
+    """
+    Returns the number of occurrences of a series up to an end date.
+
+    Args:
+        day (date): Date of the first occurrence.
+        interval_weeks (int): Weeks between occurrences.
+        until (date): Last date an occurrence may fall on.
+
+    Returns:
+        int: The number of occurrences, 0 if until is before day.
+    """
+    if until < day:
+        return 0
+    return (until - day).days // (7 * interval_weeks) + 1
+
+
+def occurrence_index(series, day):
+    """
+    Returns the index of the occurrence of a series on a date.
+
+    Args:
+        series (AppointmentSeries): The series.
+        day (date): The date, in the clinic's timezone.
+
+    Returns:
+        int: The index from 0, or None if no occurrence falls on day.
+    """
+    index, rest = divmod(
+        (day - first_day(series)).days, 7 * series.interval_weeks)
+    if rest or not 0 <= index < series.count:
+        return None
+    return index
+
+
+def skipped_days(series):
+    """ Returns the dates of the skipped occurrences of a series. """
+    return {exception.day for exception in series.exceptions}
+
+
+def occurrences(series, start_dt=None, end_dt=None, skipped=()):
+    """
+    Yields the occurrences of a series overlapping a range, in order.
+
+    The first and last indexes are computed from the range, so occurrences
+    outside of it are never looked at.
+
+    Args:
+        series (AppointmentSeries): The series, or a row of its columns.
+        start_dt (datetime, optional): Start of the range, naive utc.
+        end_dt (datetime, optional): End of the range, naive utc.
+        skipped (Collection[date], optional): Dates of the occurrences to
+            leave out, see `skipped_days`.
+
+    Yields:
+        tuple: The index, start and end, naive utc, of each occurrence.
+    """
+    step = timedelta(weeks=series.interval_weeks)
+    first = 0
+    last = series.count - 1
+    if start_dt is not None:
+        first = max(first, (start_dt - series.end_dt) // step + 1)
+    if end_dt is not None:
+        last = min(last, -((series.start_dt - end_dt) // step) - 1)
+
+    day = first_day(series) if skipped else None
+    for index in range(first, last + 1):
+        if skipped and day + index * step in skipped:
+            continue
+        yield (
+            index,
+            series.start_dt + index * step,
+            series.end_dt + index * step
+        )
+
+
+def overlaps(series, start_dt, end_dt, skipped=()):
+    """
+    Checks if an occurrence of a series overlaps a range.
+
+    Args:
+        series (AppointmentSeries): The series, or a row of its columns.
+        start_dt (datetime): Start of the range, naive utc.
+        end_dt (datetime): End of the range, naive utc.
+        skipped (Collection[date], optional): Dates of the occurrences to
+            leave out.
+
+    Returns:
+        bool: True if an occurrence that is not skipped overlaps the range.
+    """
+    return next(
+        occurrences(series, start_dt, end_dt, skipped), None) is not None
+
+
+def any_overlaps(series_list, start_dt, end_dt):
+    """
+    Checks if an occurrence of any of the series overlaps a range.
+
+    Args:
+        series_list (Iterable[AppointmentSeries]): The series, with their
+            exceptions.
+        start_dt (datetime): Start of the range, naive utc.
+        end_dt (datetime): End of the range, naive utc.
+
+    Returns:
+        bool: True if an occurrence that is not skipped overlaps the range.
+    """
+    return any(
+        overlaps(series, start_dt, end_dt, skipped_days(series))
+        for series in series_list
+    )
+
+
+def series_overlap(series, other):
+    """
+    Checks if two series have overlapping occurrences.
+
+    Args:
+        series (AppointmentSeries): A series, with its exceptions.
+        other (AppointmentSeries): Another series, with its exceptions.
+
+    Returns:
+        bool: True if an occurrence of each overlaps.
+    """
+    other_skipped = skipped_days(other)
+    return any(
+        overlaps(other, start_dt, end_dt, other_skipped)
+        for _, start_dt, end_dt in occurrences(
+            series, other.start_dt, other.last_end_dt, skipped_days(series))
+    )
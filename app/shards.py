@@ -0,0 +1,725 @@
+"""
+Requests spanning the shards of `app.database`.
+
+With a single shard every function hands its session to the `crud`
+function of the same name. Otherwise lists are gathered from each shard and
+merged: doctors by id, which is shard order since shards hold increasing
+ranges of ids, and appointments by start_dt and id. A page after skipping n
+rows reads up to n + limit rows of each shard, so deep pages should use the
+cursors, which are applied by every shard.
+"""
+import heapq
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from datetime import timedelta
+from itertools import groupby
+from itertools import islice
+from typing import List
+
+from fastapi import HTTPException
+
+from . import crud
+from . import models
+from . import schemas
+from . import search
+from . import versions
+from .cache import doctor_list_cache
+from .database import DB_SHARDS
+from .database import ShardedSession
+from .database import shard_of
+from .database import shard_of_email
+from .utils import decode_cursor
+from .utils import dumps_json
+from .utils import encode_cursor
+
+
+def _appointment_key(appointment):
+    return appointment.start_dt, appointment.id
+
+
+@contextmanager
+def _email_write(db: ShardedSession, email: str, doctor_id: int = None):
+    # Every write of an email holds the write lock of its home shard while
+    # it checks the other shards and writes, so concurrent writes of the
+    # same email are serialized there and the later one sees the earlier.
+    # In memory, requests are serialized anyway.
+    if DB_SHARDS == 1:
+        yield
+        return
+
+    home = shard_of_email(email)
+    own = shard_of(doctor_id) if doctor_id else home
+    sessions = [db.shard(index) for index in sorted({home, own})]
+    try:
+        with crud.write_locks(sessions):
+            for session in db.all():
+                if session is not db.shard(own) and session.query(
+                    models.Doctor.id
+                ).filter(models.Doctor.email == email).first():
+                    raise HTTPException(
+                        status_code=422,
+                        detail='Doctor with this email is already '
+                        'registered.'
+                    )
+            yield
+    finally:
+        # The doctor's session ends its transaction with its write.
+        if home != own:
+            db.shard(home).rollback()
+
+
+def check_same_shard(appointment_id: int, doctor_id: int):
+    """
+    Checks that an appointment can be given to a doctor.
+
+    Args:
+        appointment_id (int): PK of the appointment.
+        doctor_id (int): PK of the doctor it is given to.
+
+    Raises:
+        HTTPException: Raises 422 if the doctor is on another shard than
+            the appointment.
+    """
+    if shard_of(appointment_id) != shard_of(doctor_id):
+        raise HTTPException(
+            status_code=422,
+            detail='Appointments cannot be moved to a doctor of another '
+            'shard.'
+        )
+
+
+def create_doctor(db: ShardedSession, doctor: schemas.DoctorCreate):
+    """
+    Creates a `Doctor` in the shard chosen by its email.
+
+    Args:
+        doctor (schemas.DoctorCreate): The doctor to create.
+
+    Raises:
+        HTTPException: Raises 422 if a doctor already has the email.
+
+    Returns:
+        Doctor: The created doctor.
+    """
+    with _email_write(db, doctor.email):
+        return crud.create_doctor(db.for_email(doctor.email), doctor)
+
+
+def update_doctor(db: ShardedSession, doctor: schemas.DoctorCreate,
+                  doctor_id: int):
+    """
+    Updates a `Doctor` with an email no doctor of any shard has.
+
+    Args:
+        doctor (schemas.DoctorCreate): The new fields of the doctor.
+        doctor_id (int): PK of the doctor to update.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found with the
+            given doctor_id, or 422 if another doctor has the email.
+
+    Returns:
+        Doctor: The updated doctor.
+    """
+    with _email_write(db, doctor.email, doctor_id):
+        return crud.update_doctor(
+            db.for_doctor(doctor_id), doctor, doctor_id)
+
+
+def patch_doctor(db: ShardedSession, doctor: schemas.DoctorPatch,
+                 doctor_id: int):
+    """
+    Updates the given fields of a `Doctor`, with an email no doctor of any
+    shard has.
+
+    Args:
+        doctor (schemas.DoctorPatch): The fields to update.
+        doctor_id (int): PK of the doctor to update.
+
+    Raises:
+        HTTPException: Raises 404 if no doctor object is found with the
+            given doctor_id, or 422 if another doctor has the email.
+
+    Returns:
+        schemas.Doctor: The updated doctor.
+    """
+    if doctor.email is None:
+        return crud.patch_doctor(
+            db.for_doctor(doctor_id), doctor, doctor_id)
+    with _email_write(db, doctor.email, doctor_id):
+        return crud.patch_doctor(
+            db.for_doctor(doctor_id), doctor, doctor_id)
+
+
+def get_doctors(
+    db: ShardedSession,
+    skip: int = 0,
+    limit: int = 100,
+    after: str = None
+):
+    """
+    Return a page of `Doctor` schemas of every shard, ordered by id.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        after (str, optional): Cursor from `crud.get_doctors_cursor`.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        List[schemas.Doctor]: The page of doctors.
+    """
+    if DB_SHARDS == 1:
+        return crud.get_cached_doctors(db.shard(0), skip, limit, after)
+
+    def load():
+        # Doctors of later shards only follow once earlier ones are used.
+        wanted = skip + limit
+        db_doctors = []
+        for session in db.all():
+            db_doctors.extend(crud.get_doctors(
+                session, 0, wanted - len(db_doctors), after))
+            if len(db_doctors) == wanted:
+                break
+        return [
+            schemas.Doctor.from_orm(db_doctor)
+            for db_doctor in db_doctors[skip:]
+        ]
+
+    version = versions.global_version(db.all())
+    return doctor_list_cache.get_or_load(
+        (version, skip, limit, after), load)
+
+
+def _ids_by_shard(ids):
+    ids_by_shard = defaultdict(list)
+    for id_ in ids:
+        ids_by_shard[shard_of(id_)].append(id_)
+    return ids_by_shard
+
+
+def _get_by_ids(db: ShardedSession, ids, get_by_ids):
+    """
+    Fetches objects by id with one query per shard holding any of them.
+
+    Args:
+        ids (List[int]): The requested ids, possibly repeated.
+        get_by_ids (callable): `crud` function returning the objects found
+            in a shard by id.
+
+    Returns:
+        tuple: The objects found, in the order of their first request, and
+            the ids not found, in the order requested.
+    """
+    ids = list(dict.fromkeys(ids))
+    found = {}
+    for shard, shard_ids in _ids_by_shard(ids).items():
+        found.update(get_by_ids(db.shard(shard), shard_ids))
+    return (
+        [found[id_] for id_ in ids if id_ in found],
+        [id_ for id_ in ids if id_ not in found]
+    )
+
+
+def get_doctors_by_ids(db: ShardedSession, ids):
+    """
+    Returns the doctors with the given ids, in the order requested.
+
+    Args:
+        ids (List[int]): PKs of the doctor objects.
+
+    Returns:
+        tuple: The `Doctor` objects found and the ids not found.
+    """
+    return _get_by_ids(db, ids, crud.get_doctors_by_ids)
+
+
+def get_appointments_by_ids(db: ShardedSession, ids):
+    """
+    Returns the appointments with the given ids and their doctors, in the
+    order requested.
+
+    Args:
+        ids (List[int]): PKs of the appointment objects.
+
+    Returns:
+        tuple: The `Appointment` objects found and the ids not found.
+    """
+    return _get_by_ids(db, ids, crud.get_appointments_by_ids)
+
+
+def get_calendar_json(db: ShardedSession, doctor_ids, week):
+    """
+    Returns a week of the appointments of doctors, occurrences of their
+    series included, as columns, encoded as JSON.
+
+    Runs one query for the doctors, then one for the appointments and one
+    for the series per shard holding any of them, plus one for the
+    exceptions of any series found.
+
+    Args:
+        doctor_ids (List[int]): PKs of the doctors.
+        week (date): Any date of the week, which starts on Monday.
+
+    Returns:
+        bytes: The JSON body, following `schemas.Calendar`.
+    """
+    monday = week - timedelta(days=week.weekday())
+    start_dt = datetime(monday.year, monday.month, monday.day)
+    end_dt = start_dt + timedelta(weeks=1)
+    db_doctors, missing = get_doctors_by_ids(db, doctor_ids)
+    rows = []
+    occurrences = []
+    for shard, shard_ids in _ids_by_shard(
+        db_doctor.id for db_doctor in db_doctors
+    ).items():
+        rows.extend(crud.get_calendar_rows(
+            db.shard(shard), shard_ids, start_dt, end_dt))
+        occurrences.extend(crud.get_calendar_occurrences(
+            db.shard(shard), shard_ids, start_dt, end_dt))
+    return encode_calendar(monday, db_doctors, missing, rows, occurrences)
+
+
+def encode_calendar(monday, db_doctors, missing, rows, occurrences=()):
+    """
+    Encodes a week of appointments as columns.
+
+    The doctors are listed once, in the order requested. Each appointment
+    refers to its doctor by index in that list, and its times are whole
+    seconds from the start of the week, so no value is repeated per
+    appointment. The occurrences of series are merged in by start with a
+    null id. The id of their series and their index in it are listed apart,
+    in the same order, so appointments pay nothing for them.
+
+    Args:
+        monday (date): First day of the week.
+        db_doctors (List[Doctor]): The doctors, in the order requested.
+        missing (List[int]): Requested ids without a doctor.
+        rows (list): Rows from `crud.get_calendar_rows`, grouped by doctor.
+        occurrences (list, optional): Occurrences from
+            `crud.get_calendar_occurrences`, grouped by doctor.
+
+    Returns:
+        bytes: The JSON body, following `schemas.Calendar`.
+    """
+    start_dt = datetime(monday.year, monday.month, monday.day)
+    # Both as (start_dt, id, series_id, index, end_dt, patient_name).
+    rows_by_doctor = {
+        doctor_id: [
+            (row.start_dt, row.id, None, None, row.end_dt, row.patient_name)
+            for row in doctor_rows
+        ]
+        for doctor_id, doctor_rows in groupby(rows, lambda row: row.doctor_id)
+    }
+    occurrences_by_doctor = {
+        doctor_id: [
+            (start, None, series_id, index, end, patient_name)
+            for _, series_id, index, start, end, patient_name
+            in doctor_occurrences
+        ]
+        for doctor_id, doctor_occurrences in groupby(
+            occurrences, lambda occurrence: occurrence[0])
+    }
+
+    second = timedelta(seconds=1)
+    ids, series_ids, indexes, doctors = [], [], [], []
+    starts, ends, patient_names = [], [], []
+    for position, db_doctor in enumerate(db_doctors):
+        for start, id_, series_id, index, end, patient_name in heapq.merge(
+            rows_by_doctor.get(db_doctor.id, ()),
+            occurrences_by_doctor.get(db_doctor.id, ()),
+            key=lambda entry: entry[0]
+        ):
+            ids.append(id_)
+            if id_ is None:
+                series_ids.append(series_id)
+                indexes.append(index)
+            doctors.append(position)
+            starts.append((start - start_dt) // second)
+            ends.append((end - start_dt) // second)
+            patient_names.append(patient_name)
+
+    return dumps_json({
+        'week': monday.isoformat(),
+        'start_dt': start_dt.isoformat(),
+        'doctors': {
+            'id': [db_doctor.id for db_doctor in db_doctors],
+            'first_name': [db_doctor.first_name for db_doctor in db_doctors],
+            'last_name': [db_doctor.last_name for db_doctor in db_doctors],
+            'email': [db_doctor.email for db_doctor in db_doctors],
+        },
+        'missing': missing,
+        'appointments': {
+            'id': ids,
+            'series_id': series_ids,
+            'index': indexes,
+            'doctor': doctors,
+            'start': starts,
+            'end': ends,
+            'patient_name': patient_names,
+        },
+    })
+
+
+def get_appointments(
+    db: ShardedSession,
+    start_date=None,
+    end_date=None,
+    skip: int = 0,
+    limit: int = 100,
+    after: str = None
+):
+    """
+    Returns a page of the appointments of every shard ordered by start_dt
+    and id.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        after (str, optional): Cursor from `crud.get_appointments_cursor`.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        List[Appointment]: A list of Appointment objects
+    """
+    if DB_SHARDS == 1:
+        return crud.get_appointments(
+            db.shard(0), start_date, end_date, skip, limit, after=after)
+
+    pages = [
+        crud.get_appointments(
+            session, start_date, end_date, 0, skip + limit, after=after)
+        for session in db.all()
+    ]
+    merged = heapq.merge(*pages, key=_appointment_key)
+    return list(islice(merged, skip, skip + limit))
+
+
+def get_appointments_json(
+    db: ShardedSession,
+    start_date=None,
+    end_date=None,
+    skip: int = 0,
+    limit: int = 100,
+    after: str = None
+):
+    """
+    Returns the same page as `get_appointments`, already encoded as JSON.
+
+    Args:
+        skip (int, optional): Start of pagination. Defaults to 0.
+        limit (int, optional): End of pagination. Defaults to 100.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        after (str, optional): Cursor from a previous page.
+
+    Raises:
+        HTTPException: Raises 422 if the cursor is invalid.
+
+    Returns:
+        tuple: The JSON body as bytes and the cursor of the next page, or
+            None if this is the last page.
+    """
+    if DB_SHARDS == 1:
+        return crud.get_appointments_json(
+            db.shard(0), start_date, end_date, skip, limit, after=after)
+
+    pages = [
+        crud.get_appointment_rows(
+            session, start_date, end_date, 0, skip + limit, after=after)
+        for session in db.all()
+    ]
+    rows = list(islice(
+        heapq.merge(*pages, key=_appointment_key), skip, skip + limit))
+    return (
+        crud.appointment_rows_json(rows),
+        crud.get_appointments_cursor(rows, limit)
+    )
+
+
+def export_appointments(
+    db: ShardedSession,
+    export_format: str = 'ndjson',
+    start_date=None,
+    end_date=None,
+    doctor_id: int = None,
+    batch_size: int = 1000
+):
+    """
+    Streams the appointments of every shard as NDJSON or CSV, ordered by
+    start_dt and id.
+
+    Each shard is read `batch_size` rows at a time while the rows are
+    merged, so memory does not grow with the range.
+
+    Args:
+        export_format (str, optional): Either `ndjson` or `csv`.
+            Defaults to `ndjson`.
+        start_date (date, optional): Start date to filter appointments.
+        end_date (date, optional): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+        batch_size (int, optional): Rows per fetch and per chunk.
+
+    Returns:
+        Iterator[str]: Chunks of the export.
+    """
+    sessions = [db.for_doctor(doctor_id)] if doctor_id else db.all()
+    rows = heapq.merge(
+        *(
+            crud.query_export_rows(
+                session, start_date, end_date, doctor_id, batch_size)
+            for session in sessions
+        ),
+        key=_appointment_key
+    )
+    return crud.encode_export(rows, export_format, batch_size)
+
+
+def _search(db: ShardedSession, model, fts_table: str, q: str, limit: int,
+            after: str = None, fetch=None):
+    # Each shard ranks its own matches. Their pages are merged by rank,
+    # and the cursor holds the position of each shard after its last match
+    # on the page, so the next page merges from there. `fetch` returns the
+    # rows of some ids from a session, by default the instances of `model`.
+    query_words = search.words(q)
+    if not query_words:
+        raise HTTPException(status_code=422, detail='Search query is empty.')
+    if after:
+        try:
+            values = decode_cursor(after, *[int] * 4 * DB_SHARDS)
+        except ValueError:
+            raise HTTPException(status_code=422, detail='Invalid cursor.')
+        positions = [
+            tuple(values[index:index + 4])
+            for index in range(0, len(values), 4)
+        ]
+    else:
+        positions = [search.START] * DB_SHARDS
+
+    sessions = db.all()
+    pages = [
+        search.search(session, fts_table, query_words, limit, position)
+        for session, position in zip(sessions, positions)
+    ]
+    merged = heapq.merge(
+        *(
+            [(position[1:], shard, id_, position) for id_, position in matches]
+            for shard, (matches, _) in enumerate(pages)
+        )
+    )
+
+    ids = defaultdict(list)
+    order = []
+    for _, shard, id_, position in islice(merged, limit):
+        ids[shard].append(id_)
+        order.append((shard, id_))
+        positions[shard] = position
+    for shard, (matches, next_position) in enumerate(pages):
+        if len(ids[shard]) == len(matches):
+            positions[shard] = next_position or search.END
+
+    fetch = fetch or (lambda session, ids: session.query(model).filter(
+        model.id.in_(ids)))
+    found = {}
+    for shard, shard_ids in ids.items():
+        for row in fetch(sessions[shard], shard_ids):
+            found[shard, row.id] = row
+
+    next_cursor = None
+    if any(position != search.END for position in positions):
+        next_cursor = encode_cursor(
+            *(value for position in positions for value in position))
+    return [found[key] for key in order if key in found], next_cursor
+
+
+def search_doctors(db: ShardedSession, q: str, limit: int = 20,
+                   after: str = None):
+    """
+    Returns the doctors of every shard whose names match a query, best
+    match first.
+
+    Args:
+        q (str): Words matching the start of a first or last name.
+        limit (int, optional): Maximum number of doctors to return.
+        after (str, optional): Cursor of the page to get.
+
+    Raises:
+        HTTPException: Raises 422 if q has no words or the cursor is
+            invalid.
+
+    Returns:
+        tuple: The doctors and the cursor of the next page, or None if
+            this is the last page.
+    """
+    if DB_SHARDS == 1:
+        return crud.search_doctors(db.shard(0), q, limit, after)
+    return _search(db, models.Doctor, 'doctors_fts', q, limit, after)
+
+
+def search_appointments_json(db: ShardedSession, q: str, limit: int = 20,
+                             after: str = None):
+    """
+    Returns the appointments of every shard whose patient names match a
+    query, best match first, already encoded as JSON.
+
+    Args:
+        q (str): Words matching the start of words of the patient name.
+        limit (int, optional): Maximum number of appointments to return.
+        after (str, optional): Cursor of the page to get.
+
+    Raises:
+        HTTPException: Raises 422 if q has no words or the cursor is
+            invalid.
+
+    Returns:
+        tuple: The JSON body as bytes and the cursor of the next page, or
+            None if this is the last page.
+    """
+    if DB_SHARDS == 1:
+        return crud.search_appointments_json(db.shard(0), q, limit, after)
+    rows, next_cursor = _search(
+        db,
+        models.Appointment,
+        'appointments_fts',
+        q,
+        limit,
+        after,
+        fetch=crud.get_appointment_rows_by_ids
+    )
+    return crud.appointment_rows_json(rows), next_cursor
+
+
+def get_availability(db: ShardedSession, day, duration: int = 30):
+    """
+    Returns the free slots of the doctors of every shard, ordered by id.
+
+    Args:
+        day (date): The date in the clinic's timezone.
+        duration (int, optional): Minimum length of a slot in minutes.
+
+    Returns:
+        List[schemas.DoctorAvailability]: The free slots of each doctor.
+    """
+    return [
+        availability
+        for session in db.all()
+        for availability in crud.get_availability(session, day, duration)
+    ]
+
+
+def get_doctor_stats(db: ShardedSession, start_date=None, end_date=None):
+    """
+    Returns the daily load and busiest hours of the doctors of every shard,
+    ordered by id.
+
+    Args:
+        start_date (date, optional): First day, in the clinic's timezone.
+        end_date (date, optional): Last day, in the clinic's timezone.
+
+    Returns:
+        List[schemas.DoctorStats]: The stats of each doctor.
+    """
+    return [
+        doctor_stats
+        for session in db.all()
+        for doctor_stats in crud.get_doctor_stats(
+            session, start_date, end_date)
+    ]
+
+
+def bulk_create_appointments(
+    db: ShardedSession,
+    appointments: List[schemas.AppointmentCreate]
+):
+    """
+    Creates appointments, in one transaction per shard of their doctors.
+
+    Args:
+        appointments (List[schemas.AppointmentCreate]): The items to
+            create.
+
+    Returns:
+        List[dict]: One result per item, in the order of the request, with
+            the keys and formats of `schemas.AppointmentBulkResult`.
+    """
+    if DB_SHARDS == 1:
+        return crud.bulk_create_appointments(db.shard(0), appointments)
+
+    groups = defaultdict(list)
+    for index, appointment in enumerate(appointments):
+        groups[shard_of(appointment.doctor_id)].append(index)
+
+    results = [None] * len(appointments)
+    for shard, indexes in groups.items():
+        shard_results = crud.bulk_create_appointments(
+            db.shard(shard), [appointments[index] for index in indexes])
+        for index, result in zip(indexes, shard_results):
+            result['index'] = index
+            results[index] = result
+    return results
+
+
+def delete_appointments(db: ShardedSession, start_date, end_date,
+                        doctor_id: int = None):
+    """
+    Deletes every appointment matching the filters, in one transaction per
+    shard.
+
+    Args:
+        start_date (date): Start date to filter appointments.
+        end_date (date): End date to filter appointments.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+
+    Returns:
+        int: Number of deleted appointments.
+    """
+    sessions = [db.for_doctor(doctor_id)] if doctor_id else db.all()
+    return sum(
+        crud.delete_appointments(session, start_date, end_date, doctor_id)
+        for session in sessions
+    )
+
+
+def shift_appointments(db: ShardedSession, start_date, end_date,
+                       minutes: int, doctor_id: int = None):
+    """
+    Moves every appointment matching the filters by the same amount of time.
+
+    Every shard is checked before any is moved, so a shift rejected by one
+    shard moves nothing. Each shard is then moved in its own transaction,
+    so a booking made in between can still fail a later shard.
+
+    Args:
+        start_date (date): Start date to filter appointments.
+        end_date (date): End date to filter appointments.
+        minutes (int): Minutes to move the appointments by, negative to
+            move them earlier.
+        doctor_id (int, optional): Filter appointments based on doctor_id.
+
+    Raises:
+        HTTPException: Raises 422 if a moved appointment would fall outside
+            the clinic hours or overlap an appointment that stays.
+
+    Returns:
+        int: Number of moved appointments.
+    """
+    if doctor_id or DB_SHARDS == 1:
+        session = db.for_doctor(doctor_id) if doctor_id else db.shard(0)
+        return crud.shift_appointments(
+            session, start_date, end_date, minutes, doctor_id)
+
+    sessions = db.all()
+    for session in sessions:
+        crud.shift_appointments(
+            session, start_date, end_date, minutes, dry_run=True)
+    return sum(
+        crud.shift_appointments(session, start_date, end_date, minutes)
+        for session in sessions
+    )
@@ -0,0 +1,181 @@
+"""
+Snapshots of the in memory database.
+
+With `SNAPSHOT_PATH` set, the in memory database is restored from that file
+at startup, then copied back to it every `SNAPSHOT_INTERVAL` seconds and at
+shutdown, with SQLite's online backup API. Run ``python -m app.snapshot
+dump`` against a file database to seed a snapshot from it. With `DB_SHARDS`
+set, each shard has its own snapshot, `{shard}` in the path being replaced
+by its index.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+
+from . import metrics
+from .database import DB_SHARDS
+from .database import IN_MEMORY
+from .database import engines
+from .database import memory_lock
+from .locks import doctor_locks
+
+
+logger = logging.getLogger(__name__)
+
+# Unset by default, which turns snapshots off.
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH')
+# Seconds between periodic snapshots, 0 to only snapshot at shutdown.
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 300))
+
+SNAPSHOTS_ENABLED = bool(SNAPSHOT_PATH) and IN_MEMORY
+
+if SNAPSHOT_PATH and not IN_MEMORY:
+    logger.warning('SNAPSHOT_PATH is ignored with a file database.')
+
+if SNAPSHOTS_ENABLED and DB_SHARDS > 1 and '{shard}' not in SNAPSHOT_PATH:
+    raise RuntimeError('SNAPSHOT_PATH must contain {shard} with DB_SHARDS.')
+
+
+def dump(connection, path: str, pages: int = -1):
+    """
+    Copies a database to a file, replacing it only once the copy is done.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database to copy.
+        path (str): The snapshot file.
+        pages (int, optional): Pages copied per step, all at once by
+            default.
+
+    Returns:
+        float: Seconds taken.
+    """
+    started = time.perf_counter()
+    partial = f'{path}.partial'
+    if os.path.exists(partial):
+        os.remove(partial)
+
+    target = sqlite3.connect(partial)
+    try:
+        connection.backup(target, pages=pages)
+    finally:
+        target.close()
+    os.replace(partial, path)
+    return time.perf_counter() - started
+
+
+def restore(connection, path: str):
+    """
+    Replaces the content of a database with a snapshot.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the database to fill.
+        path (str): The snapshot file.
+
+    Returns:
+        float: Seconds taken.
+    """
+    started = time.perf_counter()
+    source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        source.backup(connection)
+    finally:
+        source.close()
+    return time.perf_counter() - started
+
+
+def _shard_path(path: str, shard: int):
+    return path.replace('{shard}', str(shard))
+
+
+def _app_connection(shard: int):
+    # The connection every session of the shard shares. Checking it out of
+    # the pool instead would roll back the transaction of any session using
+    # it when returned.
+    return engines[shard].pool.connection.connection
+
+
+def restore_app_database():
+    """
+    Restores the in memory databases of the app from `SNAPSHOT_PATH`, if
+    snapshots are enabled and the files exist.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return
+
+    started = time.perf_counter()
+    restored = False
+    for shard in range(DB_SHARDS):
+        path = _shard_path(SNAPSHOT_PATH, shard)
+        if not os.path.exists(path):
+            continue
+        restored = True
+        seconds = restore(_app_connection(shard), path)
+        logger.info(
+            f'Restored {os.path.getsize(path)} bytes from {path} in '
+            f'{seconds:.3f}s.'
+        )
+    if restored:
+        metrics.record_startup(
+            'snapshot_restore', time.perf_counter() - started)
+
+
+def dump_app_database():
+    """
+    Copies the in memory databases of the app to `SNAPSHOT_PATH`.
+
+    Every request and booking waits for the copy. Sessions hold
+    `memory_lock` for the whole request, and bookings take `doctor_locks`
+    under it, so while both are held no transaction is open on any shard
+    and the snapshots are consistent with each other.
+    """
+    started = time.perf_counter()
+    size = 0
+    # In the order requests take them.
+    memory_lock.acquire()
+    try:
+        with doctor_locks(None):
+            for shard in range(DB_SHARDS):
+                path = _shard_path(SNAPSHOT_PATH, shard)
+                seconds = dump(_app_connection(shard), path)
+                size += os.path.getsize(path)
+                logger.info(f'Wrote snapshot {path} in {seconds:.3f}s.')
+    finally:
+        memory_lock.release()
+    metrics.record_snapshot(time.perf_counter() - started, size)
+
+
+async def dump_periodically():
+    """ Dumps the app database every `SNAPSHOT_INTERVAL` seconds. """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await loop.run_in_executor(None, dump_app_database)
+        except Exception:
+            logger.exception('Periodic snapshot failed.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('command', choices=['dump'])
+    parser.add_argument('path', help='The snapshot file to write.')
+    args = parser.parse_args()
+
+    if IN_MEMORY:
+        parser.error('set DATABASE_URL to the file database to copy.')
+
+    for shard, shard_engine in enumerate(engines):
+        path = _shard_path(args.path, shard)
+        raw_connection = shard_engine.raw_connection()
+        try:
+            seconds = dump(raw_connection.connection, path)
+        finally:
+            raw_connection.close()
+        print(f'Wrote {path} in {seconds:.3f}s.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Summary of the booked time of each doctor per clinic hour.
+
+The `doctor_hourly_loads` table is updated in the same transaction as each
+appointment write, so statistics cost O(days x doctors) instead of a scan of
+the appointments. Run ``python -m app.stats rebuild`` to recompute it from
+the appointments and ``python -m app.stats check`` to compare both.
+"""
+import argparse
+import sys
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import select
+
+from . import models
+from .utils import APPOINTMENT_END_TIME
+from .utils import APPOINTMENT_START_TIME
+from .utils import utc_to_local
+
+
+# Seconds of clinic time in a day, used for utilization.
+CLINIC_DAY_SECONDS = (APPOINTMENT_END_TIME - APPOINTMENT_START_TIME) * 3600
+
+
+def appointment_load(start_dt, end_dt):
+    """
+    Splits an appointment into the clinic hours it covers.
+
+    Args:
+        start_dt (datetime): Start as stored, naive utc.
+        end_dt (datetime): End as stored, naive utc.
+
+    Returns:
+        dict: Maps (day, hour) to (booked seconds, appointments started).
+    """
+    local_start = utc_to_local(start_dt).replace(tzinfo=None)
+    local_end = utc_to_local(end_dt).replace(tzinfo=None)
+
+    load = {}
+    current = local_start
+    first = True
+    while current < local_end or first:
+        hour_start = current.replace(minute=0, second=0, microsecond=0)
+        next_hour = min(hour_start + timedelta(hours=1), local_end)
+        seconds = int(max((next_hour - current).total_seconds(), 0))
+        load[(current.date(), current.hour)] = (seconds, 1 if first else 0)
+        first = False
+        current = next_hour
+    return load
+
+
+def apply_load(db, doctor_id: int, start_dt, end_dt, sign: int = 1):
+    """
+    Adds, or removes with a negative sign, an appointment from the summary.
+
+    Must be called within the transaction writing the appointment.
+
+    Args:
+        doctor_id (int): PK of the doctor of the appointment.
+        start_dt (datetime): Start as stored, naive utc.
+        end_dt (datetime): End as stored, naive utc.
+        sign (int, optional): 1 to add the appointment, -1 to remove it.
+    """
+    table = models.DoctorHourlyLoad.__table__
+    load = appointment_load(start_dt, end_dt)
+    for (day, hour), (seconds, count) in load.items():
+        where = and_(
+            table.c.doctor_id == doctor_id,
+            table.c.day == day,
+            table.c.hour == hour,
+        )
+        result = db.execute(
+            table.update().where(where).values(
+                booked_seconds=table.c.booked_seconds + sign * seconds,
+                appointments=table.c.appointments + sign * count,
+            )
+        )
+        if result.rowcount == 0 and sign > 0:
+            db.execute(table.insert().values(
+                doctor_id=doctor_id,
+                day=day,
+                hour=hour,
+                booked_seconds=seconds,
+                appointments=count,
+            ))
+
+
+def add_load(loads, doctor_id: int, start_dt, end_dt, sign: int = 1):
+    """
+    Adds, or removes with a negative sign, an appointment from loads.
+
+    Args:
+        loads (defaultdict): Maps (doctor_id, day, hour) to
+            [booked seconds, appointments], defaulting to [0, 0].
+        doctor_id (int): PK of the doctor of the appointment.
+        start_dt (datetime): Start as stored, naive utc.
+        end_dt (datetime): End as stored, naive utc.
+        sign (int, optional): 1 to add the appointment, -1 to remove it.
+    """
+    load = appointment_load(start_dt, end_dt)
+    for (day, hour), (seconds, count) in load.items():
+        entry = loads[(doctor_id, day, hour)]
+        entry[0] += sign * seconds
+        entry[1] += sign * count
+
+
+def apply_loads(db, loads):
+    """
+    Adds loads accumulated with `add_load` to the summary.
+
+    Runs a fixed number of statements however many appointments the loads
+    cover. Must be called within the transaction writing the appointments.
+
+    Args:
+        loads (dict): Maps (doctor_id, day, hour) to
+            [booked seconds, appointments].
+    """
+    loads = {key: values for key, values in loads.items() if any(values)}
+    if not loads:
+        return
+
+    table = models.DoctorHourlyLoad.__table__
+    days = [day for _, day, _ in loads]
+    existing = {
+        tuple(row) for row in db.execute(
+            select([table.c.doctor_id, table.c.day, table.c.hour]).where(
+                and_(
+                    table.c.doctor_id.in_({key[0] for key in loads}),
+                    table.c.day >= min(days),
+                    table.c.day <= max(days),
+                )
+            )
+        )
+    }
+
+    updates = [
+        {
+            'b_doctor_id': doctor_id,
+            'b_day': day,
+            'b_hour': hour,
+            'b_seconds': seconds,
+            'b_count': count,
+        }
+        for (doctor_id, day, hour), (seconds, count) in loads.items()
+        if (doctor_id, day, hour) in existing
+    ]
+    if updates:
+        db.execute(
+            table.update().where(and_(
+                table.c.doctor_id == bindparam('b_doctor_id'),
+                table.c.day == bindparam('b_day'),
+                table.c.hour == bindparam('b_hour'),
+            )).values(
+                booked_seconds=(
+                    table.c.booked_seconds + bindparam('b_seconds')),
+                appointments=table.c.appointments + bindparam('b_count'),
+            ),
+            updates
+        )
+
+    inserts = [
+        {
+            'doctor_id': doctor_id,
+            'day': day,
+            'hour': hour,
+            'booked_seconds': seconds,
+            'appointments': count,
+        }
+        for (doctor_id, day, hour), (seconds, count) in loads.items()
+        if (doctor_id, day, hour) not in existing
+    ]
+    if inserts:
+        db.execute(table.insert(), inserts)
+
+
+def compute_loads(db, batch_size: int = 10000):
+    """
+    Computes the summary from the appointments.
+
+    Returns:
+        dict: Maps (doctor_id, day, hour) to [booked seconds, appointments].
+    """
+    loads = defaultdict(lambda: [0, 0])
+    query = db.query(
+        models.Appointment.doctor_id,
+        models.Appointment.start_dt,
+        models.Appointment.end_dt,
+    ).yield_per(batch_size)
+    for row in query:
+        add_load(loads, row.doctor_id, row.start_dt, row.end_dt)
+    return loads
+
+
+def rebuild(db):
+    """
+    Replaces the summary with one computed from the appointments.
+
+    Returns:
+        int: Number of summary rows written.
+    """
+    loads = compute_loads(db)
+    db.query(models.DoctorHourlyLoad).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.DoctorHourlyLoad, [
+        {
+            'doctor_id': doctor_id,
+            'day': day,
+            'hour': hour,
+            'booked_seconds': seconds,
+            'appointments': count,
+        }
+        for (doctor_id, day, hour), (seconds, count) in loads.items()
+    ])
+    db.commit()
+    return len(loads)
+
+
+def check(db):
+    """
+    Compares the summary with one computed from the appointments.
+
+    Returns:
+        List[str]: A description of each mismatching summary row.
+    """
+    expected = compute_loads(db)
+    mismatches = []
+    for row in db.query(models.DoctorHourlyLoad):
+        key = (row.doctor_id, row.day, row.hour)
+        values = expected.pop(key, [0, 0])
+        if [row.booked_seconds, row.appointments] != values:
+            mismatches.append(
+                f'{key}: stored {row.booked_seconds}s/{row.appointments}, '
+                f'expected {values[0]}s/{values[1]}'
+            )
+    for key, values in expected.items():
+        if values != [0, 0]:
+            mismatches.append(
+                f'{key}: missing, expected {values[0]}s/{values[1]}')
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('command', choices=['rebuild', 'check'])
+    args = parser.parse_args()
+
+    from .database import SessionLocals
+    from .database import engines
+    from .models import Base
+
+    mismatches = []
+    for index, SessionLocal in enumerate(SessionLocals):
+        Base.metadata.create_all(bind=engines[index])
+        db = SessionLocal()
+        try:
+            if args.command == 'rebuild':
+                print(f'Shard {index}: wrote {rebuild(db)} summary rows.')
+            else:
+                mismatches += check(db)
+        finally:
+            db.close()
+
+    if args.command == 'check':
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f'{len(mismatches)} mismatching summary rows.')
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
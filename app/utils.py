@@ -1,16 +1,79 @@
+import base64
+import binascii
+import os
+from bisect import bisect_right
+from datetime import datetime
+from datetime import timedelta
+from functools import lru_cache
+
+import orjson
 import pytz
+from fastapi import HTTPException
+from fastapi import Query
+from fastapi import Request
+from fastapi import Response
 
 
 APPOINTMENT_START_TIME = 9
 APPOINTMENT_END_TIME = 17
 NO_APPOINTMENT_WEEKDAY_CODE = 6
 PH_TIMEZONE = pytz.timezone('Asia/Manila')
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+# Serve large lists through `dumps_json` instead of the response model.
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', '0') == '1'
+# Most ids fetched by one batch request. Each id is a bound variable of the
+# IN query, and SQLite before 3.32 allows at most 999 of them.
+BATCH_MAX_IDS = int(os.environ.get('BATCH_MAX_IDS', 900))
+# Comma separated ids, e.g. `3,1,2`.
+ID_LIST_PATTERN = r'^\d+(,\d+)*$'
+
+# Appointments never cross the clinic window, so no appointment lasts longer
+# than this. Used to bound overlap range queries.
+MAX_APPOINTMENT_DURATION = timedelta(
+    hours=APPOINTMENT_END_TIME - APPOINTMENT_START_TIME)
+
+
+def _public_utc_to_local(naive_dt, local_tz):
+    local_dt = naive_dt.replace(tzinfo=pytz.utc).astimezone(local_tz)
+    return local_tz.normalize(local_dt)
+
+
+@lru_cache(maxsize=None)
+def _transitions(local_tz):
+    """
+    Returns the utc transition times of a pytz timezone and the tzinfo and
+    utc offset in effect from each of them.
+
+    The table is read from private attributes of pytz and checked against
+    its public API at every transition. Returns None, so that callers use
+    the public API, for timezones without transitions or when the private
+    attributes are missing or disagree with it.
+    """
+    try:
+        times = list(local_tz._utc_transition_times)
+        tzinfos = [
+            local_tz._tzinfos[info] for info in local_tz._transition_info]
+        offsets = [tzinfo._utcoffset for tzinfo in tzinfos]
+    except (AttributeError, KeyError, TypeError):
+        return None
+    if not times or len(times) != len(tzinfos):
+        return None
+
+    # The first time is datetime.min, before any real transition.
+    for time, tzinfo, offset in zip(times[1:], tzinfos[1:], offsets[1:]):
+        local_dt = _public_utc_to_local(time, local_tz)
+        if local_dt.tzinfo is not tzinfo or local_dt.utcoffset() != offset:
+            return None
+    return times, tzinfos, offsets
 
 
 def utc_to_local(utc_dt, local_tz=PH_TIMEZONE):
     """
     Changes a utc/naive datetime to an aware one.
 
+    Looks the offset up in the memoized transition table of the timezone,
+    which gives the same result as `astimezone` followed by `normalize`.
+
     Args:
         utc_dt (datetime): The naive datetime object to be converted.
         local_tz (pytz): Timezone information.
@@ -18,5 +81,193 @@ def utc_to_local(utc_dt, local_tz=PH_TIMEZONE):
     Returns:
         datetime: The timezone aware datetime.
     """
-    local_dt = utc_dt.replace(tzinfo=pytz.utc).astimezone(local_tz)
-    return local_tz.normalize(local_dt)
+    naive_dt = to_utc_naive(utc_dt)
+    table = _transitions(local_tz)
+    if table is None:
+        return _public_utc_to_local(naive_dt, local_tz)
+
+    times, tzinfos, offsets = table
+    index = bisect_right(times, naive_dt) - 1
+    return (naive_dt + offsets[index]).replace(tzinfo=tzinfos[index])
+
+
+def utc_to_local_many(utc_dts, local_tz=PH_TIMEZONE):
+    """
+    Changes a sequence of utc/naive datetimes to aware ones.
+
+    When every datetime falls between the same two transitions, which is
+    the usual case, a single offset is applied to the whole batch.
+
+    Args:
+        utc_dts (Sequence[datetime]): The naive datetimes to be converted.
+        local_tz (pytz): Timezone information.
+
+    Returns:
+        List[datetime]: The timezone aware datetimes, in the same order.
+    """
+    table = _transitions(local_tz)
+    if table is None or not utc_dts:
+        return [utc_to_local(utc_dt, local_tz) for utc_dt in utc_dts]
+
+    times, tzinfos, offsets = table
+    naive_dts = [to_utc_naive(utc_dt) for utc_dt in utc_dts]
+    first = bisect_right(times, min(naive_dts))
+    if first != bisect_right(times, max(naive_dts)):
+        return [utc_to_local(utc_dt, local_tz) for utc_dt in naive_dts]
+
+    tzinfo = tzinfos[first - 1]
+    offset = offsets[first - 1]
+    return [
+        (naive_dt + offset).replace(tzinfo=tzinfo) for naive_dt in naive_dts
+    ]
+
+
+def to_utc_naive(dt):
+    """
+    Changes a datetime to the naive utc form used by stored datetimes.
+
+    Args:
+        dt (datetime): Aware datetime, or naive datetime assumed to be utc.
+
+    Returns:
+        datetime: The naive utc datetime.
+    """
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def clinic_window(day):
+    """
+    Returns the clinic hours of a local date as naive utc datetimes.
+
+    Args:
+        day (date): The date in the clinic's timezone.
+
+    Returns:
+        tuple: The (start, end) datetimes, or None if the clinic is closed.
+    """
+    if day.weekday() == NO_APPOINTMENT_WEEKDAY_CODE:
+        return None
+
+    start_dt = PH_TIMEZONE.localize(
+        datetime(day.year, day.month, day.day, APPOINTMENT_START_TIME))
+    end_dt = PH_TIMEZONE.localize(
+        datetime(day.year, day.month, day.day, APPOINTMENT_END_TIME))
+    return to_utc_naive(start_dt), to_utc_naive(end_dt)
+
+
+def encode_cursor(*values):
+    """
+    Encodes the sort key of the last row of a page into an opaque cursor.
+
+    Args:
+        *values (datetime or int): Sort key values, in sort order.
+
+    Returns:
+        str: The url safe cursor.
+    """
+    raw = '|'.join(
+        value.isoformat() if isinstance(value, datetime) else str(value)
+        for value in values
+    )
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decodes a cursor made by `encode_cursor`.
+
+    Args:
+        cursor (str): The opaque cursor.
+        *types (type): Expected type of each value, either datetime or int.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+
+    Returns:
+        tuple: The decoded sort key values.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (binascii.Error, UnicodeError):
+        raise ValueError('Malformed cursor.')
+
+    parts = raw.split('|')
+    if len(parts) != len(types):
+        raise ValueError('Malformed cursor.')
+
+    return tuple(
+        datetime.fromisoformat(part) if type_ is datetime else type_(part)
+        for part, type_ in zip(parts, types)
+    )
+
+
+def id_list(ids: str = Query(..., regex=ID_LIST_PATTERN)):
+    """
+    Dependency parsing the comma separated ids of a batch GET request.
+
+    Args:
+        ids (str): The ids, e.g. `3,1,2`.
+
+    Raises:
+        HTTPException: Raises 422 if there are more than `BATCH_MAX_IDS`.
+
+    Returns:
+        List[int]: The ids, in the given order.
+    """
+    parsed = [int(id_) for id_ in ids.split(',')]
+    if len(parsed) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=422, detail=f'At most {BATCH_MAX_IDS} ids.')
+    return parsed
+
+
+def dumps_json(content):
+    """
+    Encodes content as JSON with orjson, byte for byte like FastAPI's
+    `JSONResponse`.
+
+    Args:
+        content (object): JSON compatible data, without datetimes.
+
+    Returns:
+        bytes: The encoded JSON.
+    """
+    return orjson.dumps(content)
+
+
+def etag_matches(request: Request, etag: str):
+    """
+    Checks if the `If-None-Match` header of a request matches an ETag.
+
+    Args:
+        request (Request): The request.
+        etag (str): The current quoted ETag of the resource.
+
+    Returns:
+        bool: True if the client already has this representation.
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate in (etag, '*'):
+            return True
+    return False
+
+
+def not_modified(etag: str):
+    """
+    Returns a `304 Not Modified` response for an ETag.
+
+    Args:
+        etag (str): The current quoted ETag of the resource.
+
+    Returns:
+        Response: The empty response.
+    """
+    return Response(status_code=304, headers={'ETag': etag})
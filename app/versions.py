@@ -0,0 +1,144 @@
+"""
+Version counters used to build the ETags of read endpoints.
+
+Writes bump the counters in the same transaction as the data they change,
+so an ETag is stale as soon as the data it was derived from is.
+"""
+import hashlib
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.orm import Query
+
+from . import aio
+from . import models
+from .database import IN_MEMORY
+
+
+GLOBAL_SCOPE = 'global'
+# An in memory database restarts its counters with the process, so tell its
+# ETags apart from the ones handed out before.
+_EPOCH = uuid.uuid4().hex if IN_MEMORY else ''
+
+
+def doctor_scope(doctor_id: int):
+    """ Returns the scope of a doctor and its appointments. """
+    return f'doctor:{doctor_id}'
+
+
+def bump(db, doctor_ids=()):
+    """
+    Bumps the global counter and the counters of the given doctors.
+
+    Runs a fixed number of statements however many doctors are given. Must
+    be called within the transaction of the write.
+
+    Args:
+        doctor_ids (Iterable[int], optional): Doctors whose record or
+            appointments change.
+    """
+    table = models.ChangeVersion.__table__
+    scopes = [GLOBAL_SCOPE] + [
+        doctor_scope(doctor_id) for doctor_id in set(doctor_ids)]
+    result = db.execute(
+        table.update().where(table.c.scope.in_(scopes)).values(
+            version=table.c.version + 1)
+    )
+    if result.rowcount == len(scopes):
+        return
+
+    existing = {
+        row.scope for row in db.execute(
+            select([table.c.scope]).where(table.c.scope.in_(scopes)))
+    }
+    db.execute(table.insert(), [
+        {'scope': scope, 'version': 1}
+        for scope in scopes if scope not in existing
+    ])
+
+
+def version(db, scope: str):
+    """
+    Returns the counter of a scope.
+
+    Args:
+        scope (str): `GLOBAL_SCOPE` or a `doctor_scope`.
+
+    Returns:
+        int: The counter, 0 if the scope was never written.
+    """
+    return _version_query(scope).with_session(db).scalar() or 0
+
+
+def _version_query(scope: str):
+    return Query(models.ChangeVersion.version).filter(
+        models.ChangeVersion.scope == scope)
+
+
+def global_version(dbs):
+    """
+    Returns the sum of the global counters of several shards.
+
+    Counters only grow, so their sum changes whenever one of them does.
+
+    Args:
+        dbs (List[Session]): The session of each shard.
+
+    Returns:
+        int: The sum of the counters.
+    """
+    return sum(version(db, GLOBAL_SCOPE) for db in dbs)
+
+
+def _etag(version: int, scope: str, variant: str):
+    digest = hashlib.md5(
+        f'{_EPOCH}{scope}?{variant}'.encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+
+def etag(db, scope: str, variant: str = ''):
+    """
+    Returns a strong ETag for a representation of a scope.
+
+    Args:
+        scope (str): `GLOBAL_SCOPE` or a `doctor_scope`.
+        variant (str, optional): What else selects the representation,
+            usually the query string.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    return _etag(version(db, scope), scope, variant)
+
+
+async def etag_async(conn, scope: str, variant: str = ''):
+    """
+    Returns the same ETag as `etag`, read with an `aio` connection.
+
+    Args:
+        conn (aiosqlite.Connection): Connection of a `AsyncShardedSession`.
+        scope (str): `GLOBAL_SCOPE` or a `doctor_scope`.
+        variant (str, optional): What else selects the representation,
+            usually the query string.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    version = await aio.fetch_scalar(conn, _version_query(scope))
+    return _etag(version or 0, scope, variant)
+
+
+def global_etag(dbs, variant: str = ''):
+    """
+    Returns a strong ETag for a representation of the global scope of
+    several shards.
+
+    Args:
+        dbs (List[Session]): The session of each shard.
+        variant (str, optional): What else selects the representation,
+            usually the query string.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    return _etag(global_version(dbs), GLOBAL_SCOPE, variant)
@@ -0,0 +1,290 @@
+"""
+Load test of the API against a seeded dataset.
+
+Seeds the database configured for the app, then drives `app.main:app` in
+process with concurrent clients for each scenario and reports latency
+percentiles, throughput, CPU time and SQL statements per request. Example::
+
+    python -m benchmarks --doctors 10000 --appointments 5000000 \\
+        --output results.json --baseline baseline.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from urllib.parse import quote
+
+from app.database import SessionLocal
+from app.database import engine
+from app.main import app
+from .client import ASGIClient
+from .client import count_statements
+from .seed import FIRST_NAMES
+from .seed import LAST_NAMES
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import seed
+from .seed import slot
+
+
+# Metrics where a higher value is a regression. Throughput is the opposite.
+LOWER_IS_BETTER = (
+    'p50_ms', 'p95_ms', 'p99_ms', 'cpu_ms_per_request',
+    'statements_per_request',
+)
+
+
+def _iso(dt):
+    return dt.isoformat() + 'Z'
+
+
+class Scenarios:
+    """ Builds the requests of each scenario against the seeded data. """
+
+    def __init__(self, doctors: int, appointments: int, free_day,
+                 page_size: int = 100):
+        self.doctors = doctors
+        self.page_size = page_size
+        self.appointments = appointments
+        self.free_days = clinic_days(free_day)
+        self.days = []
+        self.created = []
+
+    def _free_slot(self, index):
+        day_index, slot_index = divmod(
+            index // self.doctors, SLOTS_PER_DAY)
+        while len(self.days) <= day_index:
+            self.days.append(next(self.free_days))
+        return slot(self.days[day_index], slot_index)
+
+    def detail(self, index):
+        appointment_id = random.randint(1, self.appointments)
+        return 'GET', f'/appointments/{appointment_id}/', None
+
+    def list(self, index):
+        doctor_id = random.randint(1, self.doctors)
+        return (
+            'GET',
+            f'/doctors/{doctor_id}/appointments/?limit={self.page_size}',
+            None
+        )
+
+    def search(self, index):
+        # Prefixes of one or two name words, as typed at the front desk.
+        words = random.choice(FIRST_NAMES + LAST_NAMES).split()
+        words.append(random.choice(LAST_NAMES))
+        q = ' '.join(
+            word[:random.randint(2, len(word))]
+            for word in words[:random.randint(1, 2)]
+        )
+        return 'GET', f'/appointments/search/?q={quote(q)}', None
+
+    def create(self, index):
+        start_dt, end_dt = self._free_slot(index)
+        return 'POST', '/appointments/', {
+            'patient_name': f'Benchmark{index}',
+            'start_dt': _iso(start_dt),
+            'end_dt': _iso(end_dt),
+            'doctor_id': index % self.doctors + 1,
+        }
+
+    def update(self, index):
+        appointment = self.created[index % len(self.created)]
+        body = dict(appointment, comment=f'Updated {index}')
+        for key in ('start_dt', 'end_dt'):
+            body[key] = body[key] + 'Z'
+        for key in ('id', 'doctor'):
+            body.pop(key)
+        return 'PUT', f'/appointments/{appointment["id"]}/', body
+
+    def patch(self, index):
+        appointment = self.created[index % len(self.created)]
+        return (
+            'PATCH',
+            f'/appointments/{appointment["id"]}/',
+            {'comment': f'Patched {index}'}
+        )
+
+    def delete(self, index):
+        appointment = self.created[index]
+        return 'DELETE', f'/appointments/{appointment["id"]}/', None
+
+
+def _percentile(values, percent):
+    index = max(0, int(round(percent / 100 * len(values))) - 1)
+    return values[index]
+
+
+async def run_scenario(client, build, requests: int, concurrency: int):
+    """
+    Sends `requests` requests built by `build` from `concurrency` clients.
+
+    Args:
+        client (ASGIClient): Client of the app.
+        build (callable): Returns (method, path, body) for a request index.
+        requests (int): Number of requests to send.
+        concurrency (int): Number of concurrent clients.
+
+    Returns:
+        tuple: The result dict and the parsed bodies of the responses.
+    """
+    latencies = []
+    statements = []
+    errors = 0
+    bodies = [None] * requests
+    indexes = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in indexes:
+            method, path, body = build(index)
+            started = time.perf_counter()
+            status, content, count = await client.request(method, path, body)
+            latencies.append(time.perf_counter() - started)
+            statements.append(count)
+            if status >= 400:
+                errors += 1
+            elif content:
+                bodies[index] = json.loads(content)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    # Unlike the wall clock, it leaves out the time other processes ran.
+    cpu = time.process_time() - cpu_started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'p50_ms': _percentile(latencies, 50) * 1000,
+        'p95_ms': _percentile(latencies, 95) * 1000,
+        'p99_ms': _percentile(latencies, 99) * 1000,
+        'throughput_rps': requests / elapsed,
+        'cpu_ms_per_request': cpu / requests * 1000,
+        'statements_per_request': sum(statements) / requests,
+    }, bodies
+
+
+async def run(args):
+    db = SessionLocal()
+    started = time.perf_counter()
+    free_day = seed(db, args.doctors, args.appointments)
+    db.close()
+    seed_seconds = time.perf_counter() - started
+
+    count_statements(engine)
+    await app.router.startup()
+    client = ASGIClient(app)
+    scenarios = Scenarios(
+        args.doctors, args.appointments, free_day, args.page_size)
+    results = {}
+    for name in args.scenarios:
+        result, bodies = await run_scenario(
+            client, getattr(scenarios, name), args.requests, args.concurrency)
+        if name == 'create':
+            scenarios.created = [body for body in bodies if body]
+        results[name] = result
+    await app.router.shutdown()
+
+    return {
+        'dataset': {
+            'doctors': args.doctors,
+            'appointments': args.appointments,
+            'seed_seconds': seed_seconds,
+        },
+        'concurrency': args.concurrency,
+        'scenarios': results,
+    }
+
+
+def compare(results, baseline, tolerance: float):
+    """
+    Lists the metrics that regressed by more than tolerance.
+
+    Args:
+        results (dict): Results of this run.
+        baseline (dict): Results of a previous run.
+        tolerance (float): Allowed relative change, e.g. 0.1 for 10%.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if not previous:
+            continue
+        for metric, value in result.items():
+            if metric in ('requests', 'errors') or not previous.get(metric):
+                continue
+            change = (value - previous[metric]) / previous[metric]
+            if metric not in LOWER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f'{name}.{metric}: {previous[metric]:.3f} -> '
+                    f'{value:.3f} ({change:+.0%})'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--appointments', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument(
+        '--page-size',
+        type=int,
+        default=100,
+        help='Limit of the list scenario.'
+    )
+    parser.add_argument(
+        '--scenarios',
+        nargs='+',
+        default=[
+            'detail', 'list', 'search', 'create', 'update', 'patch', 'delete'
+        ],
+        choices=[
+            'detail', 'list', 'search', 'create', 'update', 'patch', 'delete'
+        ],
+        help='Update, patch and delete use the appointments made by create.'
+    )
+    parser.add_argument('--output', help='Write the results as JSON here.')
+    parser.add_argument('--baseline', help='Results to compare against.')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(args))
+
+    print(f'{"scenario":<10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}'
+          f'{"req/s":>10}{"cpu ms":>10}{"sql/req":>10}{"errors":>8}')
+    for name, result in results['scenarios'].items():
+        print(
+            f'{name:<10}{result["p50_ms"]:>10.2f}{result["p95_ms"]:>10.2f}'
+            f'{result["p99_ms"]:>10.2f}{result["throughput_rps"]:>10.1f}'
+            f'{result["cpu_ms_per_request"]:>10.2f}'
+            f'{result["statements_per_request"]:>10.2f}'
+            f'{result["errors"]:>8}'
+        )
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Benchmark of the free slots of many doctors against gaps found by clients.
+
+Seeds the database configured for the app with doctors booked in a random
+part of their slots over a horizon of clinic days, then finds the free slots
+of every doctor through `app.main:app` in process, first as the frontend
+used to, with one `/doctors/{id}/appointments/` call per doctor over the
+horizon and the gaps computed on the client, and then with one
+`/doctors/availability/` call per day. Reports the time and payload bytes of
+each way and the latency of the availability calls, and exits with status 1
+if the two ways find different slots. Example::
+
+    python -m benchmarks.availability --doctors 1000 --days 30
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime
+from datetime import timedelta
+from itertools import islice
+
+from app import models
+from app.database import SessionLocal
+from app.main import app
+from app.utils import clinic_window
+from .client import ASGIClient
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import patient_name
+from .seed import seed
+from .seed import slot
+
+
+def _book(db, doctors: int, days, booked: float, batch_size: int = 10000):
+    """ Books a random part of the slots of every doctor on every day. """
+    random.seed(0)
+    rows = []
+    booked_slots = int(SLOTS_PER_DAY * booked)
+    for day_index, day in enumerate(days):
+        for doctor_id in range(1, doctors + 1):
+            for index in random.sample(range(SLOTS_PER_DAY), booked_slots):
+                start_dt, end_dt = slot(day, index)
+                rows.append({
+                    'patient_name': patient_name(
+                        (day_index * doctors + doctor_id) * SLOTS_PER_DAY +
+                        index),
+                    'start_dt': start_dt,
+                    'end_dt': end_dt,
+                    'doctor_id': doctor_id,
+                })
+            if len(rows) >= batch_size:
+                db.bulk_insert_mappings(models.Appointment, rows)
+                db.commit()
+                rows = []
+    if rows:
+        db.bulk_insert_mappings(models.Appointment, rows)
+        db.commit()
+
+
+def _gaps(appointments, day, duration: timedelta):
+    """ Finds the free slots of a doctor on a day, as a client would. """
+    window_start, window_end = clinic_window(day)
+    gaps = []
+    free_from = window_start
+    for start_dt, end_dt in sorted(appointments):
+        if start_dt - free_from >= duration:
+            gaps.append((free_from, start_dt))
+        free_from = max(free_from, end_dt)
+    if window_end - free_from >= duration:
+        gaps.append((free_from, window_end))
+    return gaps
+
+
+def _naive(value: str):
+    return datetime.fromisoformat(value).replace(tzinfo=None)
+
+
+async def _fetch(client, paths):
+    started = time.perf_counter()
+    latencies = []
+    size = 0
+    contents = []
+    for path in paths:
+        request_started = time.perf_counter()
+        status, content, _ = await client.request('GET', path)
+        latencies.append(time.perf_counter() - request_started)
+        if status != 200:
+            raise RuntimeError(f'GET {path} failed with {status}.')
+        size += len(content)
+        contents.append(json.loads(content))
+    latencies.sort()
+    return contents, {
+        'requests': len(paths),
+        'ms': (time.perf_counter() - started) * 1000,
+        'bytes': size,
+        'p50_ms': latencies[len(latencies) // 2] * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+async def run(doctors: int, days: int, booked: float, duration: int):
+    """
+    Finds the free slots of every doctor on every day both ways.
+
+    Args:
+        doctors (int): Number of doctors to seed.
+        days (int): Number of clinic days of the horizon.
+        booked (float): Part of the slots of each day to book.
+        duration (int): Minimum length of a free slot in minutes.
+
+    Returns:
+        dict: The measurements of `per_doctor` and `availability`, and the
+            number of (doctor, day) pairs whose slots differ.
+    """
+    horizon = [day.date() for day in islice(clinic_days(), days)]
+    db = SessionLocal()
+    seed(db, doctors, 0)
+    _book(db, doctors, [
+        datetime(day.year, day.month, day.day) for day in horizon], booked)
+    db.close()
+
+    await app.router.startup()
+    client = ASGIClient(app)
+    min_duration = timedelta(minutes=duration)
+    limit = days * SLOTS_PER_DAY
+
+    started = time.perf_counter()
+    lists, per_doctor = await _fetch(client, [
+        f'/doctors/{doctor_id}/appointments/?start_date={horizon[0]}'
+        f'&end_date={horizon[-1]}&limit={limit}'
+        for doctor_id in range(1, doctors + 1)
+    ])
+    client_slots = {}
+    for doctor_id, appointments in enumerate(lists, 1):
+        # The clinic hours of a day fall within the same utc date.
+        by_day = defaultdict(list)
+        for appointment in appointments:
+            start_dt = _naive(appointment['start_dt'])
+            by_day[start_dt.date()].append(
+                (start_dt, _naive(appointment['end_dt'])))
+        for day in horizon:
+            client_slots[(doctor_id, day)] = _gaps(
+                by_day[day], day, min_duration)
+    per_doctor['ms'] = (time.perf_counter() - started) * 1000
+
+    days_availability, availability = await _fetch(client, [
+        f'/doctors/availability/?date={day}&duration={duration}'
+        for day in horizon
+    ])
+    mismatches = 0
+    for day, doctors_availability in zip(horizon, days_availability):
+        for doctor_availability in doctors_availability:
+            slots = [
+                (_naive(free['start_dt']), _naive(free['end_dt']))
+                for free in doctor_availability['slots']
+            ]
+            key = (doctor_availability['doctor_id'], day)
+            mismatches += slots != client_slots.pop(key, None)
+    mismatches += len(client_slots)
+
+    await app.router.shutdown()
+    return {
+        'per_doctor': per_doctor,
+        'availability': availability,
+        'mismatches': mismatches,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--booked', type=float, default=0.5)
+    parser.add_argument('--duration', type=int, default=30)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run(args.doctors, args.days, args.booked, args.duration))
+
+    per_doctor = results['per_doctor']
+    availability = results['availability']
+    print(f'{"metric":<12}{"per doctor":>14}{"availability":>14}'
+          f'{"ratio":>10}')
+    for key in per_doctor:
+        print(
+            f'{key:<12}{per_doctor[key]:>14.1f}{availability[key]:>14.1f}'
+            f'{per_doctor[key] / availability[key]:>9.1f}x'
+        )
+    if results['mismatches']:
+        print(f'{results["mismatches"]} doctor days have different slots.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark of fetching appointments and doctors by id, one by one or batched.
+
+Seeds the database configured for the app, then fetches the same random ids
+through `app.main:app` in process, first with one `GET /{id}/` call per id
+and then with a single `GET /batch/?ids=` and `POST /batch/` call. Reports
+the time, SQL statements and response bytes of each way. Example::
+
+    python -m benchmarks.batch --ids 500
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from app.database import SessionLocal
+from app.database import engine
+from app.main import app
+from .client import ASGIClient
+from .client import count_statements
+from .seed import seed
+
+
+async def _fetch(client, requests):
+    started = time.perf_counter()
+    statements = 0
+    size = 0
+    for method, path, body in requests:
+        status, content, request_statements = await client.request(
+            method, path, body)
+        if status != 200:
+            raise RuntimeError(f'{method} {path} failed with {status}.')
+        statements += request_statements
+        size += len(content)
+    return {
+        'requests': len(requests),
+        'ms': (time.perf_counter() - started) * 1000,
+        'statements': statements,
+        'bytes': size,
+    }
+
+
+async def run(doctors: int, appointments: int, ids: int):
+    """
+    Fetches random appointments and doctors one by one, then batched.
+
+    Args:
+        doctors (int): Number of doctors to seed.
+        appointments (int): Number of appointments to seed.
+        ids (int): Number of ids to fetch of each.
+
+    Returns:
+        list: One result per resource and way of fetching.
+    """
+    db = SessionLocal()
+    seed(db, doctors, appointments)
+    db.close()
+
+    count_statements(engine)
+    await app.router.startup()
+    client = ASGIClient(app)
+
+    random.seed(0)
+    results = []
+    for resource, total in (('appointments', appointments),
+                            ('doctors', doctors)):
+        sample = random.sample(range(1, total + 1), min(ids, total))
+        joined = ','.join(map(str, sample))
+        ways = (
+            ('single', [
+                ('GET', f'/{resource}/{id_}/', None) for id_ in sample]),
+            ('batch GET', [
+                ('GET', f'/{resource}/batch/?ids={joined}', None)]),
+            ('batch POST', [
+                ('POST', f'/{resource}/batch/', {'ids': sample})]),
+        )
+        for way, requests in ways:
+            result = await _fetch(client, requests)
+            results.append(dict(result, resource=resource, way=way))
+
+    await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--ids', type=int, default=500)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run(args.doctors, args.appointments, args.ids))
+
+    print(f'{"resource":<14}{"way":<12}{"requests":>10}{"ms":>10}'
+          f'{"sql":>8}{"bytes":>10}')
+    for result in results:
+        print(
+            f'{result["resource"]:<14}{result["way"]:<12}'
+            f'{result["requests"]:>10}{result["ms"]:>10.1f}'
+            f'{result["statements"]:>8}{result["bytes"]:>10}'
+        )
+
+
+if __name__ == '__main__':
+    main()
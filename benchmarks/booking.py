@@ -0,0 +1,141 @@
+"""
+Stress test of concurrent bookings.
+
+Seeds doctors, then has many threads book the same few slots of each doctor
+at once, each with its own `ShardedSession`, and checks that no doctor ends up
+double booked. Example::
+
+    DATABASE_URL=sqlite:///./booking.db python -m benchmarks.booking \\
+        --doctors 8 --writers 64 --attempts 2000
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+from datetime import timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app import crud
+from app import schemas
+from app.database import Base
+from app.database import SessionLocal
+from app.database import ShardedSession
+from app.database import engine
+from .seed import FIRST_DAY
+from .seed import SLOTS_PER_DAY
+from .seed import seed
+from .seed import slot
+
+
+OVERLAPS = text("""
+    SELECT COUNT(*) FROM appointments AS a
+    JOIN appointments AS b
+        ON a.doctor_id = b.doctor_id
+        AND a.id < b.id
+        AND a.start_dt < b.end_dt
+        AND b.start_dt < a.end_dt
+""")
+
+
+def _attempt(index: int, doctors: int, slots: int):
+    # Half slot shifts make neighbouring attempts overlap partially too.
+    start_dt, end_dt = slot(FIRST_DAY, random.randrange(slots))
+    shift = timedelta(minutes=15) * random.randint(0, 1)
+    return schemas.AppointmentCreate(
+        patient_name=f'Stress{index}',
+        start_dt=(start_dt + shift).isoformat() + 'Z',
+        end_dt=(end_dt + shift).isoformat() + 'Z',
+        doctor_id=random.randint(1, doctors),
+    )
+
+
+def run(doctors: int, writers: int, attempts: int, slots: int):
+    """
+    Books `attempts` random overlapping slots from `writers` threads.
+
+    Args:
+        doctors (int): Number of doctors to book.
+        writers (int): Number of concurrent threads.
+        attempts (int): Total number of bookings to attempt.
+        slots (int): Number of slots of the day to book.
+
+    Returns:
+        dict: Counts of created, rejected and failed bookings, the number
+            of overlapping pairs found afterwards and the throughput.
+    """
+    counts = {'created': 0, 'rejected': 0, 'failed': 0}
+    counts_lock = threading.Lock()
+    indexes = iter(range(attempts))
+    indexes_lock = threading.Lock()
+
+    def writer():
+        while True:
+            with indexes_lock:
+                index = next(indexes, None)
+            if index is None:
+                return
+            appointment = _attempt(index, doctors, slots)
+            db = ShardedSession()
+            try:
+                crud.create_appointment(
+                    db.for_doctor(appointment.doctor_id), appointment)
+                outcome = 'created'
+            except HTTPException:
+                outcome = 'rejected'
+            except Exception as e:
+                print(f'Booking {index} failed: {e!r}', file=sys.stderr)
+                outcome = 'failed'
+            finally:
+                db.close()
+            with counts_lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    overlaps = db.execute(OVERLAPS).scalar()
+    db.close()
+    return dict(
+        counts,
+        overlaps=overlaps,
+        attempts_per_second=attempts / elapsed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=64)
+    parser.add_argument('--attempts', type=int, default=2000)
+    parser.add_argument(
+        '--slots',
+        type=int,
+        default=SLOTS_PER_DAY - 1,
+        help='Slots of the day to book, fewer means more contention.'
+    )
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    seed(db, args.doctors, 0)
+    db.close()
+
+    result = run(args.doctors, args.writers, args.attempts, args.slots)
+    for key, value in result.items():
+        print(f'{key:<20}{value:>12.1f}' if isinstance(value, float)
+              else f'{key:<20}{value:>12}')
+    if result['overlaps'] or result['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
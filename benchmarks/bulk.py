@@ -0,0 +1,123 @@
+"""
+Benchmark of the set based appointment writes.
+
+For each size, gives a doctor that many appointments, one per clinic day,
+then shifts them all with `POST /appointments/shift/` and deletes them all
+with `DELETE /appointments/`. Reports the time, SQL statements and
+transactions of each request, which should not grow with the size.
+Example::
+
+    python -m benchmarks.bulk --sizes 10 100 1000 10000
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+from itertools import islice
+
+from sqlalchemy import event
+
+from app import models
+from app.database import SessionLocal
+from app.database import engine
+from app.main import app
+from .client import ASGIClient
+from .client import count_statements
+from .seed import clinic_days
+from .seed import seed
+from .seed import slot
+
+
+def _seed_doctor(db, doctor_id: int, size: int):
+    days = list(islice(clinic_days(), size))
+    rows = []
+    for day in days:
+        start_dt, end_dt = slot(day, 2)
+        rows.append({
+            'patient_name': f'Bulk{doctor_id}',
+            'start_dt': start_dt,
+            'end_dt': end_dt,
+            'doctor_id': doctor_id,
+        })
+    db.bulk_insert_mappings(models.Appointment, rows)
+    db.commit()
+    return days[0].date(), days[-1].date()
+
+
+async def run(sizes):
+    transactions = 0
+
+    def count_transaction(conn):
+        nonlocal transactions
+        transactions += 1
+
+    db = SessionLocal()
+    seed(db, len(sizes), 0)
+    ranges = [
+        _seed_doctor(db, doctor_id, size)
+        for doctor_id, size in enumerate(sizes, start=1)
+    ]
+    db.close()
+
+    count_statements(engine)
+    event.listen(engine, 'begin', count_transaction)
+    await app.router.startup()
+    client = ASGIClient(app)
+
+    results = []
+    for doctor_id, (size, (first_day, last_day)) in enumerate(
+        zip(sizes, ranges), start=1
+    ):
+        requests = (
+            ('shift', 'POST', '/appointments/shift/', {
+                'start_date': first_day.isoformat(),
+                'end_date': (last_day + timedelta(days=1)).isoformat(),
+                'doctor_id': doctor_id,
+                'minutes': 30,
+            }),
+            ('delete', 'DELETE', (
+                f'/appointments/?start_date={first_day}'
+                f'&end_date={last_day + timedelta(days=1)}'
+                f'&doctor_id={doctor_id}'
+            ), None),
+        )
+        for name, method, path, body in requests:
+            transactions = 0
+            started = asyncio.get_event_loop().time()
+            status, content, statements = await client.request(
+                method, path, body)
+            elapsed = asyncio.get_event_loop().time() - started
+            results.append({
+                'operation': name,
+                'size': size,
+                'status': status,
+                'response': content.decode(),
+                'ms': elapsed * 1000,
+                'statements': statements,
+                'transactions': transactions,
+            })
+
+    await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(args.sizes))
+
+    print(f'{"operation":<10}{"size":>8}{"status":>8}{"ms":>10}'
+          f'{"sql":>6}{"tx":>4}  response')
+    for result in results:
+        print(
+            f'{result["operation"]:<10}{result["size"]:>8}'
+            f'{result["status"]:>8}{result["ms"]:>10.1f}'
+            f'{result["statements"]:>6}{result["transactions"]:>4}  '
+            f'{result["response"]}'
+        )
+
+
+if __name__ == '__main__':
+    main()
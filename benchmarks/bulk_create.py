@@ -0,0 +1,136 @@
+"""
+Benchmark of booking a batch of appointments one by one or in bulk.
+
+Seeds the database configured for the app, then books the same number of
+free slots through `app.main:app` in process, first with one
+`POST /appointments/` call per item and then with a single
+`POST /appointments/bulk/` call. Reports the time, SQL statements and items
+booked per second of each way, and exits with status 1 if the bulk call is
+not `--min-speedup` times faster. Example::
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.bulk_create \\
+        --items 1000
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from itertools import islice
+
+from app.database import SessionLocal
+from app.database import engine
+from app.main import app
+from .client import ASGIClient
+from .client import count_statements
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import seed
+from .seed import slot
+
+
+def _items(doctors: int, days, indexes):
+    """ Builds one item in a free slot per index, spread over the doctors. """
+    items = []
+    for index in indexes:
+        day_index, slot_index = divmod(index // doctors, SLOTS_PER_DAY)
+        start_dt, end_dt = slot(days[day_index], slot_index)
+        items.append({
+            'patient_name': f'Bulk{index}',
+            'start_dt': start_dt.isoformat() + 'Z',
+            'end_dt': end_dt.isoformat() + 'Z',
+            'doctor_id': index % doctors + 1,
+        })
+    return items
+
+
+async def _book(client, requests, items: int):
+    started = time.perf_counter()
+    statements = 0
+    for path, body in requests:
+        status, content, request_statements = await client.request(
+            'POST', path, body)
+        if status != 200:
+            raise RuntimeError(f'POST {path} failed with {status}.')
+        if path.endswith('/bulk/'):
+            results = json.loads(content)
+            created = sum(
+                result['status'] == 'created' for result in results)
+            if created != len(body):
+                raise RuntimeError(
+                    f'{len(body) - created} bulk items were not created.')
+        statements += request_statements
+    seconds = time.perf_counter() - started
+    return {
+        'requests': len(requests),
+        'ms': seconds * 1000,
+        'statements': statements,
+        'items_per_second': items / seconds,
+    }
+
+
+async def run(doctors: int, appointments: int, items: int):
+    """
+    Books items one by one, then the same number of other items in bulk.
+
+    Args:
+        doctors (int): Number of doctors to seed.
+        appointments (int): Number of appointments to seed.
+        items (int): Number of appointments to book each way.
+
+    Returns:
+        list: One result per way of booking.
+    """
+    db = SessionLocal()
+    free_day = seed(db, doctors, appointments)
+    db.close()
+
+    count_statements(engine)
+    await app.router.startup()
+    client = ASGIClient(app)
+
+    days = list(islice(
+        clinic_days(free_day), 2 * items // doctors // SLOTS_PER_DAY + 1))
+    single = _items(doctors, days, range(items))
+    bulk = _items(doctors, days, range(items, 2 * items))
+    results = [
+        dict(await _book(
+            client, [('/appointments/', item) for item in single], items),
+            way='single'),
+        dict(await _book(
+            client, [('/appointments/bulk/', bulk)], items),
+            way='bulk'),
+    ]
+
+    await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--min-speedup', type=float, default=20)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run(args.doctors, args.appointments, args.items))
+
+    print(f'{"way":<8}{"requests":>10}{"ms":>10}{"sql":>8}'
+          f'{"items/s":>10}')
+    for result in results:
+        print(
+            f'{result["way"]:<8}{result["requests"]:>10}'
+            f'{result["ms"]:>10.1f}{result["statements"]:>8}'
+            f'{result["items_per_second"]:>10.0f}'
+        )
+    single, bulk = results
+    speedup = bulk['items_per_second'] / single['items_per_second']
+    print(f'Bulk booking is {speedup:.1f} times faster.')
+    if speedup < args.min_speedup:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""
+Benchmark of the weekly calendar of many doctors against per doctor lists.
+
+Seeds the database configured for the app with a full week of appointments
+for every doctor, then gets that week through `app.main:app` in process,
+first with one `/doctors/{id}/appointments/` call per doctor and then with
+one `/calendar/` call. Reports the time and payload bytes of each way, and
+the time taken to turn the fetched rows into the payload: read from
+`/metrics` for the lists, and timed around `shards.encode_calendar` for the
+calendar, which encodes within its endpoint. Exits with status 1 if the
+calendar is not `--min-ratio` times smaller and faster to serialize.
+Example::
+
+    python -m benchmarks.calendar --doctors 200
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from datetime import timedelta
+
+from app import crud
+from app import shards
+from app.database import SessionLocal
+from app.database import ShardedSession
+from app.main import app
+from .client import ASGIClient
+from .seed import FIRST_DAY
+from .seed import SLOTS_PER_DAY
+from .seed import seed
+
+
+# Clinic days of a week.
+WEEK_DAYS = 6
+
+
+async def _serialization_seconds(client, route: str):
+    status, content, _ = await client.request('GET', '/metrics')
+    match = re.search(
+        r'^serialization_seconds_total\{method="GET",route="' +
+        re.escape(route) + r'"\} (\S+)$',
+        content.decode(),
+        re.MULTILINE
+    )
+    return float(match.group(1)) if match else 0.0
+
+
+def _encode_calendar_seconds(doctor_ids, start_date):
+    # The same calls as `shards.get_calendar_json`, timing only the encoding.
+    db = ShardedSession()
+    db_doctors, missing = shards.get_doctors_by_ids(db, doctor_ids)
+    start_dt = FIRST_DAY
+    end_dt = start_dt + timedelta(weeks=1)
+    rows = crud.get_calendar_rows(db.shard(0), doctor_ids, start_dt, end_dt)
+    occurrences = crud.get_calendar_occurrences(
+        db.shard(0), doctor_ids, start_dt, end_dt)
+    started = time.perf_counter()
+    shards.encode_calendar(
+        start_date, db_doctors, missing, rows, occurrences)
+    elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed
+
+
+async def _fetch(client, route: str, paths):
+    serialization_before = await _serialization_seconds(client, route)
+    started = time.perf_counter()
+    size = 0
+    for path in paths:
+        status, content, _ = await client.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f'GET {path} failed with {status}.')
+        size += len(content)
+    elapsed = time.perf_counter() - started
+    serialization = (
+        await _serialization_seconds(client, route) - serialization_before)
+    return {
+        'requests': len(paths),
+        'ms': elapsed * 1000,
+        'bytes': size,
+        'serialization_ms': serialization * 1000,
+    }
+
+
+async def run(doctors: int):
+    """
+    Gets a full week of every doctor both ways.
+
+    Args:
+        doctors (int): Number of doctors to seed and get.
+
+    Returns:
+        dict: The measurements of `per_doctor` and `calendar`.
+    """
+    per_doctor = WEEK_DAYS * SLOTS_PER_DAY
+    db = SessionLocal()
+    seed(db, doctors, doctors * per_doctor)
+    db.close()
+
+    await app.router.startup()
+    client = ASGIClient(app)
+    start_date = FIRST_DAY.date()
+    end_date = start_date + timedelta(days=WEEK_DAYS)
+    doctor_ids = list(range(1, doctors + 1))
+    results = {
+        'per_doctor': await _fetch(
+            client,
+            '/doctors/{doctor_id}/appointments/',
+            [
+                f'/doctors/{doctor_id}/appointments/?start_date={start_date}'
+                f'&end_date={end_date}&limit={per_doctor}'
+                for doctor_id in doctor_ids
+            ]
+        ),
+        'calendar': await _fetch(
+            client,
+            '/calendar/',
+            [
+                f'/calendar/?week={start_date}&doctor_ids=' +
+                ','.join(map(str, doctor_ids))
+            ]
+        ),
+    }
+    results['calendar']['serialization_ms'] = _encode_calendar_seconds(
+        doctor_ids, start_date) * 1000
+    await app.router.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--min-ratio', type=float, default=5)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(args.doctors))
+
+    per_doctor = results['per_doctor']
+    calendar = results['calendar']
+    print(f'{"metric":<20}{"per doctor":>14}{"calendar":>14}{"ratio":>10}')
+    ratios = {}
+    for key in per_doctor:
+        ratios[key] = per_doctor[key] / calendar[key]
+        print(
+            f'{key:<20}{per_doctor[key]:>14.1f}{calendar[key]:>14.1f}'
+            f'{ratios[key]:>9.1f}x'
+        )
+    if min(ratios['bytes'], ratios['serialization_ms']) < args.min_ratio:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
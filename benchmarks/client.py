@@ -0,0 +1,106 @@
+import asyncio
+import json
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+
+_statements = ContextVar('statements', default=None)
+
+
+def _count_statement(conn, cursor, statement, parameters, context,
+                     executemany):
+    counter = _statements.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def count_statements(engine):
+    """
+    Counts the statements run by each request made with `ASGIClient`.
+
+    Args:
+        engine (Engine): The engine used by the app.
+    """
+    event.listen(engine, 'before_cursor_execute', _count_statement)
+
+
+class ASGIClient:
+    """
+    Minimal in process HTTP client calling an ASGI app directly.
+
+    Requests made concurrently run concurrently in the app, as they would
+    behind a server, without any network overhead.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def request(self, method: str, path: str, body=None,
+                      on_chunk=None):
+        """
+        Sends a request to the app.
+
+        Args:
+            method (str): HTTP method.
+            path (str): Path with an optional query string.
+            body (object, optional): Sent as the JSON body.
+            on_chunk (callable, optional): Called with each chunk of the
+                response body instead of keeping it, for streamed bodies.
+
+        Returns:
+            tuple: The status code, response body as bytes, empty with
+                on_chunk, and number of SQL statements run.
+        """
+        path, _, query_string = path.partition('?')
+        payload = json.dumps(body).encode() if body is not None else b''
+        headers = [(b'host', b'testserver')]
+        if body is not None:
+            headers.append((b'content-type', b'application/json'))
+            headers.append((b'content-length', str(len(payload)).encode()))
+
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': query_string.encode(),
+            'root_path': '',
+            'headers': headers,
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        sent = False
+        status = None
+        chunks = []
+        # Streamed responses stop once the client disconnects, so it only
+        # does after the whole body is sent.
+        responded = asyncio.Event()
+
+        async def receive():
+            nonlocal sent
+            if sent:
+                await responded.wait()
+                return {'type': 'http.disconnect'}
+            sent = True
+            return {'type': 'http.request', 'body': payload}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                if on_chunk is None:
+                    chunks.append(message.get('body', b''))
+                else:
+                    on_chunk(message.get('body', b''))
+                if not message.get('more_body', False):
+                    responded.set()
+
+        counter = [0]
+        _statements.set(counter)
+        await self.app(scope, receive, send)
+        return status, b''.join(chunks), counter[0]
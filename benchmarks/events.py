@@ -0,0 +1,210 @@
+"""
+Benchmark of the appointment change feed with many idle subscribers.
+
+Opens the streams of thousands of subscribers at once against `app.main:app`
+in process, half to `/appointments/stream/` and half to the stream of the
+doctor being booked, then books appointments from `--writers` concurrent
+clients. Reports the memory taken per subscriber and the latency from the
+start of each booking request to the delivery of its event to every
+subscriber. Exits with status 1 if an event is missing or reaches a
+subscriber out of order. With a file `DATABASE_URL`, the bookings commit and
+publish in parallel threads. Example::
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.events \\
+        --subscribers 5000 --events 200 --writers 8
+"""
+import argparse
+import asyncio
+import json
+import re
+import resource
+import statistics
+import sys
+import time
+from itertools import islice
+
+from app import events
+from app.main import app
+from .client import ASGIClient
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import slot
+
+
+# Bookings are numbered by the name of their patient.
+_PATIENT = re.compile(rb'"patient_name":"Stream(\d+)"')
+_EVENT_ID = re.compile(rb'^id: \w+-(\d+)$', re.M)
+
+
+def _max_rss_kb():
+    # Kilobytes on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def _scope(path: str):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'testserver')],
+        'client': ('127.0.0.1', 0),
+        'server': ('testserver', 80),
+    }
+
+
+class Subscriber:
+    """
+    Reads a stream until `stop` is done, timing each event received and
+    counting those received after a later one.
+    """
+
+    def __init__(self, path: str, stop, opened, sent_at, latencies):
+        self.stop = stop
+        self.opened = opened
+        self.sent_at = sent_at
+        self.latencies = latencies
+        self.last_seq = 0
+        self.out_of_order = 0
+        self.task = asyncio.ensure_future(
+            app(_scope(path), self.receive, self.send))
+
+    async def receive(self):
+        # Shielded, since the response cancels its wait for a disconnect
+        # when it ends.
+        await asyncio.shield(self.stop)
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.opened.append(message['status'])
+            return
+        received = time.perf_counter()
+        body = message.get('body', b'')
+        for match in _PATIENT.finditer(body):
+            self.latencies.append(received - self.sent_at[int(match[1])])
+        for match in _EVENT_ID.finditer(body):
+            seq = int(match[1])
+            if seq < self.last_seq:
+                self.out_of_order += 1
+            self.last_seq = max(self.last_seq, seq)
+
+
+async def run(subscribers: int, event_count: int, interval: float,
+              writers: int = 1):
+    """
+    Opens the streams, then books event_count appointments.
+
+    Args:
+        subscribers (int): Number of streams to open.
+        event_count (int): Number of appointments to book.
+        interval (float): Seconds between the bookings of a writer.
+        writers (int, optional): Number of concurrent booking clients.
+
+    Returns:
+        dict: Memory, setup time, events delivered and their latencies in
+            milliseconds.
+    """
+    client = ASGIClient(app)
+    status, body, _ = await client.request('POST', '/doctors/', {
+        'first_name': 'Stream',
+        'last_name': 'Doctor',
+        'email': 'stream@example.com',
+    })
+    doctor_id = json.loads(body)['id']
+
+    loop = asyncio.get_event_loop()
+    stop = loop.create_future()
+    opened = []
+    sent_at = {}
+    latencies = []
+    rss_before = _max_rss_kb()
+    started = time.perf_counter()
+    streams = [
+        Subscriber(
+            '/appointments/stream/' if index % 2 else
+            f'/doctors/{doctor_id}/appointments/stream/',
+            stop,
+            opened,
+            sent_at,
+            latencies
+        )
+        for index in range(subscribers)
+    ]
+    while len(opened) < subscribers:
+        await asyncio.sleep(0.01)
+    setup_seconds = time.perf_counter() - started
+    rss_kb = _max_rss_kb() - rss_before
+
+    indexes = iter(range(event_count))
+    days = list(islice(clinic_days(), event_count // SLOTS_PER_DAY + 1))
+
+    async def writer():
+        for index in indexes:
+            day, slot_index = divmod(index, SLOTS_PER_DAY)
+            start_dt, end_dt = slot(days[day], slot_index)
+            sent_at[index] = time.perf_counter()
+            status, body, _ = await client.request('POST', '/appointments/', {
+                'patient_name': f'Stream{index}',
+                'start_dt': start_dt.isoformat() + 'Z',
+                'end_dt': end_dt.isoformat() + 'Z',
+                'doctor_id': doctor_id,
+            })
+            if status != 200:
+                raise RuntimeError(f'Booking failed with {status}: {body}')
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(*(writer() for _ in range(writers)))
+    # Leave the last events time to reach every subscriber.
+    await asyncio.sleep(interval)
+    stop.set_result(None)
+    await asyncio.gather(*(stream.task for stream in streams))
+    latencies.sort()
+    return {
+        'subscribers': subscribers,
+        'open_seconds': setup_seconds,
+        'rss_mb': rss_kb / 1024,
+        'kb_per_subscriber': rss_kb / subscribers,
+        'events': event_count,
+        'delivered': len(latencies),
+        'missing': subscribers * event_count - len(latencies),
+        'out_of_order': sum(stream.out_of_order for stream in streams),
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000,
+        'max_ms': latencies[-1] * 1000,
+        'overflows': events.feed.stats()['overflows'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--subscribers', type=int, default=5000)
+    parser.add_argument('--events', type=int, default=50)
+    parser.add_argument(
+        '--interval',
+        type=float,
+        default=0.1,
+        help='Seconds between the bookings of a writer.'
+    )
+    parser.add_argument(
+        '--writers', type=int, default=1, help='Concurrent booking clients.')
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    result = loop.run_until_complete(
+        run(args.subscribers, args.events, args.interval, args.writers))
+    for key, value in result.items():
+        print(f'{key:<20}{value:>12.2f}' if isinstance(value, float)
+              else f'{key:<20}{value:>12}')
+    if result['missing'] or result['out_of_order']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark of the memory used to stream a large export.
+
+Seeds the database configured for the app, then streams every appointment
+from `/appointments/export/` through `app.main:app` in process, dropping
+each chunk as it arrives. Reports the rows, bytes and time of the export and
+how much the anonymous resident memory of the process grew, which leaves out
+the pages of a mapped database file, and exits with status 1 if it grew by
+more than `--max-growth-mb` or rows are missing. Linux only. Example::
+
+    DATABASE_URL=sqlite:///./bench.db python -m benchmarks.export \\
+        --appointments 1000000
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from app.database import SessionLocal
+from app.main import app
+from .client import ASGIClient
+from .seed import seed
+
+
+def _rss_anon_mb():
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('RssAnon:'):
+                return int(line.split()[1]) / 1024
+    raise RuntimeError('RssAnon is not reported, run this on Linux.')
+
+
+async def run(doctors: int, appointments: int, export_format: str):
+    """
+    Streams every appointment and tracks the memory of the process.
+
+    Args:
+        doctors (int): Number of doctors to seed.
+        appointments (int): Number of appointments to seed.
+        export_format (str): Either `ndjson` or `csv`.
+
+    Returns:
+        dict: The rows, bytes, time and memory of the export.
+    """
+    db = SessionLocal()
+    seed(db, doctors, appointments)
+    db.close()
+
+    await app.router.startup()
+    client = ASGIClient(app)
+    start_mb = peak_mb = _rss_anon_mb()
+    lines = 0
+    size = 0
+
+    def on_chunk(chunk):
+        nonlocal peak_mb, lines, size
+        lines += chunk.count(b'\n')
+        size += len(chunk)
+        peak_mb = max(peak_mb, _rss_anon_mb())
+
+    started = time.perf_counter()
+    status, _, _ = await client.request(
+        'GET', f'/appointments/export/?format={export_format}',
+        on_chunk=on_chunk)
+    seconds = time.perf_counter() - started
+    await app.router.shutdown()
+    if status != 200:
+        raise RuntimeError(f'The export failed with {status}.')
+
+    return {
+        # The csv export starts with a header line.
+        'rows': lines - (export_format == 'csv'),
+        'mb': size / 1024 / 1024,
+        'seconds': seconds,
+        'start_rss_mb': start_mb,
+        'peak_rss_mb': peak_mb,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--appointments', type=int, default=1000000)
+    parser.add_argument(
+        '--format', choices=['ndjson', 'csv'], default='ndjson')
+    parser.add_argument('--max-growth-mb', type=float, default=64)
+    args = parser.parse_args()
+
+    result = asyncio.get_event_loop().run_until_complete(
+        run(args.doctors, args.appointments, args.format))
+
+    growth_mb = result['peak_rss_mb'] - result['start_rss_mb']
+    print(f'{result["rows"]} rows, {result["mb"]:.1f} MB in '
+          f'{result["seconds"]:.1f} s '
+          f'({result["rows"] / result["seconds"]:.0f} rows/s)')
+    print(f'RSS {result["start_rss_mb"]:.1f} MB before, '
+          f'{result["peak_rss_mb"]:.1f} MB at peak, '
+          f'{growth_mb:+.1f} MB')
+    if result['rows'] != args.appointments:
+        print(f'{args.appointments - result["rows"]} rows are missing.')
+        sys.exit(1)
+    if growth_mb > args.max_growth_mb:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
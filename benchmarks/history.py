@@ -0,0 +1,129 @@
+"""
+Benchmark of booking latency as the history of a doctor grows.
+
+Seeds one doctor with past appointments, then times `crud.create_appointment`
+booking free slots after them, and grows the history to each of `--sizes`
+in turn. Reports the latency percentiles of the bookings at each size, and
+exits with status 1 if the p95 at the largest size is more than
+`--max-ratio` times the p95 at the smallest, that is if the overlap check
+slows down as the history grows. Example::
+
+    python -m benchmarks.history --sizes 100 10000 100000 1000000
+"""
+import argparse
+import sys
+import time
+from itertools import islice
+
+from app import crud
+from app import models
+from app import schemas
+from app.database import SessionLocal
+from app.database import engine
+from .__main__ import _percentile
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import patient_name
+from .seed import seed
+from .seed import slot
+
+
+def _extend(db, days, start: int, stop: int, batch_size: int = 10000):
+    # Appends the start-th to stop-th appointments of the history of doctor
+    # 1, one slot after the other.
+    for batch in range(start, stop, batch_size):
+        db.bulk_insert_mappings(models.Appointment, [
+            dict(zip(
+                ('start_dt', 'end_dt'),
+                slot(days[index // SLOTS_PER_DAY], index % SLOTS_PER_DAY)
+            ), patient_name=patient_name(index), doctor_id=1)
+            for index in range(batch, min(batch + batch_size, stop))
+        ])
+        db.commit()
+
+
+def run(sizes, bookings: int):
+    """
+    Times bookings of one doctor at each size of their history.
+
+    Args:
+        sizes (list): Increasing numbers of past appointments.
+        bookings (int): Number of bookings to time at each size.
+
+    Returns:
+        dict: The p50, p95 and p99 latencies in milliseconds at each size.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    seed(db, 1, 0)
+    # The history fills the first days, and the bookings the days after.
+    history_days = -(-max(sizes) // SLOTS_PER_DAY)
+    booking_days = -(-bookings // SLOTS_PER_DAY)
+    days = list(islice(clinic_days(), history_days + booking_days))
+
+    results = {}
+    seeded = 0
+    for size in sizes:
+        _extend(db, days, seeded, size)
+        seeded = size
+
+        latencies = []
+        created = []
+        for index in range(bookings):
+            start_dt, end_dt = slot(
+                days[history_days + index // SLOTS_PER_DAY],
+                index % SLOTS_PER_DAY
+            )
+            appointment = schemas.AppointmentCreate(
+                patient_name=f'Booking{index}',
+                start_dt=start_dt.isoformat() + 'Z',
+                end_dt=end_dt.isoformat() + 'Z',
+                doctor_id=1,
+            )
+            started = time.perf_counter()
+            created.append(crud.create_appointment(db, appointment).id)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        # The next size books the same slots again.
+        db.query(models.Appointment).filter(
+            models.Appointment.id.in_(created)
+        ).delete(synchronize_session=False)
+        db.commit()
+
+        latencies.sort()
+        results[size] = {
+            'p50_ms': _percentile(latencies, 50),
+            'p95_ms': _percentile(latencies, 95),
+            'p99_ms': _percentile(latencies, 99),
+        }
+    db.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        '--sizes', type=int, nargs='+',
+        default=[100, 10000, 100000, 1000000])
+    parser.add_argument('--bookings', type=int, default=1000)
+    parser.add_argument('--max-ratio', type=float, default=2)
+    args = parser.parse_args()
+    sizes = sorted(args.sizes)
+
+    results = run(sizes, args.bookings)
+
+    print(f'{"history":>10}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}')
+    for size, result in results.items():
+        print(f'{size:>10}' + ''.join(
+            f'{result[key]:>10.2f}' for key in ('p50_ms', 'p95_ms', 'p99_ms')
+        ))
+
+    ratio = results[sizes[-1]]['p95_ms'] / results[sizes[0]]['p95_ms']
+    print(f'p95 at {sizes[-1]} rows is {ratio:.2f} times the p95 at '
+          f'{sizes[0]} rows')
+    if ratio > args.max_ratio:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+Microbenchmark of the cost of the metrics per request.
+
+Serves the same endpoint, running `--statements` statements on its own
+SQLite engine, from two apps in process: one with the middleware, route
+class, cursor events and timed pool of the metrics and one without any of
+them. Requests to the two apps are sent in alternating rounds, so both see
+the same load from the rest of the machine, and the fastest round of each
+is kept. Reports the CPU time per request of each app and the difference,
+the time the metrics add to every request. Example::
+
+    python -m benchmarks.metrics --statements 3
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi import APIRouter
+from fastapi import FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from app import metrics
+from app.database import TimedQueuePool
+from .client import ASGIClient
+
+
+def _app(statements: int, measured: bool):
+    engine = create_engine(
+        'sqlite://',
+        poolclass=TimedQueuePool if measured else QueuePool,
+        connect_args={'check_same_thread': False},
+    )
+    if measured:
+        event.listen(
+            engine, 'before_cursor_execute', metrics.before_cursor_execute)
+        event.listen(
+            engine, 'after_cursor_execute', metrics.after_cursor_execute)
+    router = APIRouter(route_class=metrics.MetricsRoute) if measured else (
+        APIRouter())
+
+    @router.get('/statements/')
+    def run_statements():
+        with engine.connect() as connection:
+            for _ in range(statements):
+                connection.execute('SELECT 1').fetchall()
+        return {'statements': statements}
+
+    app = FastAPI()
+    app.include_router(router)
+    return metrics.MetricsMiddleware(app) if measured else app
+
+
+async def run(statements: int, requests: int, rounds: int):
+    """
+    Sends rounds of requests to the apps with and without the metrics.
+
+    Args:
+        statements (int): Statements run by each request.
+        requests (int): Requests per round.
+        rounds (int): Rounds sent to each app.
+
+    Returns:
+        dict: The fastest CPU ms per request of each app.
+    """
+    clients = {
+        'without': ASGIClient(_app(statements, measured=False)),
+        'with': ASGIClient(_app(statements, measured=True)),
+    }
+    results = {}
+    for _ in range(rounds):
+        for name, client in clients.items():
+            started = time.process_time()
+            for _ in range(requests):
+                status, _, _ = await client.request('GET', '/statements/')
+                if status != 200:
+                    raise RuntimeError(f'The request failed with {status}.')
+            ms = (time.process_time() - started) / requests * 1000
+            results[name] = min(results.get(name, ms), ms)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--statements', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=60)
+    args = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(
+        run(args.statements, args.requests, args.rounds))
+
+    overhead = results['with'] - results['without']
+    print(f'without metrics {results["without"] * 1000:.0f} us/request')
+    print(f'with metrics    {results["with"] * 1000:.0f} us/request')
+    print(f'metrics         {overhead * 1000:+.0f} us/request '
+          f'({overhead / results["without"]:+.1%})')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark of reads under a mixed read/write load in each database mode.
+
+For the in memory database and a new WAL file database, seeds doctors and
+appointments in a separate process, then has concurrent clients read
+appointments while others book new ones through `app.main:app` for a fixed
+time. Reports the reads and writes per second and the read latencies of
+each mode. Example::
+
+    python -m benchmarks.modes --readers 32 --writers 4 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.database import SessionLocal
+from app.main import app
+from .client import ASGIClient
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import seed
+from .seed import slot
+
+
+async def _request(client, method: str, path: str, body=None):
+    # Errors raised by the app count as failed requests rather than ending
+    # the run.
+    try:
+        status, _, _ = await client.request(method, path, body)
+    except Exception:
+        return 500
+    return status
+
+
+def _percentile(values, percent):
+    index = max(0, int(round(percent / 100 * len(values))) - 1)
+    return values[index]
+
+
+async def _load(doctors: int, appointments: int, readers: int, writers: int,
+                seconds: float):
+    db = SessionLocal()
+    free_day = seed(db, doctors, appointments)
+    db.close()
+
+    await app.router.startup()
+    client = ASGIClient(app)
+    days = clinic_days(free_day)
+    free_slots = (
+        slot(day, index) for day in days for index in range(SLOTS_PER_DAY))
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    writes = 0
+    errors = 0
+
+    async def reader():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            if random.random() < 0.5:
+                path = f'/appointments/{random.randint(1, appointments)}/'
+            else:
+                path = (
+                    f'/doctors/{random.randint(1, doctors)}/appointments/'
+                    f'?limit=20'
+                )
+            started = time.perf_counter()
+            status = await _request(client, 'GET', path)
+            latencies.append(time.perf_counter() - started)
+            errors += status != 200
+
+    async def writer():
+        nonlocal writes, errors
+        while time.perf_counter() < deadline:
+            # Every doctor of the slot is booked before the next slot.
+            start_dt, end_dt = next(free_slots)
+            for doctor_id in range(1, doctors + 1):
+                if time.perf_counter() >= deadline:
+                    break
+                status = await _request(client, 'POST', '/appointments/', {
+                    'patient_name': f'Mixed{writes}',
+                    'start_dt': start_dt.isoformat() + 'Z',
+                    'end_dt': end_dt.isoformat() + 'Z',
+                    'doctor_id': doctor_id,
+                })
+                writes += status == 200
+                errors += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(reader() for _ in range(readers)),
+        *(writer() for _ in range(writers))
+    )
+    elapsed = time.perf_counter() - started
+    await app.router.shutdown()
+
+    latencies.sort()
+    return {
+        'reads_per_second': len(latencies) / elapsed,
+        'writes_per_second': writes / elapsed,
+        'read_p50_ms': _percentile(latencies, 50) * 1000,
+        'read_p99_ms': _percentile(latencies, 99) * 1000,
+        'errors': errors,
+    }
+
+
+def run(database_url: str, doctors: int, appointments: int, readers: int,
+        writers: int, seconds: float):
+    """
+    Runs the mixed load against a database in a new process.
+
+    The database mode is chosen when `app.database` is imported, so each
+    mode gets a process of its own.
+
+    Args:
+        database_url (str): Value of `DATABASE_URL`, empty for the in
+            memory database.
+        doctors (int): Number of doctors to seed.
+        appointments (int): Number of appointments to seed.
+        readers (int): Number of concurrent reading clients.
+        writers (int): Number of concurrent booking clients, each booking
+            every doctor in one slot after the other.
+        seconds (float): How long to run the load for.
+
+    Returns:
+        dict: The throughputs and read latencies of the run.
+    """
+    env = dict(os.environ, METRICS_ENABLED='0')
+    env.pop('DATABASE_URL', None)
+    if database_url:
+        env['DATABASE_URL'] = database_url
+    output = subprocess.run(
+        [
+            sys.executable, '-m', 'benchmarks.modes', '--role', 'load',
+            '--doctors', str(doctors),
+            '--appointments', str(appointments),
+            '--readers', str(readers),
+            '--writers', str(writers),
+            '--seconds', str(seconds),
+        ],
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE
+    ).stdout
+    return json.loads(output.decode().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--appointments', type=int, default=100000)
+    parser.add_argument('--readers', type=int, default=32)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument(
+        '--dir', help='Where to create the file database, a temporary '
+        'directory by default.')
+    parser.add_argument(
+        '--role',
+        choices=['run', 'load'],
+        default='run',
+        help=argparse.SUPPRESS
+    )
+    args = parser.parse_args()
+
+    if args.role == 'load':
+        result = asyncio.get_event_loop().run_until_complete(_load(
+            args.doctors, args.appointments, args.readers, args.writers,
+            args.seconds))
+        print(json.dumps(result))
+        return
+
+    directory = args.dir or tempfile.mkdtemp(prefix='modes-')
+    modes = (
+        ('memory', ''),
+        ('wal file', f'sqlite:///{os.path.join(directory, "app.db")}'),
+    )
+    print(f'{"mode":<10}{"reads/s":>10}{"writes/s":>10}{"read p50":>10}'
+          f'{"read p99":>10}{"errors":>8}')
+    for name, database_url in modes:
+        result = run(
+            database_url, args.doctors, args.appointments, args.readers,
+            args.writers, args.seconds)
+        print(
+            f'{name:<10}{result["reads_per_second"]:>10.1f}'
+            f'{result["writes_per_second"]:>10.1f}'
+            f'{result["read_p50_ms"]:>10.2f}{result["read_p99_ms"]:>10.2f}'
+            f'{result["errors"]:>8}'
+        )
+
+
+if __name__ == '__main__':
+    main()
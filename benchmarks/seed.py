@@ -0,0 +1,136 @@
+from datetime import datetime
+from datetime import timedelta
+
+from app import models
+from app.utils import APPOINTMENT_END_TIME
+from app.utils import APPOINTMENT_START_TIME
+from app.utils import NO_APPOINTMENT_WEEKDAY_CODE
+from app.utils import PH_TIMEZONE
+from app.utils import to_utc_naive
+
+
+SLOT_MINUTES = 30
+SLOTS_PER_DAY = (
+    (APPOINTMENT_END_TIME - APPOINTMENT_START_TIME) * 60 // SLOT_MINUTES)
+# A Monday, so seeded days line up with the clinic week.
+FIRST_DAY = datetime(2020, 1, 6)
+
+# Patient names are drawn from these, so searches match realistic shares of
+# the appointments.
+FIRST_NAMES = (
+    'Maria', 'Jose', 'Juan', 'Ana', 'John', 'Mary', 'Mark', 'Michael',
+    'Angelo', 'Angela', 'Christian', 'Kristine', 'Joshua', 'Jasmine',
+    'Paolo', 'Patricia', 'Carlo', 'Camille', 'Miguel', 'Nicole', 'Rafael',
+    'Regina', 'Daniel', 'Danica', 'Gabriel', 'Grace', 'Antonio', 'Andrea',
+    'Francisco', 'Frances', 'Luis', 'Lourdes', 'Ramon', 'Rosario', 'Pedro',
+    'Pilar', 'Eduardo', 'Elena', 'Ricardo', 'Rebecca',
+)
+LAST_NAMES = (
+    'Santos', 'Reyes', 'Cruz', 'Bautista', 'Ocampo', 'Garcia', 'Mendoza',
+    'Torres', 'Tomas', 'Andrada', 'Castillo', 'Flores', 'Villanueva',
+    'Ramos', 'Castro', 'Rivera', 'Aquino', 'Navarro', 'Salazar', 'Mercado',
+    'Aguilar', 'Domingo', 'Fernandez', 'Gonzales', 'Lopez', 'Marquez',
+    'Morales', 'Pascual', 'Dela Cruz', 'De Leon', 'Del Rosario',
+    'Soriano', 'Valdez', 'Manalo', 'Dizon', 'Lim', 'Tan', 'Sy', 'Chua',
+    'Go',
+)
+
+
+def patient_name(index: int):
+    """ Returns the name of the index-th seeded patient. """
+    first_name = FIRST_NAMES[index % len(FIRST_NAMES)]
+    last_name = LAST_NAMES[index * 7 // len(FIRST_NAMES) % len(LAST_NAMES)]
+    return f'{first_name} {last_name} {index}'
+
+
+def clinic_days(first_day=FIRST_DAY):
+    """
+    Yields the days the clinic is open, starting from first_day.
+
+    Args:
+        first_day (datetime): Midnight of the first day to consider.
+
+    Yields:
+        datetime: Midnight of each open day.
+    """
+    day = first_day
+    while True:
+        if day.weekday() != NO_APPOINTMENT_WEEKDAY_CODE:
+            yield day
+        day += timedelta(days=1)
+
+
+def slot(day, index):
+    """
+    Returns the naive utc bounds of the index-th slot of a clinic day.
+
+    Args:
+        day (datetime): Midnight of the day, in the clinic's timezone.
+        index (int): Index of the slot within the day.
+
+    Returns:
+        tuple: The (start, end) datetimes.
+    """
+    start_dt = PH_TIMEZONE.localize(
+        day + timedelta(
+            hours=APPOINTMENT_START_TIME, minutes=index * SLOT_MINUTES))
+    end_dt = start_dt + timedelta(minutes=SLOT_MINUTES)
+    return to_utc_naive(start_dt), to_utc_naive(end_dt)
+
+
+def seed(db, doctors: int, appointments: int, batch_size: int = 10000):
+    """
+    Inserts doctors and non overlapping appointments spread evenly over them.
+
+    Appointments fill consecutive clinic slots, doctor by doctor, starting
+    from `FIRST_DAY`.
+
+    Args:
+        doctors (int): Number of doctors to create.
+        appointments (int): Number of appointments to create.
+        batch_size (int, optional): Rows per insert.
+
+    Returns:
+        datetime: Midnight of the first day after the seeded appointments.
+    """
+    for start in range(0, doctors, batch_size):
+        db.bulk_insert_mappings(models.Doctor, [
+            {
+                'id': id_,
+                'first_name': f'First{id_}',
+                'last_name': f'Last{id_}',
+                'email': f'doctor{id_}@example.com',
+            }
+            for id_ in range(start + 1, min(start + batch_size, doctors) + 1)
+        ])
+        db.commit()
+
+    if not doctors:
+        return FIRST_DAY
+
+    per_doctor = -(-appointments // doctors)
+    days = clinic_days()
+    rows = []
+    last_day = FIRST_DAY
+    for index in range(per_doctor):
+        if index % SLOTS_PER_DAY == 0:
+            last_day = next(days)
+        start_dt, end_dt = slot(last_day, index % SLOTS_PER_DAY)
+        for doctor_id in range(1, doctors + 1):
+            if index * doctors + doctor_id > appointments:
+                break
+            rows.append({
+                'patient_name': patient_name(index * doctors + doctor_id),
+                'start_dt': start_dt,
+                'end_dt': end_dt,
+                'doctor_id': doctor_id,
+            })
+            if len(rows) == batch_size:
+                db.bulk_insert_mappings(models.Appointment, rows)
+                db.commit()
+                rows = []
+
+    if rows:
+        db.bulk_insert_mappings(models.Appointment, rows)
+        db.commit()
+    return last_day + timedelta(days=1)
@@ -0,0 +1,184 @@
+"""
+Benchmark of recurring appointments stored as series versus rows.
+
+Books the same weekly patients of every doctor twice, in new in memory
+databases: once as one appointment row per week, with a bulk create per
+patient, and once as one series per patient. Then books random single
+appointments against each. Reports the size of the appointment tables and
+the latency of booking a weekly patient and a single appointment. Example::
+
+    python -m benchmarks.series --doctors 100 --patients 8 --weeks 52
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import timedelta
+
+from fastapi import HTTPException
+from sqlalchemy import text
+
+from app import crud
+from app import models
+from app import schemas
+from app.database import SessionLocal
+from app.database import engine
+from .seed import FIRST_DAY
+from .seed import SLOTS_PER_DAY
+from .seed import seed
+from .seed import slot
+
+
+MODES = ('rows', 'series')
+
+# Tables and indexes of appointments and series, search indexes included.
+TABLE_BYTES = text("""
+    SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN (
+        SELECT name FROM sqlite_master WHERE tbl_name LIKE 'appointment%'
+    )
+""")
+
+
+def _weekly(doctor_id: int, patient: int, week: int):
+    # Each patient of a doctor has their own weekday and slot.
+    start_dt, end_dt = slot(
+        FIRST_DAY + timedelta(weeks=week, days=patient % 6), patient)
+    return dict(
+        patient_name=f'Weekly{doctor_id}x{patient}',
+        start_dt=start_dt.isoformat() + 'Z',
+        end_dt=end_dt.isoformat() + 'Z',
+        doctor_id=doctor_id,
+    )
+
+
+def _book_weekly(db, mode: str, doctor_id: int, patient: int, weeks: int):
+    if mode == 'series':
+        crud.create_series(db, schemas.SeriesCreate(
+            **_weekly(doctor_id, patient, 0), count=weeks))
+    else:
+        crud.bulk_create_appointments(db, [
+            schemas.AppointmentCreate(**_weekly(doctor_id, patient, week))
+            for week in range(weeks)
+        ])
+
+
+def _percentile(values, fraction: float):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(mode: str, doctors: int, patients: int, weeks: int, bookings: int):
+    """
+    Books the weekly patients then random single appointments.
+
+    Args:
+        mode (str): `rows` or `series`.
+        doctors (int): Number of doctors.
+        patients (int): Weekly patients of each doctor.
+        weeks (int): Weeks each patient is booked for.
+        bookings (int): Number of single appointments to book.
+
+    Returns:
+        dict: Rows and bytes of the appointment tables, and the latencies
+            in milliseconds.
+    """
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    seed(db, doctors, 0)
+
+    weekly_latencies = []
+    for doctor_id in range(1, doctors + 1):
+        for patient in range(patients):
+            started = time.perf_counter()
+            _book_weekly(db, mode, doctor_id, patient, weeks)
+            weekly_latencies.append(time.perf_counter() - started)
+
+    random.seed(0)
+    booking_latencies = []
+    conflicts = 0
+    for index in range(bookings):
+        start_dt, end_dt = slot(
+            FIRST_DAY + timedelta(
+                weeks=random.randrange(weeks), days=random.randrange(6)),
+            random.randrange(SLOTS_PER_DAY)
+        )
+        appointment = schemas.AppointmentCreate(
+            patient_name=f'Single{index}',
+            start_dt=start_dt.isoformat() + 'Z',
+            end_dt=end_dt.isoformat() + 'Z',
+            doctor_id=random.randint(1, doctors),
+        )
+        started = time.perf_counter()
+        try:
+            crud.create_appointment(db, appointment)
+        except HTTPException:
+            conflicts += 1
+        booking_latencies.append(time.perf_counter() - started)
+
+    result = {
+        'appointment_rows': db.query(models.Appointment).count(),
+        'series_rows': db.query(models.AppointmentSeries).count(),
+        'table_bytes': db.execute(TABLE_BYTES).scalar(),
+        'weekly_p50_ms': statistics.median(weekly_latencies) * 1000,
+        'booking_p50_ms': statistics.median(booking_latencies) * 1000,
+        'booking_p95_ms': _percentile(booking_latencies, 0.95) * 1000,
+        'conflicts': conflicts,
+    }
+    db.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument(
+        '--patients',
+        type=int,
+        default=8,
+        help=f'Weekly patients per doctor, at most {SLOTS_PER_DAY}.'
+    )
+    parser.add_argument('--weeks', type=int, default=52)
+    parser.add_argument('--bookings', type=int, default=1000)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.patients > SLOTS_PER_DAY:
+        parser.error(f'--patients must be at most {SLOTS_PER_DAY}.')
+
+    if args.mode:
+        result = run(
+            args.mode, args.doctors, args.patients, args.weeks, args.bookings)
+        print(json.dumps(result))
+        return
+
+    # Each mode gets a new process, and so a new in memory database.
+    env = dict(os.environ)
+    env.pop('DATABASE_URL', None)
+    env.pop('DB_SHARDS', None)
+    results = {}
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.series', '--mode', mode] +
+            sys.argv[1:],
+            env=env,
+            check=True,
+            stdout=subprocess.PIPE
+        ).stdout
+        results[mode] = json.loads(output.decode().splitlines()[-1])
+
+    print(f'{"metric":<20}' + ''.join(f'{mode:>14}' for mode in MODES))
+    for key in results[MODES[0]]:
+        print(f'{key:<20}' + ''.join(
+            f'{results[mode][key]:>14.2f}'
+            if isinstance(results[mode][key], float)
+            else f'{results[mode][key]:>14}'
+            for mode in MODES
+        ))
+
+
+if __name__ == '__main__':
+    main()
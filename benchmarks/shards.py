@@ -0,0 +1,221 @@
+"""
+Benchmark of appointment writes over sharded file databases.
+
+For each number of shards, seeds doctors into new file databases, then has
+several processes create appointments for all of them at once for a fixed
+time, and reports the appointments created per second. Each shard is a
+separate SQLite file with its own writer, so writes of different shards do
+not wait for each other. Their commits only gain from this when they wait on
+the disk, as with `--synchronous FULL`, rather than on the CPU. Example::
+
+    python -m benchmarks.shards --shards 1 2 4 8 --processes 4 --seconds 10 \\
+        --synchronous FULL
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from itertools import count
+from itertools import islice
+
+from app import crud
+from app import models
+from app import schemas
+from app import shards
+from app.database import SessionLocals
+from app.database import ShardedSession
+from app.database import engines
+from .seed import SLOTS_PER_DAY
+from .seed import clinic_days
+from .seed import slot
+
+
+# Clinic days booked by the writers, far more than a run fills.
+DAYS = list(islice(clinic_days(), 20000))
+
+
+def _setup(doctors: int):
+    for shard_engine in engines:
+        models.Base.metadata.create_all(bind=shard_engine)
+    db = ShardedSession()
+    try:
+        for index in range(doctors):
+            shards.create_doctor(db, schemas.DoctorCreate(
+                first_name=f'Doctor{index}',
+                last_name='Shard',
+                email=f'doctor{index}@example.com',
+            ))
+    finally:
+        db.close()
+
+
+def _appointment(doctor_ids, index: int):
+    # Every index books a different slot, so no write is rejected.
+    doctor_id = doctor_ids[index % len(doctor_ids)]
+    day, slot_index = divmod(index // len(doctor_ids), SLOTS_PER_DAY)
+    start_dt, end_dt = slot(DAYS[day], slot_index)
+    return schemas.AppointmentCreate(
+        patient_name=f'Shard{index}',
+        start_dt=start_dt.isoformat() + 'Z',
+        end_dt=end_dt.isoformat() + 'Z',
+        doctor_id=doctor_id,
+    )
+
+
+def _work(start_at: float, seconds: float, first: int, step: int,
+          writers: int):
+    doctor_ids = []
+    for SessionLocal in SessionLocals:
+        db = SessionLocal()
+        doctor_ids += [id_ for id_, in db.query(models.Doctor.id)]
+        db.close()
+    doctor_ids.sort()
+
+    created = 0
+    created_lock = threading.Lock()
+
+    def writer(indexes):
+        nonlocal created
+        while time.time() < start_at + seconds:
+            appointment = _appointment(doctor_ids, next(indexes))
+            db = ShardedSession()
+            try:
+                crud.create_appointment(
+                    db.for_doctor(appointment.doctor_id), appointment)
+            finally:
+                db.close()
+            with created_lock:
+                created += 1
+
+    threads = [
+        threading.Thread(
+            target=writer,
+            args=(count(first + thread * step, step * writers),)
+        )
+        for thread in range(writers)
+    ]
+    time.sleep(max(start_at - time.time(), 0))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(json.dumps({'created': created}))
+
+
+def run(shard_count: int, directory: str, doctors: int, processes: int,
+        writers: int, seconds: float, synchronous: str = 'NORMAL'):
+    """
+    Creates appointments from `processes` processes into new databases.
+
+    Args:
+        shard_count (int): Value of `DB_SHARDS`.
+        directory (str): Where to create the database files, which must
+            not exist yet.
+        doctors (int): Number of doctors to book.
+        processes (int): Number of concurrent processes.
+        writers (int): Number of threads of each process.
+        seconds (float): How long to write for.
+        synchronous (str, optional): Value of `DB_SYNCHRONOUS`.
+
+    Returns:
+        float: Appointments created per second.
+    """
+    os.makedirs(directory)
+    env = dict(
+        os.environ,
+        DB_SHARDS=str(shard_count),
+        DATABASE_URL=f'sqlite:///{directory}/app-{{shard}}.db',
+        METRICS_ENABLED='0',
+        DB_SYNCHRONOUS=synchronous,
+    )
+    command = [sys.executable, '-m', 'benchmarks.shards']
+    subprocess.run(
+        command + ['--role', 'setup', '--doctors', str(doctors)],
+        env=env,
+        check=True
+    )
+
+    # Leave the workers time to start before they all write at once.
+    start_at = time.time() + 2 + processes * 0.5
+    workers = [
+        subprocess.Popen(
+            command + [
+                '--role', 'work',
+                '--start-at', str(start_at),
+                '--seconds', str(seconds),
+                '--first', str(process),
+                '--step', str(processes),
+                '--writers', str(writers),
+            ],
+            env=env,
+            stdout=subprocess.PIPE
+        )
+        for process in range(processes)
+    ]
+    created = 0
+    for worker in workers:
+        output, _ = worker.communicate()
+        if worker.returncode:
+            raise RuntimeError(f'Worker failed with {worker.returncode}.')
+        created += json.loads(output.decode().splitlines()[-1])['created']
+    return created / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--doctors', type=int, default=64)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument(
+        '--writers', type=int, default=4, help='Threads per process.')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument(
+        '--synchronous', choices=['OFF', 'NORMAL', 'FULL'], default='NORMAL')
+    parser.add_argument(
+        '--dir', help='Where to create the databases, a temporary directory '
+        'by default.')
+    parser.add_argument(
+        '--role',
+        choices=['run', 'setup', 'work'],
+        default='run',
+        help=argparse.SUPPRESS
+    )
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--first', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--step', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.role == 'setup':
+        _setup(args.doctors)
+        return
+    if args.role == 'work':
+        _work(args.start_at, args.seconds, args.first, args.step,
+              args.writers)
+        return
+
+    directory = args.dir or tempfile.mkdtemp(prefix='shards-')
+    print(f'{"shards":<10}{"creates/s":>12}{"speedup":>10}')
+    baseline = None
+    for shard_count in args.shards:
+        throughput = run(
+            shard_count,
+            os.path.join(directory, str(shard_count)),
+            args.doctors,
+            args.processes,
+            args.writers,
+            args.seconds,
+            args.synchronous
+        )
+        baseline = baseline or throughput
+        print(
+            f'{shard_count:<10}{throughput:>12.1f}'
+            f'{throughput / baseline:>9.2f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
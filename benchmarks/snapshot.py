@@ -0,0 +1,90 @@
+"""
+Benchmark of in memory database snapshots.
+
+Seeds the in memory database, writes a snapshot of it, then times a restore
+into a new in memory database and the startup of the app from the snapshot
+in a new process. Exits with status 1 if the restore takes longer than
+`--max-restore-seconds`. About 3M appointments make a 1 GB snapshot.
+Example::
+
+    python -m benchmarks.snapshot --appointments 3000000 \\
+        --path snapshot.db --max-restore-seconds 2
+"""
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from app import snapshot
+from app.database import IN_MEMORY
+from app.database import SessionLocal
+from app.database import engine
+# Creates the tables of the app, search indexes included.
+from app.main import app  # noqa: F401
+from .seed import seed
+
+
+def _time_app_startup(path: str):
+    code = (
+        'import asyncio\n'
+        'from app.main import app\n'
+        'asyncio.get_event_loop().run_until_complete(app.router.startup())\n'
+    )
+    env = dict(os.environ, SNAPSHOT_PATH=path, SNAPSHOT_INTERVAL='0')
+    env.pop('DATABASE_URL', None)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--doctors', type=int, default=1000)
+    parser.add_argument('--appointments', type=int, default=3000000)
+    parser.add_argument('--path', default='snapshot.db')
+    parser.add_argument(
+        '--reuse',
+        action='store_true',
+        help='Time the restore of an existing snapshot at --path.'
+    )
+    parser.add_argument('--max-restore-seconds', type=float, default=2.0)
+    args = parser.parse_args()
+
+    if not IN_MEMORY:
+        parser.error('snapshots are only taken of the in memory database.')
+
+    if not (args.reuse and os.path.exists(args.path)):
+        db = SessionLocal()
+        started = time.perf_counter()
+        seed(db, args.doctors, args.appointments)
+        db.close()
+        print(f'Seeded in {time.perf_counter() - started:.1f}s.')
+
+        raw_connection = engine.raw_connection()
+        try:
+            seconds = snapshot.dump(raw_connection.connection, args.path)
+        finally:
+            raw_connection.close()
+        print(f'Dumped in {seconds:.3f}s.')
+
+    size = os.path.getsize(args.path)
+    connection = sqlite3.connect(':memory:')
+    restore_seconds = snapshot.restore(connection, args.path)
+    appointments, = connection.execute(
+        'SELECT COUNT(*) FROM appointments').fetchone()
+    connection.close()
+    print(
+        f'Restored {size / 2 ** 20:.0f} MiB, {appointments} appointments, '
+        f'in {restore_seconds:.3f}s.'
+    )
+    print(f'App started in {_time_app_startup(args.path):.3f}s.')
+
+    if restore_seconds > args.max_restore_seconds:
+        print(f'Restore slower than {args.max_restore_seconds}s.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Load test of the API with many clients for each request thread pool size.
+
+For each `THREADPOOL_SIZE` and each of the sync and async modes, see
+`ASYNC_DB`, runs `python -m benchmarks` in a new process against a new WAL
+file database with `--concurrency` clients, and reports the latency
+percentiles, throughput and errors of each scenario. Example::
+
+    python -m benchmarks.threadpool --sizes 5 32 --modes sync async \\
+        --concurrency 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+
+MODES = ('sync', 'async')
+
+
+def run(size: int, mode: str, directory: str, doctors: int,
+        appointments: int, requests: int, concurrency: int, scenarios):
+    """
+    Runs the load test with a thread pool size in a new process.
+
+    The thread pool and the connection pool are sized when `app` is
+    imported, so each size gets a process and a database of its own.
+
+    Args:
+        size (int): Value of `THREADPOOL_SIZE`.
+        mode (str): `sync`, or `async` to set `ASYNC_DB`.
+        directory (str): Where to create the file database.
+        doctors (int): Number of doctors to seed.
+        appointments (int): Number of appointments to seed.
+        requests (int): Number of requests of each scenario.
+        concurrency (int): Number of concurrent clients.
+        scenarios (List[str]): Scenarios to run.
+
+    Returns:
+        dict: The results of each scenario.
+    """
+    database = os.path.join(directory, f'threadpool-{size}-{mode}.db')
+    output = os.path.join(directory, f'threadpool-{size}-{mode}.json')
+    env = dict(
+        os.environ,
+        DATABASE_URL=f'sqlite:///{database}',
+        THREADPOOL_SIZE=str(size),
+        ASYNC_DB='1' if mode == 'async' else '0',
+        METRICS_ENABLED='0',
+    )
+    subprocess.run(
+        [
+            sys.executable, '-m', 'benchmarks',
+            '--doctors', str(doctors),
+            '--appointments', str(appointments),
+            '--requests', str(requests),
+            '--concurrency', str(concurrency),
+            '--output', output,
+            '--scenarios', *scenarios,
+        ],
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL
+    )
+    with open(output) as results:
+        return json.load(results)['scenarios']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 32, 64])
+    parser.add_argument(
+        '--modes', nargs='+', choices=MODES, default=list(MODES))
+    parser.add_argument('--doctors', type=int, default=100)
+    parser.add_argument('--appointments', type=int, default=10000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument(
+        '--scenarios', nargs='+', default=['detail', 'list', 'create'])
+    parser.add_argument(
+        '--dir', help='Where to create the file databases, a temporary '
+        'directory by default.')
+    args = parser.parse_args()
+
+    directory = args.dir or tempfile.mkdtemp(prefix='threadpool-')
+    print(f'{"size":<6}{"mode":<7}{"scenario":<10}{"p50 ms":>10}'
+          f'{"p95 ms":>10}{"p99 ms":>10}{"req/s":>10}{"errors":>8}')
+    for size in args.sizes:
+        for mode in args.modes:
+            results = run(
+                size, mode, directory, args.doctors, args.appointments,
+                args.requests, args.concurrency, args.scenarios)
+            for name, result in results.items():
+                print(
+                    f'{size:<6}{mode:<7}{name:<10}{result["p50_ms"]:>10.2f}'
+                    f'{result["p95_ms"]:>10.2f}{result["p99_ms"]:>10.2f}'
+                    f'{result["throughput_rps"]:>10.1f}'
+                    f'{result["errors"]:>8}'
+                )
+
+
+if __name__ == '__main__':
+    main()
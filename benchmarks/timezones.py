@@ -0,0 +1,100 @@
+"""
+Microbenchmark of the conversion of utc datetimes to the clinic's timezone.
+
+Converts the same random utc datetimes with `astimezone` followed by
+`normalize`, with `utc_to_local` and its memoized transition table, and with
+`utc_to_local_many` in batches. Reports the time per datetime of each way,
+and exits with status 1 if they disagree on any datetime. Example::
+
+    python -m benchmarks.timezones --datetimes 100000
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime
+from datetime import timedelta
+
+import pytz
+
+from app.utils import PH_TIMEZONE
+from app.utils import utc_to_local
+from app.utils import utc_to_local_many
+
+
+def _public(utc_dts, local_tz):
+    return [
+        local_tz.normalize(
+            utc_dt.replace(tzinfo=pytz.utc).astimezone(local_tz))
+        for utc_dt in utc_dts
+    ]
+
+
+def _table(utc_dts, local_tz):
+    return [utc_to_local(utc_dt, local_tz) for utc_dt in utc_dts]
+
+
+def _batches(utc_dts, local_tz, batch_size=100):
+    local_dts = []
+    for index in range(0, len(utc_dts), batch_size):
+        local_dts.extend(utc_to_local_many(
+            utc_dts[index:index + batch_size], local_tz))
+    return local_dts
+
+
+def run(datetimes: int, local_tz, repeat: int = 5):
+    """
+    Converts random datetimes of one year each way.
+
+    Args:
+        datetimes (int): Number of datetimes to convert.
+        local_tz (pytz): Timezone to convert to.
+        repeat (int, optional): Runs of each way, the fastest is kept.
+
+    Returns:
+        tuple: The ns per datetime of each way and whether they all agree.
+    """
+    random.seed(0)
+    # Sorted, as the start times of a page of appointments are.
+    utc_dts = sorted(
+        datetime(2021, 1, 1) + timedelta(
+            seconds=random.randrange(365 * 24 * 3600))
+        for _ in range(datetimes)
+    )
+    results = {}
+    outputs = []
+    for name, convert in (
+        ('public', _public),
+        ('table', _table),
+        ('many', _batches),
+    ):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            local_dts = convert(utc_dts, local_tz)
+            seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+        results[name] = best / datetimes * 1e9
+        outputs.append(local_dts)
+    agree = all(output == outputs[0] for output in outputs[1:])
+    return results, agree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--datetimes', type=int, default=100000)
+    parser.add_argument('--timezone', default=PH_TIMEZONE.zone)
+    args = parser.parse_args()
+
+    results, agree = run(args.datetimes, pytz.timezone(args.timezone))
+
+    print(f'{"way":<8}{"ns/dt":>10}{"speedup":>10}')
+    for name, ns in results.items():
+        print(f'{name:<8}{ns:>10.0f}{results["public"] / ns:>9.1f}x')
+    if not agree:
+        print('The ways disagree.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import doctor_cache
+from app.cache import doctor_list_cache
+from app.database import engines
+from app.main import app
+from app.models import Base
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """ Empties every table of every shard and the caches before a test. """
+    for shard_engine in engines:
+        with shard_engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                conn.execute(table.delete())
+    doctor_cache.clear()
+    doctor_list_cache.clear()
+
+
+@pytest.fixture
+def client():
+    # Runs the startup and shutdown handlers, the latter closing the idle
+    # connections of `app.aio`.
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def doctor(client):
+    """ A doctor, as returned by `POST /doctors/`. """
+    response = client.post('/doctors/', json={
+        'first_name': 'Maria',
+        'last_name': 'Santos',
+        'email': 'maria.santos@example.com',
+    })
+    assert response.status_code == 200, response.text
+    return response.json()
@@ -0,0 +1,86 @@
+"""
+Helpers measuring the SQL the app runs during a test.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app.database import engines
+
+
+# SQLite calls the progress handler every this many virtual machine steps.
+STEPS_PER_CALL = 10
+
+
+class SQLCost:
+    """
+    Statements and SQLite virtual machine steps run within a block.
+
+    The BEGIN statements `app.database` runs in file mode are not counted,
+    so budgets are the same in every mode.
+    """
+
+    def __init__(self):
+        self.statements = 0
+        self.steps = 0
+        self._connections = set()
+
+    def _progress(self):
+        self.steps += STEPS_PER_CALL
+        # Returning a true value would abort the statement.
+        return 0
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        if statement.startswith('BEGIN'):
+            return
+        self.statements += 1
+        dbapi_connection = conn.connection.connection
+        if dbapi_connection not in self._connections:
+            dbapi_connection.set_progress_handler(
+                self._progress, STEPS_PER_CALL)
+            self._connections.add(dbapi_connection)
+
+    def _stop(self):
+        for dbapi_connection in self._connections:
+            dbapi_connection.set_progress_handler(None, 0)
+
+
+@contextmanager
+def measure_sql():
+    """
+    Measures the SQL run on every shard within the block.
+
+    Yields:
+        SQLCost: Filled in as statements run.
+    """
+    cost = SQLCost()
+    for shard_engine in engines:
+        event.listen(
+            shard_engine, 'before_cursor_execute',
+            cost._before_cursor_execute)
+    try:
+        yield cost
+    finally:
+        for shard_engine in engines:
+            event.remove(
+                shard_engine, 'before_cursor_execute',
+                cost._before_cursor_execute)
+        cost._stop()
+
+
+@contextmanager
+def statement_budget(budget):
+    """
+    Fails the test if the block runs more than `budget` SQL statements.
+
+    Args:
+        budget (int): Statements allowed, over every shard.
+
+    Yields:
+        SQLCost: Filled in as statements run.
+    """
+    with measure_sql() as cost:
+        yield cost
+    assert cost.statements <= budget, (
+        f'{cost.statements} statements run, over the budget of {budget}')
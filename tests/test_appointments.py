@@ -0,0 +1,175 @@
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+
+
+def _appointment(doctor_id, start_dt, end_dt, patient_name='Juan Cruz'):
+    return {
+        'patient_name': patient_name,
+        'start_dt': start_dt,
+        'end_dt': end_dt,
+        'doctor_id': doctor_id,
+    }
+
+
+def test_create_stores_aware_datetimes_as_utc(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T09:00:00+08:00',
+        '2021-01-11T09:30:00+08:00'))
+
+    assert response.status_code == 200, response.text
+    assert response.json()['start_dt'] == '2021-01-11T01:00:00'
+    assert response.json()['end_dt'] == '2021-01-11T01:30:00'
+
+
+def test_create_checks_clinic_hours_in_local_time(client, doctor):
+    # 01:00 in Manila, before the clinic opens.
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T01:00:00+08:00',
+        '2021-01-11T02:00:00+08:00'))
+
+    assert response.status_code == 422
+
+
+def test_create_rejects_overlap_given_with_another_offset(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T01:00:00Z',
+        '2021-01-11T02:00:00Z'))
+    assert response.status_code == 200, response.text
+
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T09:30:00+08:00',
+        '2021-01-11T10:30:00+08:00'))
+
+    assert response.status_code == 422
+    assert response.json()['detail'] == 'Overlapping appointment times.'
+
+
+def test_create_rejects_overlap_with_series_given_with_another_offset(
+    client, doctor
+):
+    response = client.post('/series/', json=dict(
+        _appointment(
+            doctor['id'], '2021-01-11T01:00:00Z', '2021-01-11T02:00:00Z'),
+        count=4
+    ))
+    assert response.status_code == 200, response.text
+
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-18T09:00:00+08:00',
+        '2021-01-18T09:30:00+08:00'))
+
+    assert response.status_code == 422
+    assert response.json()['detail'] == 'Overlapping appointment times.'
+
+
+def test_bulk_reports_conflict_given_with_another_offset(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T01:00:00Z',
+        '2021-01-11T02:00:00Z'))
+    assert response.status_code == 200, response.text
+
+    response = client.post('/appointments/bulk/', json=[
+        _appointment(
+            doctor['id'],
+            '2021-01-11T09:30:00+08:00',
+            '2021-01-11T10:00:00+08:00'
+        ),
+        _appointment(
+            doctor['id'],
+            '2021-01-11T11:00:00+08:00',
+            '2021-01-11T11:30:00+08:00'
+        ),
+    ])
+
+    assert response.status_code == 200, response.text
+    results = response.json()
+    assert [result['status'] for result in results] == ['conflict', 'created']
+    assert results[1]['appointment']['start_dt'] == '2021-01-11T03:00:00'
+
+
+def test_patch_stores_aware_datetimes_as_utc(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T01:00:00Z',
+        '2021-01-11T02:00:00Z'))
+    appointment_id = response.json()['id']
+
+    response = client.patch(f'/appointments/{appointment_id}/', json={
+        'start_dt': '2021-01-11T11:00:00+08:00',
+        'end_dt': '2021-01-11T12:00:00+08:00',
+    })
+
+    assert response.status_code == 200, response.text
+    response = client.get(f'/appointments/{appointment_id}/')
+    assert response.json()['start_dt'] == '2021-01-11T03:00:00'
+
+
+def _plus_minutes(naive_dt, minutes):
+    return (
+        datetime.fromisoformat(naive_dt) + timedelta(minutes=minutes)
+    ).isoformat()
+
+
+@pytest.mark.parametrize('minutes', [30, -30])
+def test_shift_moves_back_to_back_appointments(client, doctor, minutes):
+    # Each appointment moves onto the time of the next or previous one.
+    starts = [
+        '2021-01-11T02:00:00', '2021-01-11T02:30:00', '2021-01-11T03:00:00']
+    ids = []
+    for start_dt in starts:
+        response = client.post('/appointments/', json=_appointment(
+            doctor['id'], start_dt + 'Z', _plus_minutes(start_dt, 30) + 'Z'))
+        assert response.status_code == 200, response.text
+        ids.append(response.json()['id'])
+
+    response = client.post('/appointments/shift/', json={
+        'start_date': '2021-01-11',
+        'end_date': '2021-01-11',
+        'minutes': minutes,
+    })
+
+    assert response.status_code == 200, response.text
+    assert response.json() == {'affected': 3}
+    for appointment_id, start_dt in zip(ids, starts):
+        response = client.get(f'/appointments/{appointment_id}/')
+        assert response.json()['start_dt'] == _plus_minutes(start_dt, minutes)
+
+
+def test_shift_leaves_far_future_appointments_alone(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T02:00:00Z', '2021-01-11T02:30:00Z'))
+    assert response.status_code == 200, response.text
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '4001-01-08T02:00:00Z', '4001-01-08T02:30:00Z'))
+    assert response.status_code == 200, response.text
+    far_id = response.json()['id']
+
+    response = client.post('/appointments/shift/', json={
+        'start_date': '2021-01-11',
+        'end_date': '2021-01-11',
+        'minutes': 30,
+    })
+
+    assert response.json() == {'affected': 1}
+    response = client.get(f'/appointments/{far_id}/')
+    assert response.json()['start_dt'] == '4001-01-08T02:00:00'
+
+
+def test_shift_keeps_the_fraction_of_seconds(client, doctor):
+    response = client.post('/appointments/', json=_appointment(
+        doctor['id'], '2021-01-11T02:00:00.250000Z',
+        '2021-01-11T02:29:59.750000Z'))
+    assert response.status_code == 200, response.text
+    appointment_id = response.json()['id']
+
+    response = client.post('/appointments/shift/', json={
+        'start_date': '2021-01-11',
+        'end_date': '2021-01-11',
+        'minutes': -30,
+    })
+
+    assert response.json() == {'affected': 1}
+    response = client.get(f'/appointments/{appointment_id}/')
+    assert response.json()['start_dt'] == '2021-01-11T01:30:00.250000'
+    assert response.json()['end_dt'] == '2021-01-11T01:59:59.750000'
@@ -0,0 +1,78 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.aio import close_idle
+from app.database import IN_MEMORY
+from app.routers import appointments
+from app.routers import doctors
+
+
+pytestmark = pytest.mark.skipif(
+    IN_MEMORY, reason='aiosqlite cannot open the in memory database.')
+
+
+@pytest.fixture
+def async_client():
+    """ A client of the async handlers, whatever `ASYNC_DB` is. """
+    app = FastAPI()
+    app.get('/appointments/{appointment_id}/')(
+        appointments.get_appointment_async)
+    app.get('/doctors/{doctor_id}/')(doctors.get_doctor_async)
+    app.get('/doctors/{doctor_id}/appointments/')(
+        doctors.get_doctor_appointments_async)
+    app.on_event('shutdown')(close_idle)
+    with TestClient(app) as client:
+        yield client
+
+
+def _same_response(client, async_client, path, **kwargs):
+    response = client.get(path, **kwargs)
+    async_response = async_client.get(path, **kwargs)
+    assert async_response.status_code == response.status_code, path
+    assert async_response.content == response.content, path
+    for header in ('ETag', 'X-Next-Cursor', 'Content-Type'):
+        assert async_response.headers.get(header) == (
+            response.headers.get(header)), header
+    return response
+
+
+def test_async_reads_answer_like_the_sync_ones(client, async_client, doctor):
+    for day in (11, 12, 13):
+        response = client.post('/appointments/', json={
+            'patient_name': f'Juan Cruz {day}',
+            'comment': 'Follow up',
+            'start_dt': f'2021-01-{day}T01:00:00Z',
+            'end_dt': f'2021-01-{day}T01:30:00.250000Z',
+            'doctor_id': doctor['id'],
+        })
+        assert response.status_code == 200, response.text
+    appointment = response.json()
+    paths = [
+        f'/appointments/{appointment["id"]}/',
+        f'/doctors/{doctor["id"]}/',
+        f'/doctors/{doctor["id"]}/appointments/',
+        f'/doctors/{doctor["id"]}/appointments/?start_date=2021-01-12',
+    ]
+    for path in paths:
+        etag = _same_response(client, async_client, path).headers['ETag']
+        response = _same_response(
+            client, async_client, path, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+
+    response = _same_response(
+        client, async_client, f'/doctors/{doctor["id"]}/appointments/',
+        params={'limit': 2})
+    cursor = response.headers['X-Next-Cursor']
+    response = _same_response(
+        client, async_client, f'/doctors/{doctor["id"]}/appointments/',
+        params={'limit': 2, 'after': cursor})
+    assert [item['id'] for item in response.json()] == [appointment['id']]
+
+    for path in (
+        f'/appointments/{appointment["id"] + 1}/',
+        f'/doctors/{doctor["id"] + 1}/',
+        f'/doctors/{doctor["id"]}/appointments/?after=invalid',
+    ):
+        response = _same_response(client, async_client, path)
+        assert response.status_code in (404, 422)
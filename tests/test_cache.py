@@ -0,0 +1,206 @@
+import pytest
+
+from app import crud
+from app import models
+from app import versions
+from app.database import ShardedSession
+
+
+def _write_from_another_worker(doctor_id, **changes):
+    # Another worker commits the same way but invalidates its own caches.
+    db = ShardedSession()
+    session = db.for_doctor(doctor_id)
+    session.query(models.Doctor).filter(
+        models.Doctor.id == doctor_id).update(changes)
+    versions.bump(session, [doctor_id])
+    session.commit()
+    db.close()
+
+
+def test_doctor_written_by_another_worker_is_not_served_stale(
+    client, doctor
+):
+    path = f'/doctors/{doctor["id"]}/'
+    first = client.get(path)
+    assert first.json()['first_name'] == 'Maria'
+
+    _write_from_another_worker(doctor['id'], first_name='Ana')
+    response = client.get(path)
+
+    assert response.json()['first_name'] == 'Ana'
+    assert response.headers['ETag'] != first.headers['ETag']
+
+
+def test_doctor_list_written_by_another_worker_is_not_served_stale(
+    client, doctor
+):
+    first = client.get('/doctors/')
+    assert first.json()[0]['first_name'] == 'Maria'
+
+    _write_from_another_worker(doctor['id'], first_name='Ana')
+    response = client.get('/doctors/')
+
+    assert response.json()[0]['first_name'] == 'Ana'
+    assert response.headers['ETag'] != first.headers['ETag']
+
+
+def _put(client, doctor):
+    response = client.put(f'/doctors/{doctor["id"]}/', json=dict(
+        doctor, first_name='Ana'))
+    assert response.status_code == 200, response.text
+
+
+def _patch(client, doctor):
+    response = client.patch(
+        f'/doctors/{doctor["id"]}/', json={'first_name': 'Ana'})
+    assert response.status_code == 200, response.text
+
+
+def _delete(client, doctor):
+    # The test client rejects the body FastAPI sends with a 204.
+    db = ShardedSession()
+    crud.delete_doctor(db.for_doctor(doctor['id']), doctor['id'])
+    db.close()
+
+
+@pytest.mark.parametrize('write', [_put, _patch, _delete])
+def test_every_doctor_write_invalidates_the_caches(client, doctor, write):
+    path = f'/doctors/{doctor["id"]}/'
+    first = client.get(path)
+    assert client.get('/doctors/').json() == [first.json()]
+
+    write(client, doctor)
+    response = client.get(path)
+    doctors = client.get('/doctors/').json()
+
+    if write is _delete:
+        assert response.status_code == 404
+        assert doctors == []
+    else:
+        assert response.json()['first_name'] == 'Ana'
+        assert response.headers['ETag'] != first.headers['ETag']
+        assert doctors == [response.json()]
+
+
+def test_creating_a_doctor_invalidates_the_list_cache(client, doctor):
+    assert len(client.get('/doctors/').json()) == 1
+
+    response = client.post('/doctors/', json={
+        'first_name': 'Jose',
+        'last_name': 'Reyes',
+        'email': 'jose.reyes@example.com',
+    })
+    assert response.status_code == 200, response.text
+
+    assert len(client.get('/doctors/').json()) == 2
+
+
+def _appointment(doctor_id, start_dt, end_dt, patient_name='Juan Cruz'):
+    return {
+        'patient_name': patient_name,
+        'start_dt': start_dt,
+        'end_dt': end_dt,
+        'doctor_id': doctor_id,
+    }
+
+
+def _book(client, body, path='/appointments/'):
+    response = client.post(path, json=body)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _assert_not_modified(client, path):
+    # Returns the ETag of the path after checking it is honoured.
+    etag = client.get(path).headers['ETag']
+    response = client.get(path, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+    return etag
+
+
+# Each write gets the doctor, its appointment on Monday Jan 11 at 9:00 in
+# Manila and its weekly series on Wednesdays from Jan 13.
+WRITES = {
+    'create': lambda client, doctor, appointment, series: _book(
+        client, _appointment(
+            doctor['id'], '2021-01-11T03:00:00Z', '2021-01-11T03:30:00Z')),
+    'put': lambda client, doctor, appointment, series: client.put(
+        f'/appointments/{appointment["id"]}/', json=_appointment(
+            doctor['id'], '2021-01-11T01:00:00Z', '2021-01-11T01:30:00Z',
+            patient_name='Ana Reyes')),
+    'patch': lambda client, doctor, appointment, series: client.patch(
+        f'/appointments/{appointment["id"]}/',
+        json={'patient_name': 'Ana Reyes'}),
+    'delete': lambda client, doctor, appointment, series: client.delete(
+        f'/appointments/{appointment["id"]}/'),
+    'bulk': lambda client, doctor, appointment, series: _book(
+        client, [_appointment(
+            doctor['id'], '2021-01-11T03:00:00Z', '2021-01-11T03:30:00Z')],
+        path='/appointments/bulk/'),
+    'shift': lambda client, doctor, appointment, series: client.post(
+        '/appointments/shift/', json={
+            'start_date': '2021-01-11',
+            'end_date': '2021-01-11',
+            'minutes': 30,
+        }),
+    'range_delete': lambda client, doctor, appointment, series: client.delete(
+        '/appointments/', params={
+            'start_date': '2021-01-11', 'end_date': '2021-01-11'}),
+    'series_create': lambda client, doctor, appointment, series: _book(
+        client, dict(_appointment(
+            doctor['id'], '2021-01-12T01:00:00Z', '2021-01-12T02:00:00Z'),
+            count=2), path='/series/'),
+    'series_exception': lambda client, doctor, appointment, series: (
+        client.delete(f'/series/{series["id"]}/occurrences/2021-01-20/')),
+}
+# Writes after which the appointment is gone.
+DELETES = {'delete', 'range_delete'}
+
+
+@pytest.mark.parametrize('write', list(WRITES))
+def test_every_appointment_write_changes_the_etags(client, doctor, write):
+    appointment = _book(client, _appointment(
+        doctor['id'], '2021-01-11T01:00:00Z', '2021-01-11T01:30:00Z'))
+    series = _book(client, dict(_appointment(
+        doctor['id'], '2021-01-13T01:00:00Z', '2021-01-13T02:00:00Z'),
+        count=3), path='/series/')
+    paths = [
+        '/appointments/',
+        f'/appointments/{appointment["id"]}/',
+        f'/doctors/{doctor["id"]}/appointments/',
+    ]
+    etags = [_assert_not_modified(client, path) for path in paths]
+
+    result = WRITES[write](client, doctor, appointment, series)
+    if hasattr(result, 'status_code'):
+        assert result.status_code in (200, 204), result.text
+
+    for path, etag in zip(paths, etags):
+        response = client.get(path, headers={'If-None-Match': etag})
+        if write in DELETES and path == paths[1]:
+            assert response.status_code == 404
+        else:
+            assert response.status_code == 200, path
+            assert response.headers['ETag'] != etag, path
+
+
+def test_deleting_a_doctor_changes_the_etags_of_its_appointments(
+    client, doctor
+):
+    appointment = _book(client, _appointment(
+        doctor['id'], '2021-01-11T01:00:00Z', '2021-01-11T01:30:00Z'))
+    # Global scope, then the scope of the doctor.
+    paths = ['/appointments/', f'/doctors/{doctor["id"]}/appointments/']
+    etags = [_assert_not_modified(client, path) for path in paths]
+
+    response = client.delete(f'/doctors/{doctor["id"]}/')
+    assert response.status_code == 204
+
+    for path, etag in zip(paths, etags):
+        response = client.get(path, headers={'If-None-Match': etag})
+        assert response.status_code == 200, path
+        assert response.headers['ETag'] != etag, path
+        assert response.json() == []
+    response = client.get(f'/appointments/{appointment["id"]}/')
+    assert response.status_code == 404
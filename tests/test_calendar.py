@@ -0,0 +1,48 @@
+def _appointment(doctor_id, start_dt, end_dt, patient_name='Juan Cruz'):
+    return {
+        'patient_name': patient_name,
+        'start_dt': start_dt,
+        'end_dt': end_dt,
+        'doctor_id': doctor_id,
+    }
+
+
+def test_calendar_merges_the_occurrences_of_series(client, doctor):
+    # Mondays Jan 4, 11 and 18 at 9:00 in Manila.
+    response = client.post('/series/', json=dict(
+        _appointment(
+            doctor['id'], '2021-01-04T01:00:00Z', '2021-01-04T02:00:00Z',
+            patient_name='Ana Reyes'),
+        count=3
+    ))
+    assert response.status_code == 200, response.text
+    series_id = response.json()['id']
+    ids = []
+    for start_dt, end_dt in (
+        ('2021-01-12T01:00:00Z', '2021-01-12T01:30:00Z'),
+        ('2021-01-11T02:00:00Z', '2021-01-11T02:30:00Z'),
+    ):
+        response = client.post('/appointments/', json=_appointment(
+            doctor['id'], start_dt, end_dt))
+        assert response.status_code == 200, response.text
+        ids.append(response.json()['id'])
+
+    response = client.get('/calendar/', params={
+        'week': '2021-01-13', 'doctor_ids': str(doctor['id'])})
+
+    assert response.status_code == 200, response.text
+    assert response.json()['appointments'] == {
+        'id': [None, ids[1], ids[0]],
+        'series_id': [series_id],
+        'index': [1],
+        'doctor': [0, 0, 0],
+        'start': [3600, 7200, 90000],
+        'end': [7200, 9000, 91800],
+        'patient_name': ['Ana Reyes', 'Juan Cruz', 'Juan Cruz'],
+    }
+
+    response = client.get('/calendar/', params={
+        'week': '2021-01-25', 'doctor_ids': str(doctor['id'])})
+
+    assert response.status_code == 200, response.text
+    assert response.json()['appointments']['series_id'] == []
@@ -0,0 +1,219 @@
+import asyncio
+import sqlite3
+import threading
+from argparse import Namespace
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi import HTTPException
+
+from app import crud
+from app import models
+from app import schemas
+from app import shards
+from app import snapshot
+from app.database import IN_MEMORY
+from app.database import ConnectionLock
+from app.database import SessionLocal
+from app.database import ShardedSession
+from app.database import shard_of
+from benchmarks.__main__ import run
+from benchmarks.booking import OVERLAPS
+from benchmarks.seed import FIRST_DAY
+from benchmarks.seed import seed
+from benchmarks.seed import slot
+
+
+def test_lock_is_handed_over_in_turn():
+    lock = ConnectionLock()
+    order = []
+
+    async def waiter(name):
+        await lock.acquire_async()
+        order.append(name)
+        # Released from another thread, as sessions closed off the loop.
+        thread = threading.Thread(target=lock.release)
+        thread.start()
+        await asyncio.sleep(0)
+        thread.join()
+
+    async def main():
+        await lock.acquire_async()
+        waiters = [asyncio.ensure_future(waiter(name)) for name in 'abc']
+        await asyncio.sleep(0)
+        lock.release()
+        await asyncio.gather(*waiters)
+
+    asyncio.new_event_loop().run_until_complete(main())
+
+    assert order == ['a', 'b', 'c']
+    # Free again.
+    lock.acquire()
+    lock.release()
+
+
+def test_cancelled_waiter_passes_the_lock_on():
+    lock = ConnectionLock()
+
+    async def main():
+        await lock.acquire_async()
+        cancelled = asyncio.ensure_future(lock.acquire_async())
+        waiting = asyncio.ensure_future(lock.acquire_async())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        lock.release()
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.new_event_loop().run_until_complete(main())
+
+
+def test_lock_hands_out_its_slots_before_waiting():
+    lock = ConnectionLock(2)
+
+    async def main():
+        await lock.acquire_async()
+        await lock.acquire_async()
+        third = asyncio.ensure_future(lock.acquire_async())
+        await asyncio.sleep(0)
+        assert not third.done()
+        lock.release()
+        await asyncio.wait_for(third, 1)
+
+    asyncio.new_event_loop().run_until_complete(main())
+
+
+def test_concurrent_bookings_in_memory_neither_fail_nor_overlap():
+    db = SessionLocal()
+    seed(db, 4, 0)
+    db.close()
+
+    def book(index):
+        start_dt, end_dt = slot(FIRST_DAY, index % 3)
+        appointment = schemas.AppointmentCreate(
+            patient_name=f'Concurrent{index}',
+            start_dt=start_dt.isoformat() + 'Z',
+            end_dt=end_dt.isoformat() + 'Z',
+            doctor_id=index % 4 + 1,
+        )
+        db = ShardedSession()
+        try:
+            crud.create_appointment(
+                db.for_doctor(appointment.doctor_id), appointment)
+            return 'created'
+        except HTTPException:
+            return 'rejected'
+        finally:
+            db.close()
+
+    def read(index):
+        db = ShardedSession()
+        try:
+            crud.get_appointments(db.for_doctor(index % 4 + 1), limit=10)
+            return 'read'
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        outcomes = list(executor.map(
+            lambda index: (book if index % 2 else read)(index // 2),
+            range(1000)
+        ))
+
+    # Each of the 4 doctors gets each of the 3 slots once.
+    assert outcomes.count('created') == 12
+    assert outcomes.count('rejected') == 488
+    assert outcomes.count('read') == 500
+    db = SessionLocal()
+    assert db.execute(OVERLAPS).scalar() == 0
+    db.close()
+
+
+def test_load_test_runs_in_memory_without_errors():
+    args = Namespace(
+        doctors=10,
+        appointments=200,
+        requests=100,
+        concurrency=16,
+        page_size=20,
+        scenarios=[
+            'detail', 'list', 'search', 'create', 'update', 'patch', 'delete'
+        ],
+    )
+
+    results = asyncio.new_event_loop().run_until_complete(run(args))
+
+    for name, result in results['scenarios'].items():
+        assert result['errors'] == 0, name
+
+
+def test_concurrent_writes_of_an_email_on_any_shard_keep_it_unique():
+    db = ShardedSession()
+    doctor_ids = [
+        shards.create_doctor(db, schemas.DoctorCreate(
+            first_name='Doctor',
+            last_name=str(index),
+            email=f'doctor{index}@example.com',
+        )).id
+        for index in range(16)
+    ]
+    db.close()
+
+    def write(index):
+        db = ShardedSession()
+        try:
+            if index % 2:
+                shards.patch_doctor(
+                    db, schemas.DoctorPatch(email='same@example.com'),
+                    doctor_ids[index])
+            else:
+                shards.create_doctor(db, schemas.DoctorCreate(
+                    first_name='New',
+                    last_name=str(index),
+                    email='same@example.com',
+                ))
+            return 'written'
+        except HTTPException:
+            return 'rejected'
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        outcomes = list(executor.map(write, range(16)))
+
+    assert outcomes.count('written') == 1
+    db = ShardedSession()
+    assert sum(
+        session.query(models.Doctor).filter(
+            models.Doctor.email == 'same@example.com').count()
+        for session in db.all()
+    ) == 1
+    db.close()
+
+
+@pytest.mark.skipif(not IN_MEMORY, reason='Snapshots are of memory only.')
+def test_snapshot_waits_for_the_requests_in_progress(
+    doctor, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(
+        snapshot, 'SNAPSHOT_PATH', str(tmp_path / 'snapshot-{shard}.db'))
+    # A request that has only read so far, with no transaction open yet.
+    db = ShardedSession()
+    session = db.for_doctor(doctor['id'])
+    session.query(models.Doctor).get(doctor['id'])
+
+    dumping = threading.Thread(target=snapshot.dump_app_database)
+    dumping.start()
+    dumping.join(0.2)
+    assert dumping.is_alive()
+
+    session.query(models.Doctor).filter(
+        models.Doctor.id == doctor['id']).update({'first_name': 'Ana'})
+    session.commit()
+    db.close()
+    dumping.join()
+    connection = sqlite3.connect(
+        str(tmp_path / f'snapshot-{shard_of(doctor["id"])}.db'))
+    assert connection.execute(
+        'SELECT first_name FROM doctors WHERE id = ?', (doctor['id'],)
+    ).fetchall() == [('Ana',)]
+    connection.close()
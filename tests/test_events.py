@@ -0,0 +1,72 @@
+import asyncio
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import events
+
+
+def _change(seq: int, doctor_id: int):
+    return events.appointment_change(events.CREATED, {
+        'id': seq,
+        'patient_name': f'Patient{seq}',
+        'comment': None,
+        'start_dt': None,
+        'end_dt': None,
+        'doctor_id': doctor_id,
+    })
+
+
+def _received_seqs(subscriber):
+    frames = b''
+    while not subscriber.queue.empty():
+        frames += subscriber.queue.get_nowait()
+    return [int(seq) for seq in re.findall(rb'^id: \w+-(\d+)$', frames, re.M)]
+
+
+def test_concurrent_writers_reach_every_subscriber_in_order():
+    feed = events.ChangeFeed(events.EVENTS_HISTORY_SIZE)
+    writers = 8
+    writes = 30
+
+    def publish(writer):
+        # Even writers book doctor 1, odd ones doctor 2.
+        for index in range(writes):
+            feed.publish([_change(writer * writes + index, writer % 2 + 1)])
+
+    async def main():
+        subscribers = [
+            feed.subscribe(None if index % 2 else 1)[0]
+            for index in range(5000)
+        ]
+        loop = asyncio.get_event_loop()
+        call_soon_threadsafe = loop.call_soon_threadsafe
+
+        def call_soon_threadsafe_later(*args):
+            # A publisher thread may be switched out on its way to the loop.
+            time.sleep(random.random() / 1000)
+            return call_soon_threadsafe(*args)
+
+        loop.call_soon_threadsafe = call_soon_threadsafe_later
+        with ThreadPoolExecutor(max_workers=writers) as executor:
+            await asyncio.gather(*(
+                loop.run_in_executor(executor, publish, writer)
+                for writer in range(writers)
+            ))
+        # Let the loop run the dispatches scheduled by the writers.
+        await asyncio.sleep(0.1)
+        return subscribers
+
+    random.seed(0)
+    subscribers = asyncio.new_event_loop().run_until_complete(main())
+
+    total = writers * writes
+    for subscriber in subscribers:
+        seqs = _received_seqs(subscriber)
+        if subscriber.doctor_id is None:
+            assert seqs == list(range(1, total + 1))
+        else:
+            assert len(seqs) == total // 2
+            assert seqs == sorted(seqs)
+    assert feed.stats()['overflows'] == 0
@@ -0,0 +1,51 @@
+import pytest
+
+from app.database import SessionLocal
+from app.utils import NEXT_CURSOR_HEADER
+from benchmarks.seed import seed
+
+from .sql import measure_sql
+
+
+PAGE_SIZE = 50
+PAGES = 40
+
+
+def _page_cost(client, path, params):
+    with measure_sql() as cost:
+        response = client.get(path, params=params)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == PAGE_SIZE
+    return cost, response.headers.get(NEXT_CURSOR_HEADER)
+
+
+@pytest.mark.parametrize('path, doctors, appointments', [
+    # 20 appointments start at each time.
+    ('/appointments/', 20, PAGE_SIZE * PAGES),
+    ('/doctors/', PAGE_SIZE * PAGES, 0),
+])
+def test_last_page_costs_the_same_as_the_first(
+    client, path, doctors, appointments
+):
+    db = SessionLocal()
+    seed(db, doctors, appointments)
+    db.close()
+
+    first, cursor = _page_cost(client, path, {'limit': PAGE_SIZE})
+    second, cursor = _page_cost(
+        client, path, {'limit': PAGE_SIZE, 'after': cursor})
+    for _ in range(PAGES - 3):
+        _, cursor = _page_cost(
+            client, path, {'limit': PAGE_SIZE, 'after': cursor})
+    last, _ = _page_cost(client, path, {'limit': PAGE_SIZE, 'after': cursor})
+    skipped, _ = _page_cost(
+        client, path, {'limit': PAGE_SIZE, 'skip': (PAGES - 1) * PAGE_SIZE})
+
+    assert last.statements == first.statements
+    # Pages read through a cursor all cost the same, a little more than
+    # the first for comparing each row to the cursor.
+    assert abs(last.steps - second.steps) <= second.steps * 0.1
+    assert last.steps <= first.steps * 1.5
+    # The steps do count the rows read: skipping the same rows with an
+    # offset costs several times more.
+    assert skipped.steps > first.steps * 3
@@ -0,0 +1,89 @@
+import pytest
+
+from app import crud
+from app.database import SessionLocal
+from app.database import engines
+from benchmarks.seed import seed
+
+from .sql import measure_sql
+from .sql import statement_budget
+
+
+DOCTORS = 100
+
+# A request checks the version behind its ETag and runs one query, on every
+# shard it reads.
+BUDGET = 2 * len(engines)
+
+
+@pytest.fixture
+def appointments(client):
+    """ One appointment of each of `DOCTORS` doctors. """
+    db = SessionLocal()
+    seed(db, DOCTORS, DOCTORS)
+    db.close()
+    response = client.get('/appointments/', params={'limit': DOCTORS})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _paths(appointments):
+    ids = ','.join(str(appointment['id']) for appointment in appointments)
+    first = appointments[0]
+    return [
+        ('/appointments/', {'limit': DOCTORS}, DOCTORS),
+        ('/appointments/search/', {'q': 'a', 'limit': DOCTORS}, None),
+        ('/appointments/batch/', {'ids': ids}, None),
+        (f'/appointments/{first["id"]}/', {}, None),
+        (f'/doctors/{first["doctor"]["id"]}/appointments/', {}, 1),
+    ]
+
+
+def test_appointment_endpoints_stay_within_budget(client, appointments):
+    for path, params, rows in _paths(appointments):
+        with statement_budget(BUDGET):
+            response = client.get(path, params=params)
+        assert response.status_code == 200, response.text
+        if rows is not None:
+            assert len(response.json()) == rows
+
+
+def _patches(appointment):
+    # Each with its statement budget. The first write of a doctor also
+    # creates its version counter.
+    return [
+        ({'comment': 'Follow up'}, 5),
+        # Times that do not change take the same path as other fields.
+        ({
+            'comment': 'Follow up',
+            'start_dt': appointment['start_dt'],
+            'end_dt': appointment['end_dt'],
+        }, 5),
+        ({
+            'start_dt': '2030-01-07T02:00:00Z',
+            'end_dt': '2030-01-07T02:30:00Z',
+        }, 13),
+    ]
+
+
+@pytest.mark.parametrize('index', range(3))
+def test_patch_takes_the_write_lock_before_reading(
+    client, appointments, monkeypatch, index
+):
+    appointment = appointments[index]
+    changes, budget = _patches(appointment)[index]
+    begin_write = crud._begin_write
+    locked_after = []
+
+    def spy(db):
+        locked_after.append(cost.statements)
+        begin_write(db)
+
+    monkeypatch.setattr(crud, '_begin_write', spy)
+    with measure_sql() as cost:
+        response = client.patch(
+            f'/appointments/{appointment["id"]}/', json=changes)
+
+    assert response.status_code == 200, response.text
+    assert locked_after[0] == 0
+    assert cost.statements <= budget, cost.statements
@@ -0,0 +1,46 @@
+import pytest
+
+from app import search
+
+
+def _book(client, doctor, patient_name, hour):
+    response = client.post('/appointments/', json={
+        'patient_name': patient_name,
+        'start_dt': f'2021-01-11T{hour:02d}:00:00Z',
+        'end_dt': f'2021-01-11T{hour:02d}:30:00Z',
+        'doctor_id': doctor['id'],
+    })
+    assert response.status_code == 200, response.text
+
+
+@pytest.mark.parametrize('window, expected', [
+    # The newest match is ranked on its own, before the older exact one.
+    (1, ['Mariano Cruz', 'Maria Santos']),
+    # Every match is ranked at once.
+    (0, ['Maria Santos', 'Mariano Cruz']),
+])
+def test_search_ranks_within_windows_of_newest_matches(
+    client, doctor, monkeypatch, window, expected
+):
+    _book(client, doctor, 'Maria Santos', 1)
+    _book(client, doctor, 'Mariano Cruz', 2)
+    monkeypatch.setattr(search, 'SEARCH_WINDOW', window)
+
+    response = client.get('/appointments/search/', params={'q': 'maria'})
+
+    assert response.status_code == 200, response.text
+    assert [
+        appointment['patient_name'] for appointment in response.json()
+    ] == expected
+
+
+def test_search_answers_like_the_detail_endpoint(client, doctor):
+    _book(client, doctor, 'José Cruz', 1)
+
+    response = client.get('/appointments/search/', params={'q': 'JOSÉ cr'})
+
+    assert response.status_code == 200, response.text
+    [appointment] = response.json()
+    detail = client.get(f'/appointments/{appointment["id"]}/')
+    assert appointment == detail.json()
+    assert search.words('JOSÉ cr') == search.words('jose CR') == ['jose', 'cr']
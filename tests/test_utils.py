@@ -0,0 +1,47 @@
+import random
+from datetime import datetime
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from app.utils import utc_to_local
+from app.utils import utc_to_local_many
+
+
+def _public_utc_to_local(utc_dt, local_tz):
+    return local_tz.normalize(
+        utc_dt.replace(tzinfo=pytz.utc).astimezone(local_tz))
+
+
+@pytest.mark.parametrize('name', [
+    'Asia/Manila', 'America/New_York', 'Europe/London',
+    'Australia/Lord_Howe',
+])
+def test_utc_to_local_matches_the_public_api(name):
+    local_tz = pytz.timezone(name)
+    random.seed(0)
+    utc_dts = [
+        datetime(1900, 1, 1) + timedelta(
+            seconds=random.randrange(200 * 365 * 24 * 3600))
+        for _ in range(2000)
+    ]
+
+    for utc_dt in utc_dts:
+        local_dt = utc_to_local(utc_dt, local_tz)
+        expected = _public_utc_to_local(utc_dt, local_tz)
+        assert local_dt == expected
+        assert local_dt.tzinfo is expected.tzinfo
+    assert utc_to_local_many(utc_dts, local_tz) == [
+        _public_utc_to_local(utc_dt, local_tz) for utc_dt in utc_dts]
+
+
+def test_timezone_without_a_transition_table_uses_the_public_api():
+    # Fixed offsets have none of the private attributes read by the table.
+    local_tz = pytz.FixedOffset(480)
+    utc_dt = datetime(2021, 1, 11, 1, 0)
+
+    assert utc_to_local(utc_dt, local_tz) == _public_utc_to_local(
+        utc_dt, local_tz)
+    assert utc_to_local_many([utc_dt], local_tz) == [
+        _public_utc_to_local(utc_dt, local_tz)]